@@ -0,0 +1,72 @@
+"""
+Object scheduling for download.py batch mode: largest-object-first ordering from
+the durations of earlier runs, bounded object concurrency, and each object's
+share of the global in-flight HTTP request budget.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = 'download_history.json'
+
+
+def load_history(path: str = HISTORY_FILE) -> Dict[str, float]:
+    """
+    Returns the duration in seconds of the last successful batch-mode download per object.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as ex:
+        logger.warning(f"Ignoring unreadable history {path}: {ex}")
+        return {}
+
+
+def save_history(durations: Dict[str, float], path: str = HISTORY_FILE) -> None:
+    history = load_history(path)
+    history.update(durations)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def schedule_objects(object_names: List[str], history: Dict[str, float]) -> List[str]:
+    """
+    Largest-object-first order, using last run's duration as the size: starting the
+    long downloads first keeps one of them from starting last and stretching the run.
+    Objects without history go first, as they may be the largest.
+    """
+    return sorted(object_names, key=lambda name: -history.get(name, float('inf')))
+
+
+def object_share(http_budget: int, parallelism: int) -> int:
+    """
+    Requests each object may keep in flight when up to parallelism objects run at
+    once, so that together they stay within http_budget.
+    """
+    return max(1, http_budget // max(1, parallelism))
+
+
+async def run_scheduled(
+    object_names: List[str],
+    parallelism: int,
+    run: Callable[[str], Awaitable[Any]]
+) -> List[Any]:
+    """
+    Runs run(object) for every object, at most parallelism at once and started in
+    the given order. Returns the results in that order.
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_limited(name: str) -> Any:
+        async with semaphore:
+            return await run(name)
+
+    # Semaphore waiters are woken in FIFO order, so objects start in the given order
+    return await asyncio.gather(*[run_limited(name) for name in object_names])
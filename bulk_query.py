@@ -0,0 +1,137 @@
+"""
+Minimal Bulk API 2.0 query client that streams CSV result sets as records.
+"""
+import csv
+import io
+import logging
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class BulkQueryError(Exception):
+    pass
+
+
+def nest_fields(row: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Turns flattened CSV columns like 'LinkedEntity.Name' back into the nested
+    shape REST queries return ({'LinkedEntity': {'Name': ...}}).
+    """
+    record: Dict[str, Any] = {}
+    for key, value in row.items():
+        parts = key.split('.')
+        target = record
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return record
+
+
+class Bulk2QueryClient:
+    """
+    Runs SOQL through Bulk API 2.0 query jobs. query_all_iter mirrors the
+    simple_salesforce method of the same name, so it can replace it for
+    metadata queries; result pages are parsed from the HTTP stream.
+
+    renew_session(stale_session_id), if given, is called when a request gets a 401
+    and returns a new session id to retry the request with.
+    """
+
+    def __init__(self, base_url, session_id, api_version='59.0', http_session=None,
+                 poll_interval=2.0, max_records=50000, timeout=3600,
+                 renew_session: Optional[Callable[[str], str]] = None):
+        self.base_url = base_url.rstrip('/')
+        self.session_id = session_id
+        self.renew_session = renew_session
+        self.api_version = api_version
+        self.http = http_session or requests.Session()
+        self.poll_interval = poll_interval
+        self.max_records = max_records
+        self.timeout = timeout
+
+    @classmethod
+    def from_salesforce(cls, sf, **kwargs) -> 'Bulk2QueryClient':
+        # Clients that can log in again (session_cache.CachedSalesforce) share their new session
+        renew = getattr(type(sf), 'renew_session', None)
+        if renew is not None:
+            kwargs.setdefault('renew_session', lambda stale_session_id: renew(sf, stale_session_id))
+        return cls(f"https://{sf.sf_instance}", sf.session_id, api_version=sf.sf_version,
+                   http_session=sf.session, **kwargs)
+
+    @property
+    def jobs_url(self) -> str:
+        return f"{self.base_url}/services/data/v{self.api_version}/jobs/query"
+
+    def _headers(self, accept='application/json') -> Dict[str, str]:
+        return {
+            'Authorization': 'Bearer ' + self.session_id,
+            'Content-Type': 'application/json',
+            'Accept': accept,
+        }
+
+    def _request(self, method: str, url: str, accept='application/json', **kwargs) -> requests.Response:
+        response = self.http.request(method, url, headers=self._headers(accept), **kwargs)
+        if response.status_code == 401 and self.renew_session:
+            logger.info("Session expired, retrying with a new session")
+            response.close()
+            self.session_id = self.renew_session(self.session_id)
+            response = self.http.request(method, url, headers=self._headers(accept), **kwargs)
+        return response
+
+    def create_job(self, soql: str) -> str:
+        response = self._request('POST', self.jobs_url, json={'operation': 'query', 'query': soql})
+        if not response.ok:
+            raise BulkQueryError(f"Could not create query job ({response.status_code}): {response.text}")
+        job_id = response.json()['id']
+        logger.info(f"Created Bulk API 2.0 query job {job_id}")
+        return job_id
+
+    def wait_for_job(self, job_id: str) -> Dict[str, Any]:
+        deadline = time.time() + self.timeout
+        while True:
+            response = self._request('GET', f"{self.jobs_url}/{job_id}")
+            if not response.ok:
+                raise BulkQueryError(f"Could not read query job {job_id} ({response.status_code}): {response.text}")
+            job = response.json()
+            state = job.get('state')
+            if state == 'JobComplete':
+                logger.info(f"Query job {job_id} complete ({job.get('numberRecordsProcessed', '?')} records)")
+                return job
+            if state in ('Failed', 'Aborted'):
+                raise BulkQueryError(f"Query job {job_id} {state}: {job.get('errorMessage', '')}")
+            if time.time() > deadline:
+                raise BulkQueryError(f"Query job {job_id} still {state} after {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    def iter_results(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the job's records page by page, following Sforce-Locator, without
+        reading a whole page into memory.
+        """
+        locator: Optional[str] = None
+        while True:
+            params: Dict[str, Any] = {'maxRecords': self.max_records}
+            if locator:
+                params['locator'] = locator
+            with self._request('GET', f"{self.jobs_url}/{job_id}/results", accept='text/csv',
+                               params=params, stream=True) as response:
+                if not response.ok:
+                    raise BulkQueryError(
+                        f"Could not read results of query job {job_id} ({response.status_code}): {response.text}")
+                # TextIOWrapper needs the raw stream to stay open until it has read EOF
+                response.raw.decode_content = True
+                response.raw.auto_close = False
+                for row in csv.DictReader(io.TextIOWrapper(response.raw, encoding='utf-8', newline='')):
+                    yield nest_fields(row)
+                locator = response.headers.get('Sforce-Locator')
+            if not locator or locator == 'null':
+                return
+
+    def query_all_iter(self, soql: str) -> Iterator[Dict[str, Any]]:
+        job_id = self.create_job(soql)
+        self.wait_for_job(job_id)
+        yield from self.iter_results(job_id)
@@ -1,20 +1,28 @@
+import argparse
 import csv
 import asyncio
+import functools
 import os
 import configparser
 import shutil
 import sys
 import time
-from collections import defaultdict
 from rich.console import Console
 from rich.table import Table
+from rich.progress import Progress, BarColumn, TimeElapsedColumn, TextColumn
 import json
 import logging
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+
+from deploy_schedule import prune_unknown_dependencies, run_mapping
+from progress_channel import WorkerPool, set_progress_handler, stream_process
+from reporting import merge_summaries, reporter
 
 csv_file: str = 'object_mapping.csv'
 deploy_script: str = 'deploy_functions.py'
 summary_json: str = 'deploy_summary.json'
+summary_dir: str = 'deploy_summaries'
+config_path: str = 'config.ini'
 console: Console = Console()
 
 # --- Logging setup ---
@@ -27,10 +35,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def run_query(source_object: str, target_object: str) -> None:
+async def run_query(source_object: str, target_object: str, summary_path: str = '',
+                    progress: Optional[Progress] = None) -> bool:
     """
     Executes the deploy_functions.py script as a subprocess for a given source and target object.
-    Logs the process start, success, and errors with duration.
+    Logs the process start, success, and errors with duration. Returns True on success.
+    Child output is streamed line by line (the child logs every row to deploy.log
+    itself, so only the last lines are kept here); with progress, the child's
+    progress lines drive a per-object bar.
     """
     cmd: List[str] = [
         sys.executable,
@@ -38,52 +50,129 @@ async def run_query(source_object: str, target_object: str) -> None:
         '-so', source_object,
         '-to', target_object
     ]
+    if summary_path:
+        cmd.extend(['--summary', summary_path])
     start: float = time.time()
     logger.info(f"Starting deployment: {source_object} -> {target_object}")
     console.print(f"Starting deployment: {source_object} -> {target_object}")
+    object_task = None
+
+    def on_progress(update: Dict[str, Any]) -> None:
+        nonlocal object_task
+        if progress is None:
+            return
+        if object_task is None:
+            object_task = progress.add_task(f"[cyan]{source_object}", total=update['total'])
+        progress.update(object_task, completed=update['done'], total=update['total'])
+
+    def on_stderr(line: str) -> None:
+        console.print(f"{source_object}: {line}", style="red", markup=False, highlight=False)
+
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        # Echo the captured output to the console
-        if stdout:
-            print(stdout.decode())
-        if stderr:
-            print(stderr.decode())
+        returncode, stdout_tail, stderr_tail = await stream_process(
+            cmd, on_stdout=None if progress else print, on_stderr=on_stderr, on_progress=on_progress)
+        if object_task is not None:
+            progress.remove_task(object_task)
         end: float = time.time()
         duration = end - start
 
-        if process.returncode == 0:
+        if returncode == 0:
             console.print(f"[green] ✅ {source_object} done in {duration:.1f}s[/green]")
             logger.info(f"Deployment succeeded for {source_object} in {duration:.1f}s")
         else:
             console.print(f"[red]❌ {source_object} failed in {duration:.1f}s[/red]")
-            logger.error(f"Deployment failed for {source_object} in {duration:.1f}s, return code {process.returncode}")
-            if stderr:
-                error_msg = stderr.decode().strip()
-                console.print(f"[red]{error_msg}[/red]")
+            logger.error(f"Deployment failed for {source_object} in {duration:.1f}s, return code {returncode}")
+            if stderr_tail:
+                error_msg = "\n".join(stderr_tail).strip()
                 logger.error(f"Error details for {source_object}: {error_msg}")
-            if stdout:
-                info_msg = stdout.decode().strip()
+            if stdout_tail:
+                info_msg = "\n".join(stdout_tail).strip()
                 logger.error(f"Stdout for {source_object}: {info_msg}")
+        return returncode == 0
     except Exception as ex:
         logger.error(f"Exception running deploy for {source_object}: {ex}")
         console.print(f"[red]Exception running deploy for {source_object}: {ex}[/red]")
+        return False
+
+
+async def run_in_process(source_object: str, target_object: str, summary_path: str = '',
+                         progress: Optional[Progress] = None, sf: Any = None,
+                         executor: Optional[WorkerPool] = None) -> bool:
+    """
+    Like run_query, but calls deploy_functions.deploy_object directly: in a thread
+    on the shared connection sf (counting into the shared reporter), or in
+    executor's worker processes (counting into summary_path). Returns True on success.
+    """
+    import deploy_functions
+    argv = ['-so', source_object, '-to', target_object]
+    start: float = time.time()
+    logger.info(f"Starting deployment: {source_object} -> {target_object}")
+    console.print(f"Starting deployment: {source_object} -> {target_object}")
+    object_task = None
+
+    def on_progress(done: int, total: int) -> None:
+        nonlocal object_task
+        if progress is None:
+            return
+        if object_task is None:
+            object_task = progress.add_task(f"[cyan]{source_object}", total=total)
+        progress.update(object_task, completed=done, total=total)
+
+    def run_in_thread() -> List[Dict[str, Any]]:
+        set_progress_handler(on_progress)
+        try:
+            return deploy_functions.deploy_object(argv, sf)
+        finally:
+            set_progress_handler(None)
+
+    try:
+        if executor:
+            if summary_path:
+                argv.extend(['--summary', summary_path])
+            await executor.run(on_progress, deploy_functions.deploy_object, argv)
+        else:
+            await asyncio.to_thread(run_in_thread)
+    except Exception as ex:
+        logger.error(f"Exception running deploy for {source_object}: {ex}", exc_info=True)
+        console.print(f"[red]❌ {source_object} failed in {time.time() - start:.1f}s: {ex}[/red]")
+        return False
+    finally:
+        if object_task is not None:
+            progress.remove_task(object_task)
+    duration = time.time() - start
+    console.print(f"[green] ✅ {source_object} done in {duration:.1f}s[/green]")
+    logger.info(f"Deployment succeeded for {source_object} in {duration:.1f}s")
+    return True
+
 
 async def main() -> None:
     """
     Orchestrates deployment for each source-target object pair defined in the object_mapping CSV.
     Cleans up old summaries, executes each deploy as a subprocess, and prints a rich summary table.
     """
-    mapping: List[Tuple[str, str]] = []
+    parser = argparse.ArgumentParser(description='Deploy downloaded files for every object in object_mapping.csv')
+    parser.add_argument('-p', '--parallel', metavar='N', type=int, default=None,
+                        help='Objects deployed at once (default: deploy_parallel from config.ini, or 1)')
+    parser.add_argument('--runner', choices=['subprocess', 'inprocess', 'process'], default=None,
+                        help="'subprocess' per object (default), 'inprocess' (threads sharing one login) or "
+                             "'process' (worker pool, one login per worker); default: runner in config.ini")
+    args = parser.parse_args()
+    config = configparser.ConfigParser(allow_no_value=True)
+    config.read(config_path)
+    parallel = max(1, args.parallel or config.getint('salesforce', 'deploy_parallel', fallback=1))
+    runner = args.runner or config.get('salesforce', 'runner', fallback='subprocess') or 'subprocess'
+    if runner not in ('subprocess', 'inprocess', 'process'):
+        console.print(f"[red]Invalid runner {runner}[/red]")
+        return
+
+    mapping: List[Tuple[str, str, List[str]]] = []
 
-    # Clean old summary before starting new run
+    # Clean old summaries before starting new run
     if os.path.exists(summary_json):
         os.remove(summary_json)
         logger.info("Removed old deploy summary JSON.")
+    if os.path.isdir(summary_dir):
+        shutil.rmtree(summary_dir)
 
     # Read mapping CSV
     try:
@@ -92,8 +181,10 @@ async def main() -> None:
             for row in reader:
                 source_object = row.get('Source Org Object', '').strip()
                 target_object = row.get('Target Org Object', '').strip()
+                # Optional column: source objects (separated by ';') to deploy first
+                depends_on = [dep.strip() for dep in (row.get('Depends On') or '').split(';') if dep.strip()]
                 if source_object and target_object:
-                    mapping.append((source_object, target_object))
+                    mapping.append((source_object, target_object, depends_on))
                 else:
                     msg = f"⚠️ Skipping row with missing object names: {row}"
                     print(msg)
@@ -103,8 +194,51 @@ async def main() -> None:
         console.print(f"[red]Error reading object mapping CSV {csv_file}: {ex}[/red]")
         return
 
-    for source_object, target_object in mapping:
-        await run_query(source_object, target_object)
+    prune_unknown_dependencies(mapping)
+
+    logger.info(f"Deploying {len(mapping)} objects, {parallel} at a time")
+    progress = Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("{task.completed}/{task.total} rows"),
+        TimeElapsedColumn(),
+        console=console,
+        transient=True
+    )
+    deploy = run_query
+    executor = None
+    if runner == 'inprocess':
+        import deploy_functions
+        try:
+            # One pooled connection per worker thread of every concurrent deploy
+            workers = deploy_functions.deploy_workers(config)
+            sf = deploy_functions.open_connection(config, pool_size=parallel * workers)
+        except Exception as ex:
+            logger.error(f"Error connecting to Salesforce: {ex}")
+            console.print(f"[red]Error connecting to Salesforce: {ex}[/red]")
+            return
+        # Threads share one reporter, which writes summary_json itself
+        reporter.set_path(summary_json)
+        deploy = functools.partial(run_in_process, sf=sf)
+    elif runner == 'process':
+        import deploy_functions
+        executor = WorkerPool(max_workers=parallel, initializer=deploy_functions.init_worker)
+        deploy = functools.partial(run_in_process, executor=executor)
+    try:
+        with progress:
+            summary_paths = await run_mapping(mapping, parallel, deploy, summary_dir, progress)
+    except ValueError as ex:
+        logger.error(str(ex))
+        console.print(f"[red]{ex}[/red]")
+        return
+    finally:
+        if executor:
+            executor.shutdown()
+    if runner == 'inprocess':
+        reporter.flush()
+    else:
+        # Each deploy counted into its own file, so no two processes raced on summary_json
+        merge_summaries([path for path in summary_paths if os.path.exists(path)], summary_json)
 
     # Print summary table
     if os.path.exists(summary_json):
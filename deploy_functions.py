@@ -1,26 +1,43 @@
 import argparse
+import concurrent.futures
 import configparser
 import threading
 import logging
 import os
 import csv
 import base64
+import codecs
 import html
+import json
 import sys
-from typing import Optional, Any
+from collections import Counter
+from typing import Optional, Any, Dict, List, Set, Tuple
+import requests
+from requests.adapters import HTTPAdapter
 from simple_salesforce import Salesforce
 from rich.console import Console
 
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from reporting import reporter
+from multipart_upload import upload_content_version, UPLOAD_CHUNK_SIZE
+from progress_channel import emit_progress
+from session_cache import SESSION_CACHE_FILE, CachedSalesforce, cache_key
 
 csv_writer_lock = threading.Lock()
 console: Console = Console()
-
-def setup_logging() -> None:
+DEPLOY_RESULTS_FILE = 'deploy_results.csv'
+ID_QUERY_CHUNK_SIZE = 500
+LINK_BATCH_SIZE = 200  # sObject Collections limit per call
+MULTIPART_THRESHOLD = 10 * 1024 * 1024  # larger files are streamed instead of base64 JSON
+OWNER_MAP_FILE = 'owner_map.json'
+# Reporter categories for links added to files deployed by an earlier run
+RELINKED = "Linked existing file to record"
+RELINK_FAILED = "Failed to link existing file to record"
+
+def setup_logging(to_stdout: bool = True) -> None:
     """
-    Configures logging to both console and a deploy.log file.
+    Configures logging to a deploy.log file and, if to_stdout, to stdout.
     """
     log_file = 'deploy.log'
     logger = logging.getLogger()
@@ -34,240 +51,803 @@ def setup_logging() -> None:
     logger.addHandler(fh)
 
     # Stream handler
-    sh = logging.StreamHandler(sys.__stdout__)
-    sh.setLevel(logging.INFO)
-    sh.setFormatter(formatter)
-    logger.addHandler(sh)
+    if to_stdout:
+        sh = logging.StreamHandler(sys.__stdout__)
+        sh.setLevel(logging.INFO)
+        sh.setFormatter(formatter)
+        logger.addHandler(sh)
 
-def upload_files_from_csv(
+RESULT_FIELDS = ['Row', 'ContentVersionOldId', 'Title', 'Status', 'ContentVersionId', 'Message']
+
+
+def row_result(index: int, row: Dict[str, str], status: str, message: str = '',
+               content_version_id: str = '') -> Dict[str, Any]:
+    return {
+        'Row': index,
+        'ContentVersionOldId': (row.get('ContentVersionOldId') or '').strip(),
+        'Title': (row.get('Title') or '').strip(),
+        'Status': status,
+        'ContentVersionId': content_version_id or '',
+        'Message': message,
+    }
+
+
+def resolve_old_ids(
+    sf: Salesforce,
+    object_name: str,
+    old_ids: List[str],
+    chunk_size: int = ID_QUERY_CHUNK_SIZE
+) -> Dict[str, str]:
+    """
+    Maps source Ids to the Ids of the object_name records migrated with them
+    (SI_Old_Id__c -> Id), with one IN (...) query per chunk_size Ids.
+    Ids that were not migrated are left out.
+    """
+    resolved: Dict[str, str] = {}
+    for i in range(0, len(old_ids), chunk_size):
+        chunk = old_ids[i:i + chunk_size]
+        result = sf.query_all(
+            f"SELECT Id, SI_Old_Id__c FROM {object_name} WHERE SI_Old_Id__c IN (" +
+            ",".join("'" + old_id + "'" for old_id in chunk) + ")"
+        )
+        for record in result['records']:
+            resolved.setdefault(record['SI_Old_Id__c'], record['Id'])
+    return resolved
+
+
+def fetch_existing_versions(
+    sf: Salesforce,
+    old_ids: List[str],
+    chunk_size: int = ID_QUERY_CHUNK_SIZE
+) -> Dict[str, str]:
+    """
+    Maps the old_ids already deployed as a ContentVersion.SI_Old_Id__c to the Id of
+    that ContentVersion.
+    """
+    return resolve_old_ids(sf, 'ContentVersion', old_ids, chunk_size)
+
+
+def fetch_existing_old_ids(sf: Salesforce, old_ids: List[str], chunk_size: int = ID_QUERY_CHUNK_SIZE) -> Set[str]:
+    """
+    Returns the subset of old_ids already deployed as a ContentVersion.SI_Old_Id__c.
+    """
+    return set(fetch_existing_versions(sf, old_ids, chunk_size))
+
+
+def check_utf8(file_path: str) -> None:
+    """
+    Raises UnicodeDecodeError unless file_path is valid UTF-8, reading it in chunks.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            decoder.decode(chunk)
+    decoder.decode(b'', final=True)
+
+
+def fetch_content_document_ids(
+    sf: Salesforce,
+    content_version_ids: List[str],
+    chunk_size: int = ID_QUERY_CHUNK_SIZE
+) -> Dict[str, str]:
+    """
+    Maps newly created ContentVersion Ids to their ContentDocumentId, with one
+    IN (...) query per chunk_size versions instead of one query per upload.
+    Versions of a chunk whose query fails are left out.
+    """
+    cd_ids: Dict[str, str] = {}
+    for i in range(0, len(content_version_ids), chunk_size):
+        chunk = content_version_ids[i:i + chunk_size]
+        try:
+            result = sf.query_all(
+                "SELECT Id, ContentDocumentId FROM ContentVersion WHERE Id IN (" +
+                ",".join("'" + version_id + "'" for version_id in chunk) + ")"
+            )
+        except Exception as e:
+            logging.error(f"Failed to look up ContentDocumentIds of {len(chunk)} files: {e}", exc_info=True)
+            continue
+        cd_ids.update((record['Id'], record['ContentDocumentId']) for record in result['records'])
+    return cd_ids
+
+
+def fetch_existing_links(
+    sf: Salesforce,
+    cd_ids: List[str],
+    chunk_size: int = ID_QUERY_CHUNK_SIZE
+) -> Set[Tuple[str, str]]:
+    """
+    Returns the (ContentDocumentId, LinkedEntityId) links the documents in cd_ids
+    already have, with one IN (...) query per chunk_size documents. A chunk whose
+    query fails is treated as having no links; recreating one fails as a duplicate.
+    """
+    links: Set[Tuple[str, str]] = set()
+    for i in range(0, len(cd_ids), chunk_size):
+        chunk = cd_ids[i:i + chunk_size]
+        try:
+            result = sf.query_all(
+                "SELECT ContentDocumentId, LinkedEntityId FROM ContentDocumentLink WHERE ContentDocumentId IN (" +
+                ",".join("'" + cd_id + "'" for cd_id in chunk) + ")"
+            )
+        except Exception as e:
+            logging.warning(f"Failed to look up existing links of {len(chunk)} files: {e}", exc_info=True)
+            continue
+        links.update((record['ContentDocumentId'], record['LinkedEntityId']) for record in result['records'])
+    return links
+
+
+def is_student_record_case(row: Dict[str, str]) -> bool:
+    return (
+        row.get('LinkedEntityType', '').strip() == "Case"
+        and row.get('CaseRecordTypeName', '').strip() == "Student Record"
+        and bool(row.get('CaseContactId', '').strip())
+    )
+
+
+def link_target(args: argparse.Namespace, row: Dict[str, str]) -> Tuple[str, str]:
+    """
+    Returns (object, SI_Old_Id__c) of the record a files.csv row links to: the
+    Person Account for Student Record cases, else the row's FirstPublicationId
+    on the target object.
+    """
+    if is_student_record_case(row):
+        return 'Account', row['CaseContactId'].strip()
+    return args.targetobject, row['FirstPublicationId'].strip()
+
+
+def resolve_link_targets(
     sf: Salesforce,
     args: argparse.Namespace,
-    folder_output_directory: str,
-    csv_filename: str = 'files.csv'
+    rows: List[Dict[str, str]]
+) -> Dict[str, Dict[str, str]]:
+    """
+    Resolves the distinct link targets of rows in bulk, per object. The result is
+    the memo table link_row serves parent Ids from: {object: {SI_Old_Id__c: Id}}.
+    """
+    wanted: Dict[str, Set[str]] = {}
+    for row in rows:
+        if not row['FirstPublicationId'].strip():
+            continue
+        object_name, old_id = link_target(args, row)
+        wanted.setdefault(object_name, set()).add(old_id)
+    parent_ids: Dict[str, Dict[str, str]] = {}
+    for object_name, old_ids in wanted.items():
+        if not object_name:
+            logging.error("No target object given, files can only be linked to Person Accounts")
+            parent_ids[object_name] = {}
+            continue
+        try:
+            parent_ids[object_name] = resolve_old_ids(sf, object_name, sorted(old_ids))
+        except Exception as e:
+            # Left out of parent_ids: link_deployed reports these rows as failed links
+            logging.error(f"Failed to resolve {object_name} link targets: {e}", exc_info=True)
+            continue
+        logging.info(f"Resolved {len(parent_ids[object_name])} of {len(old_ids)} {object_name} link targets")
+    return parent_ids
+
+
+def read_owner_maps(path: Optional[str]) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """
+    Loads the owner map cache: per target org (see session_cache.cache_key), the
+    source OwnerId -> {'Id', 'Name'} of the target User. Returns {} if missing.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            owner_maps = json.load(f)
+    except Exception as ex:
+        logging.warning(f"Ignoring unreadable owner map {path}: {ex}")
+        return {}
+    # Entries of the older unkeyed format belong to an unknown org: resolve them again
+    return {org: owner_map for org, owner_map in owner_maps.items()
+            if isinstance(owner_map, dict) and 'Id' not in owner_map}
+
+
+def read_owner_map(path: Optional[str], target_org: str) -> Dict[str, Dict[str, str]]:
+    """
+    Loads the cached source OwnerId -> {'Id', 'Name'} of the Users of target_org, or {}.
+    """
+    return dict(read_owner_maps(path).get(target_org, {}))
+
+
+def write_owner_map(path: str, target_org: str, owner_map: Dict[str, Dict[str, str]]) -> None:
+    """
+    Merges owner_map into target_org's entry of the cache file and replaces it
+    atomically. Deploys of other objects may be writing at the same time, so each
+    uses its own temp file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    merged = read_owner_maps(path)
+    merged.setdefault(target_org, {}).update(owner_map)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_owner_map(
+    sf: Salesforce,
+    owner_ids: List[str],
+    cache_path: Optional[str] = None,
+    target_org: str = '',
+    chunk_size: int = ID_QUERY_CHUNK_SIZE
+) -> Dict[str, Dict[str, str]]:
+    """
+    Maps source OwnerIds to target Users (matched on User.AboutMe). Owners already in
+    the cache at cache_path for target_org (User Ids only mean something in their
+    own org) are reused; the rest are resolved with chunked IN (...) queries and
+    added to the cache. Owners without a target User are left out.
+    """
+    owner_map = read_owner_map(cache_path, target_org)
+    missing = sorted(set(owner_ids) - set(owner_map))
+    found: Dict[str, Dict[str, str]] = {}
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        result = sf.query_all(
+            "SELECT Id, Name, AboutMe FROM User WHERE AboutMe IN (" +
+            ",".join("'" + owner_id + "'" for owner_id in chunk) + ")"
+        )
+        for record in result['records']:
+            found[record['AboutMe']] = {'Id': record['Id'], 'Name': record['Name']}
+    logging.info(
+        f"Owner map: {len(set(owner_ids)) - len(missing)} cached, {len(found)} resolved, "
+        f"{len(missing) - len(found)} without a target User"
+    )
+    if found:
+        owner_map.update(found)
+        if cache_path:
+            write_owner_map(cache_path, target_org, found)
+    return owner_map
+
+
+def group_rows_by_version(rows: List[Tuple[int, Dict[str, str]]]) -> List[List[Tuple[int, Dict[str, str]]]]:
+    """
+    Groups files.csv rows by ContentVersionOldId, in order of first appearance.
+    A file linked to several records has one row per link but is uploaded once.
+    """
+    groups: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+    for index, row in rows:
+        groups.setdefault((row.get('ContentVersionOldId') or '').strip(), []).append((index, row))
+    return list(groups.values())
+
+
+def plan_link(
+    args: argparse.Namespace,
+    cd_id: str,
+    row: Dict[str, str],
+    parent_ids: Dict[str, Dict[str, str]]
+) -> Tuple[Optional[Dict[str, str]], str]:
+    """
+    Works out the ContentDocumentLink for one files.csv row, with the parent Id
+    looked up in parent_ids (see resolve_link_targets).
+    Returns (payload, message): the link to create and the reporter category to log
+    once it is created, or (None, category) when there is nothing to link to,
+    which the caller reports.
+    """
+    FirstPublicationId = row['FirstPublicationId'].strip()
+    target_object, target_old_id = link_target(args, row)
+    if target_object not in parent_ids:
+        logging.error(f"Link targets on {target_object} could not be looked up, not linking {cd_id}")
+        return None, "Unknown exception linking record"
+    newrecord_id = parent_ids[target_object].get(target_old_id)
+
+    # -- CUSTOM LOGIC FOR CASE > STUDENT RECORD --
+    logging.info("Checking for Case special case...")
+    if is_student_record_case(row):
+        logging.info(f"Found case with Student Record type {target_old_id}")
+        if newrecord_id:
+            logging.info(f"Will link file to Person Account {newrecord_id} (from Case/Student Record)")
+            return link_payload(cd_id, newrecord_id), "Linked to Person Account"
+        logging.error(
+            f"Could not find Person Account for Case ContactId={target_old_id} ")
+        return None, "Could not find Person Account for CaseContactId"
+
+    # Default: link to new record by FirstPublicationId
+    if newrecord_id:
+        logging.info(f"Found New Record Id: {newrecord_id}")
+        return link_payload(cd_id, newrecord_id), ''
+    logging.error(
+        f"No matching New Record found for {args.sourceobject} with Id: {FirstPublicationId}."
+    )
+    return None, "No matching record for source object"
+
+
+def link_payload(cd_id: str, linked_entity_id: str) -> Dict[str, str]:
+    return {
+        'ContentDocumentId': cd_id,
+        'LinkedEntityId': linked_entity_id,
+        'ShareType': 'V',
+        'Visibility': 'AllUsers'
+    }
+
+
+def link_error_category(errors: List[Dict[str, Any]]) -> str:
+    """
+    Maps the errors of one failed sObject Collections record to a reporter category.
+    """
+    codes = {error.get('statusCode') for error in errors}
+    if 'DUPLICATE_VALUE' in codes:
+        return "File already linked to record"
+    if 'INVALID_CROSS_REFERENCE_KEY' in codes or 'ENTITY_IS_DELETED' in codes:
+        return "No matching record for source object"
+    return "Unknown exception linking record"
+
+
+def create_links(sf: Salesforce, object_name: str, pending: List[Tuple[Dict[str, Any], Dict[str, str], str]]) -> None:
+    """
+    Creates up to LINK_BATCH_SIZE ContentDocumentLinks with one sObject Collections
+    call (allOrNone=false). pending holds (result, payload, message) per link; each
+    result's Message is set from the outcome of its own record.
+    """
+    records = [dict(payload, attributes={'type': 'ContentDocumentLink'}) for _, payload, _ in pending]
+    try:
+        responses = sf.restful('composite/sobjects', method='POST',
+                               json={'allOrNone': False, 'records': records})
+    except Exception as e:
+        logging.warning(f"Failed to link {len(pending)} files to records: {e}", exc_info=True)
+        responses = [{'success': False, 'errors': []}] * len(pending)
+
+    for (result, payload, message), response in zip(pending, responses):
+        if response.get('success'):
+            logging.info(f"Linked {payload['ContentDocumentId']} to record: {payload['LinkedEntityId']}")
+        else:
+            logging.warning(
+                f"Failed to link {payload['ContentDocumentId']} to {payload['LinkedEntityId']}: {response.get('errors')}")
+            message = RELINK_FAILED if message == RELINKED else link_error_category(response.get('errors') or [])
+        if message:
+            reporter.log(object_name, message)
+        result['Message'] = message
+
+
+def link_deployed(
+    sf: Salesforce,
+    args: argparse.Namespace,
+    to_link: List[Tuple[Dict[str, Any], Dict[str, str]]],
+    parent_ids: Dict[str, Dict[str, str]]
 ) -> None:
+    """
+    Links one batch of deployed rows (the (result, row) pairs from deploy_version):
+    ContentDocumentIds in a few IN (...) queries, then one sObject Collections call
+    per LINK_BATCH_SIZE links. Rows of versions deployed by an earlier run are
+    linked too, unless their link already exists, so an interrupted run is
+    completed by the next one. Those rows were already reported as existing files:
+    they keep that message unless a link is attempted, and only the relink itself
+    is reported, under its own categories.
+    """
     object_name = args.sourceobject
-    csv_path = os.path.join(folder_output_directory, csv_filename)
-    processed = 0
-
-    if not os.path.isfile(csv_path):
-        logging.error(f"CSV file not found: {csv_path}")
-        reporter.log(object_name, "File not found for upload and linking")
-        return
+    cd_ids = fetch_content_document_ids(sf, sorted({result['ContentVersionId'] for result, _ in to_link}))
+    existing_links = fetch_existing_links(sf, sorted({
+        cd_ids[result['ContentVersionId']] for result, _ in to_link
+        if result['Status'] == 'Skipped' and result['ContentVersionId'] in cd_ids}))
+    links = []
+    for result, row in to_link:
+        relink = result['Status'] == 'Skipped'
+        cd_id = cd_ids.get(result['ContentVersionId'])
+        if not cd_id:
+            logging.warning(f"No ContentDocumentId found for ContentVersion {result['ContentVersionId']}")
+            message = RELINK_FAILED if relink else "Unknown exception linking record"
+            reporter.log(object_name, message)
+            result['Message'] = message
+            continue
+        payload, message = plan_link(args, cd_id, row, parent_ids)
+        if not payload:
+            if not relink:
+                reporter.log(object_name, message)
+                result['Message'] = message
+            continue
+        if relink:
+            if (cd_id, payload['LinkedEntityId']) in existing_links:
+                continue
+            logging.info(f"Existing file {cd_id} is not linked to {payload['LinkedEntityId']} yet")
+            message = RELINKED
+        result['Message'] = message
+        links.append((result, payload, message))
+    batches = [links[i:i + LINK_BATCH_SIZE] for i in range(0, len(links), LINK_BATCH_SIZE)]
+    logging.info(f"Creating {len(links)} ContentDocumentLinks in {len(batches)} calls")
+    for batch in batches:
+        create_links(sf, object_name, batch)
 
-    with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for index, row in enumerate(reader, start=1):
-            logging.info(f"=== Processing Row\n: {row}")
-            try:
-                title = row['Title'].strip()
-                file_path = row['PathOnClient'].strip()
-                linked_entity_id = row['FirstPublicationId'].strip()
-                ContentVersionOldId = row['ContentVersionOldId'].strip()
-                FirstPublicationId = row['FirstPublicationId'].strip()
-                linked_entity_type = row.get('LinkedEntityType', '').strip()
-                case_record_type_name = row.get('CaseRecordTypeName', '').strip()
-                case_contact_id = row.get('CaseContactId', '').strip()
-                is_snote = file_path.lower().endswith('.snote')
-                owner_id = row.get('OwnerId', '').strip()
-                logging.info(f"=== Processing File #{index} for {object_name} ===")
-                logging.info(f"Title: {title}")
-                logging.info(f"Path: {file_path}")
-                logging.info(f"Linked Record ID: {linked_entity_id if linked_entity_id else 'None'}")
-                logging.info(f"Is SNote: {'Yes' if is_snote else 'No'}")
-
-                if not os.path.isfile(file_path):
-                    logging.error(f"File not found: {file_path}")
-                    reporter.log(object_name, "File not found for upload and linking")
-                    continue
 
+def deploy_version(
+    sf: Salesforce,
+    args: argparse.Namespace,
+    rows: List[Tuple[int, Dict[str, str]]],
+    existing_versions: Dict[str, str],
+    owner_map: Optional[Dict[str, Dict[str, str]]],
+    parent_ids: Dict[str, Dict[str, str]],
+    multipart_threshold: int = MULTIPART_THRESHOLD
+) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Dict[str, str]]]]:
+    """
+    Uploads the file shared by rows (all with the same ContentVersionOldId) once,
+    unless it is in existing_versions (SI_Old_Id__c -> ContentVersion Id).
+    Returns one result record per row, with Status 'Uploaded', 'Skipped' or 'Failed'
+    (problems are also counted in reporter), and the (result, row) pairs to be
+    linked by link_deployed. Files over multipart_threshold bytes
+    are streamed as multipart/form-data (0 disables this). owner_map is None if the
+    owner lookup failed; files with an owner then fail rather than change hands.
+    """
+    object_name = args.sourceobject
+    index, row = rows[0]
+    file_path = ''
+
+    def results_for_all(status: str, message: str) -> Tuple[List[Dict[str, Any]], List]:
+        return [row_result(i, r, status, message) for i, r in rows], []
+
+    def results_to_link(status: str, message: str, content_version_id: str) -> Tuple[List[Dict[str, Any]], List]:
+        results = []
+        to_link = []
+        for row_index, link in rows:
+            result = row_result(row_index, link, status, message, content_version_id)
+            results.append(result)
+            if link['FirstPublicationId'].strip():
+                to_link.append((result, link))
+        return results, to_link
+
+    logging.info(f"=== Processing Row\n: {row}")
+    try:
+        title = row['Title'].strip()
+        file_path = row['PathOnClient'].strip()
+        ContentVersionOldId = row['ContentVersionOldId'].strip()
+        is_snote = file_path.lower().endswith('.snote')
+        owner_id = row.get('OwnerId', '').strip()
+        logging.info(f"=== Processing File #{index} for {object_name} ===")
+        logging.info(f"Title: {title}")
+        logging.info(f"Path: {file_path}")
+        logging.info(f"Linked Record IDs: {', '.join(r['FirstPublicationId'].strip() or 'None' for _, r in rows)}")
+        logging.info(f"Is SNote: {'Yes' if is_snote else 'No'}")
+
+        # Checked up front for the whole CSV by fetch_existing_versions; its links
+        # are still checked, in case the run that uploaded it stopped before linking
+        if ContentVersionOldId in existing_versions:
+            logging.warning(f"Skipping upload (already exists): SI_Old_Id__c = {ContentVersionOldId}")
+            for _ in rows:
+                reporter.log(object_name, "File already exists")
+            return results_to_link('Skipped', "File already exists", existing_versions[ContentVersionOldId])
+
+        if not os.path.isfile(file_path):
+            logging.error(f"File not found: {file_path}")
+            for _ in rows:
+                reporter.log(object_name, "File not found for upload and linking")
+            return results_for_all('Failed', "File not found for upload and linking")
+
+        # Large files are streamed from disk as multipart/form-data; reading and
+        # base64-encoding them would need several times their size in memory
+        file_size = os.path.getsize(file_path)
+        use_multipart = bool(multipart_threshold) and file_size > multipart_threshold
+        encoded_file = None
+        if use_multipart:
+            logging.info(f"File is {file_size} bytes, will upload it as multipart/form-data")
+            if is_snote:
                 try:
-                    with open(file_path, 'rb') as f:
-                        file_bytes = f.read()
+                    check_utf8(file_path)
+                except UnicodeDecodeError as e:
+                    logging.warning(f"Could not decode .snote file as UTF-8: {file_path} | Exception: {e}")
+                    reporter.log(object_name, "Unable to decode snote file")
+                    return results_for_all('Failed', "Unable to decode snote file")
                 except Exception as e:
                     logging.error(f"Failed to read file: {file_path} | Exception: {e}")
                     reporter.log(object_name, "File can't be read")
-                    continue
-
-                if is_snote:
-                    try:
-                        html_text = file_bytes.decode('utf-8')
-                        #escaped_html = html.escape(html_text)
-                        escaped_html = html_text
-                        encoded_file = base64.b64encode(escaped_html.encode('utf-8')).decode('utf-8')
-                        logging.info(f"Escaped SNote and base64-encoded (length: {len(encoded_file)} chars)")
-                    except UnicodeDecodeError as e:
-                        logging.warning(f"Could not decode .snote file as UTF-8: {file_path} | Exception: {e}")
-                        reporter.log(object_name, "Unable to decode snote file")
-                        continue
+                    return results_for_all('Failed', "File can't be read")
+        else:
+            try:
+                with open(file_path, 'rb') as f:
+                    file_bytes = f.read()
+            except Exception as e:
+                logging.error(f"Failed to read file: {file_path} | Exception: {e}")
+                reporter.log(object_name, "File can't be read")
+                return results_for_all('Failed', "File can't be read")
+
+            if is_snote:
+                try:
+                    html_text = file_bytes.decode('utf-8')
+                    #escaped_html = html.escape(html_text)
+                    escaped_html = html_text
+                    encoded_file = base64.b64encode(escaped_html.encode('utf-8')).decode('utf-8')
+                    logging.info(f"Escaped SNote and base64-encoded (length: {len(encoded_file)} chars)")
+                except UnicodeDecodeError as e:
+                    logging.warning(f"Could not decode .snote file as UTF-8: {file_path} | Exception: {e}")
+                    reporter.log(object_name, "Unable to decode snote file")
+                    return results_for_all('Failed', "Unable to decode snote file")
+            else:
+                encoded_file = base64.b64encode(file_bytes).decode('utf-8')
+                logging.info(f"File base64-encoded (length: {len(encoded_file)} chars)")
+
+        #content_title = f"SNOTE - {title}" if is_snote else title
+        content_title = title
+        filename = os.path.basename(file_path)
+
+        logging.info("Uploading to Salesforce ContentVersion...")
+
+        try:
+            target_owner_id = None
+            target_owner_name = ''
+            logging.info(f"Going to check for owner id {owner_id} in target org")
+            if owner_id and owner_map is None:
+                raise RuntimeError("Owners could not be looked up in the target org")
+            if owner_id:
+                # Resolved up front for the whole CSV by load_owner_map
+                target_owner = owner_map.get(owner_id)
+                if target_owner:
+                    target_owner_id = target_owner['Id']
+                    target_owner_name = target_owner['Name']
+                    logging.info(f"Target owner id and name: {target_owner_id} {target_owner_name}")
                 else:
-                    encoded_file = base64.b64encode(file_bytes).decode('utf-8')
-                    logging.info(f"File base64-encoded (length: {len(encoded_file)} chars)")
+                    logging.warning(f"No User found in target org with AboutMe = '{owner_id}'")
+            content_version_payload = {
+                'Title': content_title,
+                'PathOnClient': filename,
+                'SI_Old_Id__c': ContentVersionOldId
+            }
+            if not use_multipart:
+                content_version_payload['VersionData'] = encoded_file
+            if target_owner_id:
+                content_version_payload['OwnerId'] = target_owner_id
+                logging.info(f"Will set ownerid of file = {ContentVersionOldId} to {target_owner_id}")
+            else:
+                logging.info(f"Did not find target_owner_id for = {ContentVersionOldId} ")
+            if use_multipart:
+                content_version = upload_content_version(sf, content_version_payload, file_path)
+            else:
+                content_version = sf.ContentVersion.create(content_version_payload)
+            content_version_id = content_version.get('id')
+            logging.info(f"Uploaded file: {filename} → ContentVersionId: {content_version_id}")
+        except Exception as e:
+            logging.error(f"Failed to upload file to Salesforce: {e}", exc_info=True)
+            reporter.log(object_name, "Unknown exception uploading file")
+            return results_for_all('Failed', "Unknown exception uploading file")
+
+        logging.info("Done with this file.")
+        return results_to_link('Uploaded', '', content_version_id)
+
+    except Exception as outer_ex:
+        import traceback
+        tb = traceback.format_exc()
+        logging.error(f"Unhandled exception in row #{index} ({file_path}): {outer_ex}\n{tb}")
+        reporter.log(object_name, f"Unhandled exception in upload_files_from_csv: {outer_ex}")
+        return results_for_all('Failed', f"Unhandled exception: {outer_ex}")
+
+
+def write_deploy_results(results_path: str, results: List[Dict[str, Any]]) -> None:
+    with open(results_path, 'w', encoding='utf-8', newline='') as results_csv:
+        writer = csv.DictWriter(results_csv, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
 
-                #content_title = f"SNOTE - {title}" if is_snote else title
-                content_title = title
-                filename = os.path.basename(file_path)
 
-                logging.info("Uploading to Salesforce ContentVersion...")
+def upload_files_from_csv(
+    sf: Salesforce,
+    args: argparse.Namespace,
+    folder_output_directory: str,
+    csv_filename: str = 'files.csv',
+    workers: int = 1,
+    owner_map_path: Optional[str] = None,
+    multipart_threshold: int = MULTIPART_THRESHOLD,
+    target_org: str = ''
+) -> List[Dict[str, Any]]:
+    """
+    Deploys every file in files.csv, with up to `workers` files in flight at once.
+    Returns the per-row result records, which are also written to deploy_results.csv.
+    owner_map_path caches the OwnerId -> target User map of target_org between runs
+    and objects.
+    """
+    object_name = args.sourceobject
+    csv_path = os.path.join(folder_output_directory, csv_filename)
 
-                try:
-                    # Check if the file already exists
-                    query = f"SELECT Id FROM ContentVersion WHERE SI_Old_Id__c = '{ContentVersionOldId}'"
-                    existing = sf.query(query)
-
-                    if existing['totalSize'] > 0:
-                        logging.warning(f"Skipping upload (already exists): SI_Old_Id__c = {ContentVersionOldId}")
-                        reporter.log(object_name, "File already exists")
-                    else:
-                        target_owner_id = None
-                        target_owner_name = ''
-                        logging.info(f"Going to check for owner id {owner_id} in target org")
-                        if owner_id:
-                            # Query for User with AboutMe = owner_id
-                            logging.info(f"Will search for target owner id for sourceid {owner_id}")
-                            user_result = sf.query(f"SELECT Id, Name FROM User WHERE AboutMe = '{owner_id}' LIMIT 1")
-                            if user_result['totalSize'] > 0:
-                                target_owner_id = user_result['records'][0]['Id']
-                                target_owner_name = user_result['records'][0]['Name']
-                                logging.info(f"Target owner id and name: {target_owner_id} {target_owner_name}")
-                            else:
-                                logging.warning(f"No User found in target org with AboutMe = '{owner_id}'")
-                        content_version_payload = {
-                            'Title': content_title,
-                            'PathOnClient': filename,
-                            'VersionData': encoded_file,
-                            'SI_Old_Id__c': ContentVersionOldId
-                        }
-                        if target_owner_id:
-                            content_version_payload['OwnerId'] = target_owner_id
-                            logging.info(f"Will set ownerid of file = {ContentVersionOldId} to {target_owner_id}")
-                        else:
-                            logging.info(f"Did not find target_owner_id for = {ContentVersionOldId} ")
-                        content_version = sf.ContentVersion.create(content_version_payload)
-                        content_version_id = content_version.get('id')
-                        logging.info(f"Uploaded file: {filename} → ContentVersionId: {content_version_id}")
-
-                        if linked_entity_id:
-                            try:
-                                logging.info("Linking ContentDocument to record...")
-                                query = f"SELECT ContentDocumentId FROM ContentVersion WHERE Id = '{content_version_id}'"
-                                cd_id = sf.query(query)['records'][0]['ContentDocumentId']
-
-                                # -- CUSTOM LOGIC FOR CASE > STUDENT RECORD --
-                                logging.info("Checking for Case special case...")
-                                if (
-                                    linked_entity_type == "Case"
-                                    and case_record_type_name == "Student Record"
-                                    and case_contact_id
-                                ):
-                                    logging.info(f"Found case with Student Record type {case_contact_id}")
-                                    # 1. Find Person Account
-                                    acct_query = (
-                                        f"SELECT Id FROM Account WHERE SI_Old_Id__c = '{case_contact_id}' LIMIT 1"
-                                    )
-                                    acct_result = sf.query(acct_query)
-                                    if acct_result['totalSize'] > 0:
-                                        person_account_id = acct_result['records'][0]['Id']
-                                        # Link to Person Account
-                                        sf.ContentDocumentLink.create({
-                                            'ContentDocumentId': cd_id,
-                                            'LinkedEntityId': person_account_id,
-                                            'ShareType': 'V',
-                                            'Visibility': 'AllUsers'
-                                        })
-                                        logging.info(
-                                            f"Linked file to Person Account {person_account_id} (from Case/Student Record)")
-                                        reporter.log(object_name, "Linked to Person Account")
-                                    else:
-                                        logging.error(
-                                            f"Could not find Person Account for Case ContactId={case_contact_id} ")
-                                        reporter.log(object_name, "Could not find Person Account for CaseContactId")
-                                else:
-                                    # Default: link to new record by FirstPublicationId
-                                    query = (
-                                        f"SELECT Id FROM {args.targetobject} WHERE SI_Old_Id__c = '{FirstPublicationId}' LIMIT 1"
-                                    )
-                                    result = sf.query(query)
-                                    if result['totalSize'] > 0:
-                                        newrecord_id = result['records'][0]['Id']
-                                        logging.info(f"Found New Record Id: {newrecord_id}")
-
-                                        sf.ContentDocumentLink.create({
-                                            'ContentDocumentId': cd_id,
-                                            'LinkedEntityId': newrecord_id,
-                                            'ShareType': 'V',
-                                            'Visibility': 'AllUsers'
-                                        })
-                                        logging.info(f"Linked to record: {linked_entity_id}")
-                                    else:
-                                        logging.error(
-                                            f"No matching New Record found for {args.sourceobject} with Id: {FirstPublicationId}."
-                                        )
-                                        reporter.log(object_name, "No matching record for source object")
-                            except Exception as e:
-                                logging.warning(f"Failed to link file to record: {e}", exc_info=True)
-                                reporter.log(object_name, "Unknown exception linking record")
-
-                        logging.info("Done with this file.")
-                    processed += 1
+    if not os.path.isfile(csv_path):
+        logging.error(f"CSV file not found: {csv_path}")
+        reporter.log(object_name, "File not found for upload and linking")
+        return []
 
-                except Exception as e:
-                    logging.error(f"Failed to upload file to Salesforce: {e}", exc_info=True)
-                    reporter.log(object_name, "Unknown exception uploading file")
-                    continue
-
-            except Exception as outer_ex:
-                import traceback
-                tb = traceback.format_exc()
-                logging.error(f"Unhandled exception in row #{index} ({file_path}): {outer_ex}\n{tb}")
-                reporter.log(object_name, f"Unhandled exception in upload_files_from_csv: {outer_ex}")
-                continue
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+        rows = list(enumerate(csv.DictReader(file), start=1))
 
-def main() -> None:
-    """
-    Main function to parse arguments, set up config and logging, connect to Salesforce,
-    and initiate the upload process.
-    """
-    setup_logging()
+    # Pre-pass: learn which files are already deployed with a few IN (...) queries
+    # instead of one query per row, so only the missing ones are uploaded
+    groups = group_rows_by_version(rows)
+    old_ids = [old_id for old_id in (group[0][1]['ContentVersionOldId'].strip() for group in groups) if old_id]
+    try:
+        existing_versions = fetch_existing_versions(sf, old_ids)
+    except Exception as e:
+        # Without it every file would be uploaded again, duplicating those already deployed
+        logging.error(f"Failed to check for files already in the target org, not deploying {object_name}: {e}",
+                      exc_info=True)
+        results = []
+        for index, row in rows:
+            reporter.log(object_name, "Unable to check for existing files")
+            results.append(row_result(index, row, 'Failed', "Unable to check for existing files"))
+        write_deploy_results(os.path.join(folder_output_directory, DEPLOY_RESULTS_FILE), results)
+        return results
+    logging.info(f"{len(existing_versions)} of {len(old_ids)} files already exist in the target org")
+    pending = [row for group in groups for _, row in group
+               if group[0][1]['ContentVersionOldId'].strip() not in existing_versions]
+    # Existing files may still need their links (see link_deployed), so all rows count
+    parent_ids = resolve_link_targets(sf, args, [row for _, row in rows])
+    owner_ids = [(row.get('OwnerId') or '').strip() for row in pending]
+    try:
+        owner_map = load_owner_map(sf, [owner_id for owner_id in owner_ids if owner_id], owner_map_path,
+                                   target_org)
+    except Exception as e:
+        logging.error(f"Failed to look up file owners in the target org: {e}", exc_info=True)
+        owner_map = None
+
+    deployed = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            logging.info(f"Deploying {len(rows)} rows with {workers} workers")
+            to_link = []
+            rows_done = 0
+            for group_results, group_to_link in executor.map(
+                    lambda group: deploy_version(sf, args, group, existing_versions, owner_map, parent_ids,
+                                                 multipart_threshold), groups):
+                deployed.append(group_results)
+                rows_done += len(group_results)
+                emit_progress(rows_done, len(rows))
+                # Linked as every LINK_BATCH_SIZE uploads complete, so a run that stops
+                # early leaves at most one batch of files unlinked
+                to_link.extend(group_to_link)
+                while len(to_link) >= LINK_BATCH_SIZE:
+                    link_deployed(sf, args, to_link[:LINK_BATCH_SIZE], parent_ids)
+                    del to_link[:LINK_BATCH_SIZE]
+            link_deployed(sf, args, to_link, parent_ids)
+            emit_progress(len(rows), len(rows), force=True)
+    finally:
+        # Written even if the run stops early, with the rows deployed so far
+        results = sorted((result for group_results in deployed for result in group_results),
+                         key=lambda result: result['Row'])
+        write_deploy_results(os.path.join(folder_output_directory, DEPLOY_RESULTS_FILE), results)
+    counts = Counter(result['Status'] for result in results)
+    logging.info(
+        f"Deploy of {object_name} finished: {counts['Uploaded']} uploaded, "
+        f"{counts['Skipped']} skipped, {counts['Failed']} failed"
+    )
+    return results
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Deploy ContentVersion (Files) to Salesforce Target Org')
     parser.add_argument('-so', '--sourceobject', metavar='sourceobject', required=False, default='', help='Source Object')
     parser.add_argument('-to', '--targetobject', metavar='targetobject', required=False, default='', help='Target Object')
-    args = parser.parse_args()
+    parser.add_argument('-w', '--workers', metavar='workers', type=int, required=False, default=None,
+                        help='Number of rows deployed concurrently (default: deploy_workers from config.ini, or 1)')
+    parser.add_argument('--summary', metavar='summary', required=False, default=None,
+                        help='Summary JSON to count results in (default: deploy_summary.json); '
+                             'deploy.py gives each object its own and merges them')
+    return parser
+
 
+def load_config(config_path: str = 'config.ini') -> configparser.ConfigParser:
     config = configparser.ConfigParser()
-    config.read('config.ini')
+    config.read(config_path)
+    return config
 
-    username = config['salesforce']['target_username']
-    password = config['salesforce']['target_password']
-    token = config['salesforce']['target_security_token']
 
+def target_login_domain(config: configparser.ConfigParser) -> str:
+    """
+    Returns the login domain of the target org: test, login or <target_domain>.my.
+    """
     is_sandbox = config['salesforce']['target_connect_to_sandbox']
     domain = 'test' if is_sandbox == 'True' else 'login'
 
     custom_domain = config['salesforce']['target_domain']
     if custom_domain:
         domain = f'{custom_domain}.my'
+    return domain
+
 
-    batch_size = int(config['salesforce']['batch_size'])
+def open_connection(config: configparser.ConfigParser, pool_size: Optional[int] = None) -> Salesforce:
+    """
+    Logs in to the target org. pool_size sizes the HTTP connection pool for
+    callers that share the connection between several concurrent deploys.
+    """
+    username = config['salesforce']['target_username']
+    password = config['salesforce']['target_password']
+    token = config['salesforce']['target_security_token']
+    domain = target_login_domain(config)
+
+    logging.info(f'Username: {username}')
+    logging.info(f'Signing in at: https://{domain}.salesforce.com')
+    session = None
+    if pool_size:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    session_cache_file = config['salesforce'].get('session_cache_file', SESSION_CACHE_FILE)
+    sf = CachedSalesforce(username=username, password=password, security_token=token, domain=domain,
+                          session=session, cache_path=session_cache_file)
+    logging.info(f"Connected successfully to {sf.sf_instance}")
+    return sf
+
+
+def deploy_workers(config: configparser.ConfigParser, args: Optional[argparse.Namespace] = None) -> int:
+    """
+    Rows deployed concurrently: -w, else deploy_workers from config.ini, else 1.
+    """
+    return (args and args.workers) or int(config['salesforce'].get('deploy_workers', '1'))
+
+
+def run_deploy(sf: Salesforce, config: configparser.ConfigParser, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Deploys the files.csv of one object (args as parsed by build_parser) over an
+    already authenticated connection. Returns the per-row result records.
+    """
+    workers = deploy_workers(config, args)
+    owner_map_path = config['salesforce'].get('owner_map_file', OWNER_MAP_FILE)
+    multipart_threshold = int(float(config['salesforce'].get('multipart_threshold_mb', '10')) * 1024 * 1024)
     output_directory = config['salesforce']['output_dir']
     folder_output_directory = os.path.join(output_directory, args.sourceobject)
 
     if not os.path.isdir(folder_output_directory):
-        os.makedirs(folder_output_directory)
+        os.makedirs(folder_output_directory, exist_ok=True)
         logging.info(f"Created folder: {folder_output_directory}")
 
+    # Cached owners are only valid in the org they were resolved in
+    target_org = cache_key(config['salesforce']['target_username'], target_login_domain(config))
+    return upload_files_from_csv(sf, args, folder_output_directory, workers=workers, owner_map_path=owner_map_path,
+                                 multipart_threshold=multipart_threshold, target_org=target_org)
+
+
+# Connection of a ProcessPoolExecutor worker, opened once by init_worker
+_worker_connection: Optional[Salesforce] = None
+
+
+def init_worker() -> None:
+    """
+    ProcessPoolExecutor initializer: sets up logging and logs in once per worker
+    process, so every object the worker deploys reuses the same session. Workers
+    log to deploy.log only, as their stdout is deploy.py's live display.
+    """
+    global _worker_connection
+    setup_logging(to_stdout=False)
+    config = load_config()
+    # One pooled connection per deploy thread, instead of simple_salesforce's default 10
+    _worker_connection = open_connection(config, pool_size=deploy_workers(config))
+
+
+def deploy_object(argv: List[str], sf: Optional[Salesforce] = None) -> List[Dict[str, Any]]:
+    """
+    Runs one object deploy from deploy_functions.py command-line arguments, on sf
+    or this worker process's own connection (see init_worker). Lets deploy.py run
+    objects in-process without an interpreter start and login per object.
+    With --summary the counts go to that file, flushed before returning.
+    """
+    args = build_parser().parse_args(argv)
+    if args.summary:
+        reporter.set_path(args.summary)
+    try:
+        return run_deploy(sf or _worker_connection, load_config(), args)
+    finally:
+        reporter.flush()
+
+
+def main() -> None:
+    """
+    Main function to parse arguments, set up config and logging, connect to Salesforce,
+    and initiate the upload process.
+    """
+    setup_logging()
+    args = build_parser().parse_args()
+    if args.summary:
+        reporter.set_path(args.summary)
+
+    config = load_config()
     logging.info('Deploying ContentVersion (Files) to Salesforce')
-    logging.info(f'Username: {username}')
-    logging.info(f'Signing in at: https://{domain}.salesforce.com')
 
     try:
-        sf = Salesforce(username=username, password=password, security_token=token, domain=domain)
-        logging.info(f"Connected successfully to {sf.sf_instance}")
+        # One pooled connection per deploy thread, instead of simple_salesforce's default 10
+        sf = open_connection(config, pool_size=deploy_workers(config, args))
     except Exception as ex:
         logging.error(f"Failed to connect to Salesforce: {ex}", exc_info=True)
         print(f"[ERROR] Failed to connect to Salesforce: {ex}")
         return
 
-    upload_files_from_csv(sf, args, folder_output_directory)
+    try:
+        run_deploy(sf, config, args)
+    finally:
+        reporter.flush()
+
 
 if __name__ == '__main__':
     main()
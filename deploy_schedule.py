@@ -0,0 +1,74 @@
+"""
+Object scheduling for deploy.py: the optional 'Depends On' column of the object
+mapping orders the deploys, and at most `parallel` objects deploy at once.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (source object, target object, source objects to deploy first)
+MappingRow = Tuple[str, str, List[str]]
+
+
+def prune_unknown_dependencies(mapping: List[MappingRow]) -> None:
+    """
+    Drops (with a warning) dependencies on source objects that are not in the mapping,
+    which would otherwise never finish.
+    """
+    sources = {source_object for source_object, _, _ in mapping}
+    for source_object, _, depends_on in mapping:
+        for dependency in [dep for dep in depends_on if dep not in sources]:
+            logger.warning(f"Ignoring unknown dependency {dependency} of {source_object}")
+            depends_on.remove(dependency)
+
+
+def check_dependencies(mapping: List[MappingRow]) -> None:
+    """
+    Raises ValueError if the 'Depends On' columns of the mapping form a cycle.
+    """
+    remaining = {source: set(deps) for source, _, deps in mapping}
+    while remaining:
+        ready = [source for source, deps in remaining.items() if not deps & remaining.keys()]
+        if not ready:
+            raise ValueError(f"Circular 'Depends On' between: {', '.join(sorted(remaining))}")
+        for source in ready:
+            del remaining[source]
+
+
+async def run_mapping(mapping: List[MappingRow], parallel: int, deploy: Callable[..., Awaitable[Any]],
+                      summary_dir: str, progress: Any = None) -> List[str]:
+    """
+    Calls deploy(source, target, summary_path, progress) for every mapping row, up
+    to `parallel` at once, starting each object only after the objects it depends
+    on have finished (successfully or not).
+    Each deploy counts into its own summary file under summary_dir; returns their paths.
+    """
+    check_dependencies(mapping)
+    finished = [asyncio.Event() for _ in mapping]
+    rows_by_source: Dict[str, List[int]] = defaultdict(list)
+    for index, (source_object, _, _) in enumerate(mapping):
+        rows_by_source[source_object].append(index)
+    semaphore = asyncio.Semaphore(parallel)
+    os.makedirs(summary_dir, exist_ok=True)
+    summary_paths = [os.path.join(summary_dir, f"{index:03d}-{source_object}.json")
+                     for index, (source_object, _, _) in enumerate(mapping)]
+
+    async def deploy_one(index: int) -> None:
+        source_object, target_object, depends_on = mapping[index]
+        try:
+            for dependency in depends_on:
+                for row in rows_by_source[dependency]:
+                    await finished[row].wait()
+            async with semaphore:
+                await deploy(source_object, target_object, summary_paths[index], progress)
+        finally:
+            finished[index].set()
+
+    # Semaphore waiters are woken in FIFO order, so with --parallel 1 objects
+    # still deploy in CSV order (as far as dependencies allow)
+    await asyncio.gather(*[deploy_one(index) for index in range(len(mapping))])
+    return summary_paths
@@ -7,7 +7,13 @@ import shutil
 import logging
 import argparse
 import subprocess
-from typing import Dict, Any, List, Tuple
+import multiprocessing
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from batch_schedule import load_history, object_share, run_scheduled, save_history, schedule_objects
+from progress_channel import WorkerPool, set_progress_handler, stream_process
 
 from rich.table import Table
 from rich.console import Console, Group
@@ -80,34 +86,100 @@ async def run_query(
 
     progress.console.print(f":rocket: [cyan]Running:[/cyan] {' '.join(cmd)}")
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
+    # Output is streamed line by line into download.log; progress lines drive a
+    # per-object bar while the child runs
+    object_task = None
 
-    stdout, stderr = await process.communicate()
+    def on_progress(update: Dict[str, Any]) -> None:
+        nonlocal object_task
+        if object_task is None:
+            object_task = progress.add_task(f"[cyan]{source_object}", total=update['total'])
+        progress.update(object_task, completed=update['done'], total=update['total'])
 
-    # Logging both stdout and stderr
-    if stdout:
-        logger.info(f"[{source_object}] STDOUT: {stdout.decode().strip()}")
-    if stderr:
-        logger.error(f"[{source_object}] STDERR: {stderr.decode().strip()}")
+    returncode, stdout_tail, stderr_tail = await stream_process(
+        cmd,
+        on_stdout=lambda line: logger.info(f"[{source_object}] STDOUT: {line}"),
+        on_stderr=lambda line: logger.error(f"[{source_object}] STDERR: {line}"),
+        on_progress=on_progress
+    )
+    if object_task is not None:
+        progress.remove_task(object_task)
 
     progress.update(progress_task_id, advance=1)
 
-    if process.returncode == 0:
-        msg = stdout.decode().strip()
+    if returncode == 0:
+        msg = "\n".join(stdout_tail).strip()
         progress.console.print(f":white_check_mark: [green]{source_object} succeeded.[/green]")
         return (source_object, "Success", msg)
     else:
-        msg = stderr.decode().strip()
+        msg = "\n".join(stderr_tail).strip()
         error_message = f"{source_object}: {msg}"
         error_log.append(error_message)
         progress.console.print(f":x: [red]{source_object} failed[/red]: {msg}")
         return (source_object, "Failed", msg)
 
 
+async def run_in_process(
+        source_object: str,
+        progress_task_id: int,
+        progress,
+        error_log: List[str],
+        extra_params: List[str],
+        connection=None,
+        executor: Optional[WorkerPool] = None,
+        http_limiter=None,
+) -> Tuple[str, str, str]:
+    """
+    Like run_query, but calls download_functions.download_object directly: in a
+    thread on the shared connection and http_limiter, or in executor's worker
+    processes. Either way its progress drives a per-object bar.
+    Returns a tuple: (object, status, message)
+    """
+    import download_functions
+    argv = ['-q', f"SELECT Id FROM {source_object}", '-so', source_object] + extra_params
+    logger.info(f"Running in-process: {' '.join(argv)}")
+    progress.console.print(f":rocket: [cyan]Running:[/cyan] {source_object}")
+    object_task = None
+
+    def on_progress(done: int, total: int) -> None:
+        nonlocal object_task
+        if object_task is None:
+            object_task = progress.add_task(f"[cyan]{source_object}", total=total)
+        progress.update(object_task, completed=done, total=total)
+
+    def run_in_thread():
+        set_progress_handler(on_progress)
+        try:
+            return download_functions.download_object(argv, connection, http_limiter)
+        finally:
+            set_progress_handler(None)
+
+    try:
+        if executor:
+            stats = await executor.run(on_progress, download_functions.download_object, argv)
+        else:
+            stats = await asyncio.to_thread(run_in_thread)
+    except BaseException as ex:
+        # preflight_checks exits on fatal errors; that must not end the whole batch
+        if isinstance(ex, (KeyboardInterrupt, asyncio.CancelledError)):
+            raise
+        logger.error(f"[{source_object}] failed: {ex}", exc_info=True)
+        msg = f"exited with status {ex.code}, see {LOG_FILE}" if isinstance(ex, SystemExit) else str(ex)
+        error_log.append(f"{source_object}: {msg}")
+        progress.console.print(f":x: [red]{source_object} failed[/red]: {msg}")
+        return (source_object, "Failed", msg)
+    finally:
+        if object_task is not None:
+            progress.remove_task(object_task)
+        progress.update(progress_task_id, advance=1)
+
+    msg = "No files to download"
+    if stats and stats["total"] > 0:
+        msg = f"{stats['success']} succeeded, {stats['failed']} failed, {stats['skipped']} skipped"
+    progress.console.print(f":white_check_mark: [green]{source_object} succeeded.[/green]")
+    return (source_object, "Success", msg)
+
+
 def prepare_output_directory(config: configparser.ConfigParser) -> None:
     """
     Prepares (and if configured, clears) the output directory for file exports.
@@ -171,6 +243,9 @@ Examples:
   # CLI mode with custom filename pattern (linked entity name in path)
   python download.py --mode cli -q "SELECT Id FROM Account" -so Account -f "{0}{4}/{1}-{2}.{3}"
 
+  # Async engine for high-concurrency downloads of many small files
+  python download.py --mode cli -q "SELECT Id FROM Case" -so Case --engine async
+
   # Download + immediate deploy
   python download.py --mode cli -q "SELECT Id FROM Case LIMIT 10" -so Case --deploy
         """
@@ -187,6 +262,17 @@ Examples:
                         help="Filename pattern: {0}=output_dir, {1}=content_doc_id, {2}=title, {3}=extension, {4}=linked_entity_name, {5}=version_number")
     parser.add_argument("-fe", "--filter_file_extension", metavar='FILTER', default=None,
                         help="Filter by file type, e.g. \"'EXCEL_M', 'EXCEL'\" (Salesforce FileType values)")
+    parser.add_argument("-e", "--engine", choices=['thread', 'async'], default='thread',
+                        help="Download engine: 'thread' (default) or 'async' (aiohttp, high concurrency for many small files)")
+    parser.add_argument("--verify", action='store_true',
+                        help="Rehash every existing file instead of trusting the download manifest")
+    parser.add_argument("--full", action='store_true',
+                        help="Ignore incremental watermarks and process every file")
+    parser.add_argument("-p", "--parallel", metavar='N', type=int, default=None,
+                        help="Objects downloaded at once in batch mode (default: object_parallelism from config.ini)")
+    parser.add_argument("--runner", choices=['subprocess', 'inprocess', 'process'], default=None,
+                        help="Batch mode: 'subprocess' per object (default), 'inprocess' (threads sharing one "
+                             "login) or 'process' (worker pool, one login per worker); default: runner in config.ini")
     parser.add_argument("--deploy", action='store_true',
                         help="Run deploy automatically after download completes")
     parser.add_argument("--extra", nargs=argparse.REMAINDER,
@@ -208,6 +294,7 @@ def run_cli_mode(args, config: configparser.ConfigParser) -> bool:
         f"[cyan]Query:[/cyan] {args.query}",
         f"[cyan]Object Type:[/cyan] {args.object}",
         f"[cyan]Filename Pattern:[/cyan] {args.filenamepattern}",
+        f"[cyan]Engine:[/cyan] {args.engine}",
     ]
     if args.filter_file_extension:
         config_items.append(f"[cyan]File Extension Filter:[/cyan] {args.filter_file_extension}")
@@ -231,6 +318,12 @@ def run_cli_mode(args, config: configparser.ConfigParser) -> bool:
     ]
     if args.filter_file_extension:
         cmd.extend(['-fe', args.filter_file_extension])
+    if args.engine != 'thread':
+        cmd.extend(['-e', args.engine])
+    if args.verify:
+        cmd.append('--verify')
+    if args.full:
+        cmd.append('--full')
     logger.info(f"CLI mode command: {' '.join(cmd)}")
     console.print(f":rocket: [cyan]Running:[/cyan] {' '.join(cmd)}")
     console.print()
@@ -264,7 +357,13 @@ async def run_batch_mode(args, config: configparser.ConfigParser) -> None:
     Run batch mode - process objects from object_mapping.csv with Rich UI.
     """
     console = Console()
-    extra_params = args.extra
+    extra_params = list(args.extra)
+    if args.engine != 'thread':
+        extra_params = ['-e', args.engine] + extra_params
+    if args.verify:
+        extra_params = ['--verify'] + extra_params
+    if args.full:
+        extra_params = ['--full'] + extra_params
 
     logger.info("Starting batch mode with extra_params=%s", extra_params)
 
@@ -300,14 +399,62 @@ async def run_batch_mode(args, config: configparser.ConfigParser) -> None:
         transient=True  # Remove bar after done
     )
 
+    # Bounded object-level concurrency: at most `parallelism` objects at once, which
+    # together keep at most `http_budget` HTTP requests in flight
+    parallelism = args.parallel or int(config['salesforce'].get('object_parallelism', '4'))
+    parallelism = max(1, min(parallelism, total_objects))
+    http_budget = int(config['salesforce'].get('http_request_budget', '64'))
+    scheduled = schedule_objects(object_names, load_history())
+    logger.info(f"Downloading {total_objects} objects, {parallelism} at a time within {http_budget} "
+                f"requests, in order: {', '.join(scheduled)}")
+    durations: Dict[str, float] = {}
+
+    # 'subprocess' starts download_functions.py per object; 'inprocess' runs objects
+    # in threads on one shared login; 'process' in a pool of worker processes that
+    # log in once each. The last two draw every request from one shared limiter, so
+    # the budget of a finished object goes to the objects still running; a subprocess
+    # gets a fixed budget / parallelism share
+    runner = args.runner or config['salesforce'].get('runner', 'subprocess') or 'subprocess'
+    connection = None
+    executor = None
+    http_limiter = None
+    if runner == 'inprocess':
+        import download_functions
+        connection = download_functions.open_connection(config, pool_size=http_budget)
+        http_limiter = threading.BoundedSemaphore(http_budget)
+    elif runner == 'process':
+        import download_functions
+        mp_context = multiprocessing.get_context()
+        executor = WorkerPool(
+            max_workers=parallelism, initializer=download_functions.init_worker,
+            initargs=(http_budget, mp_context.BoundedSemaphore(http_budget)), mp_context=mp_context)
+    elif runner != 'subprocess':
+        console.print(f"[red]Invalid runner {runner}[/red]")
+        sys.exit(1)
+
+    async def run_object(obj: str) -> Tuple[str, str, str]:
+        start = time.monotonic()
+        if runner == 'subprocess':
+            object_params = ['-w', str(object_share(http_budget, parallelism))] + extra_params
+            result = await run_query(obj, task_id, progress, error_log, object_params)
+        else:
+            object_params = ['-w', str(http_budget)] + extra_params
+            result = await run_in_process(obj, task_id, progress, error_log, object_params,
+                                          connection, executor, http_limiter)
+        if result[1] == "Success":
+            durations[obj] = time.monotonic() - start
+        return result
+
     # Start progress bar and process all downloads
-    with progress:
-        task_id = progress.add_task("[blue]Downloading objects...", total=total_objects)
-        coros = [
-            run_query(obj, task_id, progress, error_log, extra_params)
-            for obj in object_names
-        ]
-        results = await asyncio.gather(*coros)
+    try:
+        with progress:
+            task_id = progress.add_task("[blue]Downloading objects...", total=total_objects)
+            results = await run_scheduled(scheduled, parallelism, run_object)
+    finally:
+        if executor:
+            executor.shutdown()
+    save_history(durations)
+    results = sorted(results, key=lambda result: object_names.index(result[0]))
 
     # Print summary table using rich
     table = Table(title="Migration Summary", show_lines=True)
@@ -4,14 +4,22 @@ import os
 import csv
 import logging
 import threading
+import queue
 import argparse
+import asyncio
 import configparser
 import time
-from typing import List, Dict, Any, Tuple, Generator, Optional
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Tuple, Generator, Iterable, Optional
 
 try:
     from simple_salesforce import Salesforce
+    import aiofiles
+    import aiohttp
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     from rich.console import Console
     from rich.progress import Progress, BarColumn, TimeElapsedColumn, TimeRemainingColumn, SpinnerColumn, TextColumn
 except ImportError as e:
@@ -19,6 +27,10 @@ except ImportError as e:
     exit(1)
 
 from filename_utils import create_filename, sanitize_filename
+from manifest import DownloadManifest, MANIFEST_FILE
+from bulk_query import Bulk2QueryClient
+from progress_channel import emit_progress, progress_enabled
+from session_cache import SESSION_CACHE_FILE, CachedSalesforce, renew_session
 
 LOG_FILE = 'download_functions.log'
 logging.basicConfig(
@@ -29,7 +41,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-csv_writer_lock = threading.Lock()
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+CASE_QUERY_CHUNK_SIZE = 500
+METADATA_QUEUE_SIZE = 4
+ASYNC_CONCURRENCY = 200
+WATERMARK_FILE = 'download_watermark.json'
+# Watermarks are moved back by this much to absorb clock skew with the org;
+# files in the overlap are skipped by checksum/manifest on the next run
+WATERMARK_OVERLAP = timedelta(minutes=10)
+_END_OF_BATCHES = object()
+_END_OF_ROWS = object()
+
 filename_lock = threading.Lock()
 used_filenames: Dict[str, int] = {}
 
@@ -56,6 +79,19 @@ def reserve_unique_filename(filename: str) -> str:
         return unique
 
 
+def release_filenames(folder_output_directory: Optional[str] = None) -> None:
+    """
+    Forgets the filenames reserved under folder_output_directory (all of them if
+    None), without touching downloads of other objects running in this process.
+    """
+    with filename_lock:
+        if not folder_output_directory:
+            used_filenames.clear()
+            return
+        for filename in [name for name in used_filenames if name.startswith(folder_output_directory)]:
+            del used_filenames[filename]
+
+
 def split_into_batches(items: List[Any], batch_size: int) -> Generator[List[Any], None, None]:
     full_list = list(items)
     for i in range(0, len(full_list), batch_size):
@@ -79,46 +115,120 @@ def preflight_checks(config: configparser.ConfigParser, folder_output_directory:
         exit(1)
 
 
-def fetch_case_fields(sf, case_id: str) -> Tuple[str, str]:
+def create_http_session(pool_size: int = 16, max_retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
     """
-    Returns (RecordType.Name, ContactId) for a given Case Id.
-    If not a Case or not found, returns ("", "").
+    Returns a keep-alive requests.Session whose connection pool is sized for
+    pool_size concurrent workers. Idempotent requests are retried with
+    exponential backoff on 429/5xx, honouring Retry-After.
     """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def file_md5(filename: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """
+    Returns the hex MD5 of a file on disk, reading it in chunks.
+    """
+    md5 = hashlib.md5()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def stream_to_file(response: Any, filename: str, expected_checksum: str = "",
+                   chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """
+    Writes a streamed response body to filename via a temporary .part file,
+    hashing each chunk as it is written. The temp file is only renamed into
+    place when the MD5 matches expected_checksum (if one is given).
+    Returns the hex MD5 of the written data; raises ValueError on mismatch.
+    """
+    temp_filename = filename + ".part"
+    md5 = hashlib.md5()
     try:
-        result = sf.query(
-            f"SELECT RecordType.Name, ContactId FROM Case WHERE Id = '{case_id}'"
-        )
-        if result['records']:
-            rec = result['records'][0]
-            rec_type = rec.get('RecordType', {}).get('Name', '')
-            contact_id = rec.get('ContactId', '')
-            return rec_type, contact_id
-    except Exception as e:
-        logger.warning(f"Failed to fetch Case fields for Id {case_id}: {e}")
-    return "", ""
+        with open(temp_filename, "wb") as output_file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    md5.update(chunk)
+                    output_file.write(chunk)
+        local_md5 = md5.hexdigest()
+        if expected_checksum and local_md5 != expected_checksum:
+            raise ValueError(f"Checksum mismatch (local={local_md5}, sf={expected_checksum})")
+        os.replace(temp_filename, filename)
+        return local_md5
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
 
 
-def download_file(args: Tuple) -> str:
-    (
-        record, folder_output_directory, sf, results_path,
-        content_document_links, content_document_id_name, filename_pattern
-    ) = args
+def build_link_index(
+    content_document_links: Iterable[Dict[str, Any]],
+    content_document_id_name: str = 'ContentDocumentId'
+) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Groups ContentDocumentLink (or ContentDocument) records by their document Id.
+    A document linked to several entities maps to all of its links, in query order.
+    Only (LinkedEntityId, LinkedEntityName) is kept per link, so the records can be
+    streamed in without holding the full query results in memory.
+    """
+    link_index: Dict[str, List[Tuple[str, str]]] = {}
+    for link in content_document_links:
+        linked_entity_id = link.get("LinkedEntityId", link.get("Id", "")) or ""
+        linked_entity_name = (link.get("LinkedEntity") or {}).get("Name", link.get("Title", "")) or ""
+        link_index.setdefault(link.get(content_document_id_name), []).append((linked_entity_id, linked_entity_name))
+    return link_index
+
+
+def fetch_case_fields(sf, case_ids: List[str], chunk_size: int = CASE_QUERY_CHUNK_SIZE) -> Dict[str, Tuple[str, str]]:
+    """
+    Returns {Case Id: (RecordType.Name, ContactId)} for the given Case Ids,
+    resolved with one IN (...) query per chunk_size Ids to stay within SOQL length limits.
+    Cases that are not found (or whose chunk fails) are left out of the result.
+    """
+    case_fields: Dict[str, Tuple[str, str]] = {}
+    for chunk in split_into_batches(case_ids, chunk_size):
+        try:
+            result = sf.query_all(
+                "SELECT Id, RecordType.Name, ContactId FROM Case WHERE Id IN (" +
+                ",".join("'" + case_id + "'" for case_id in chunk) + ")"
+            )
+            for rec in result['records']:
+                rec_type = (rec.get('RecordType') or {}).get('Name', '') or ''
+                contact_id = rec.get('ContactId', '') or ''
+                case_fields[rec['Id']] = (rec_type, contact_id)
+        except Exception as e:
+            logger.warning(f"Failed to fetch Case fields for {len(chunk)} Ids: {e}")
+    return case_fields
 
-    content_version_old_id = record.get("Id", "UNKNOWN")
+
+def prepare_download(
+    record: Dict[str, Any],
+    folder_output_directory: str,
+    link_index: Dict[str, List[Tuple[str, str]]],
+    case_fields: Dict[str, Tuple[str, str]],
+    filename_pattern: str
+) -> Tuple[str, List[Tuple[str, str, str, str, str]]]:
+    """
+    Resolves the mapping rows (one per link) for a ContentVersion record and reserves
+    its local filename. Returns (filename, link_rows), where each link row is
+    (LinkedEntityId, LinkedEntityName, LinkedEntityType, CaseRecordTypeName, CaseContactId).
+    """
     content_document_id = record.get("ContentDocumentId", "UNKNOWN")
-    title = record.get("Title", "UNKNOWN")
-    file_extension = record.get("FileExtension", "")
-    owner_id = record.get("OwnerId", "")
-    version_number = record.get("VersionNumber", "")
 
-    try:
-        # Find link info
-        content_document_link = next(
-            (cdl for cdl in content_document_links if cdl.get(content_document_id_name) == content_document_id),
-            {}
-        )
-        linked_entity_id = content_document_link.get("LinkedEntityId", content_document_link.get("Id", ""))
-        linked_entity_name = content_document_link.get("LinkedEntity", {}).get("Name", content_document_link.get("Title", ""))
+    # One mapping row per link; the file itself is only downloaded once
+    link_rows = []
+    for linked_entity_id, linked_entity_name in link_index.get(content_document_id) or [("", "")]:
 
         # Guess the type by Id prefix (Case: '500')
         linked_entity_type = ""
@@ -126,180 +236,693 @@ def download_file(args: Tuple) -> str:
         case_contact_id = ""
         if linked_entity_id and str(linked_entity_id).startswith('500'):
             linked_entity_type = "Case"
-            case_record_type_name, case_contact_id = fetch_case_fields(sf, linked_entity_id)
-        elif linked_entity_id:
-            linked_entity_type = ""  # Not used for non-Cases
-
-        filename = create_filename(
-            output_directory=folder_output_directory,
-            content_document_id=content_document_id,
-            title=title,
-            file_extension=file_extension,
-            linked_entity_name=linked_entity_name,
-            version_number=version_number,
-            filename_pattern=filename_pattern
+            case_record_type_name, case_contact_id = case_fields.get(linked_entity_id, ("", ""))
+
+        link_rows.append((linked_entity_id, linked_entity_name, linked_entity_type,
+                          case_record_type_name, case_contact_id))
+
+    # The filename pattern can only reference one entity, use the first link
+    filename = create_filename(
+        output_directory=folder_output_directory,
+        content_document_id=content_document_id,
+        title=record.get("Title", "UNKNOWN"),
+        file_extension=record.get("FileExtension", ""),
+        linked_entity_name=link_rows[0][1],
+        version_number=record.get("VersionNumber", ""),
+        filename_pattern=filename_pattern
+    )
+    return reserve_unique_filename(filename), link_rows
+
+
+def is_already_downloaded(filename: str, record: Dict[str, Any], manifest: Optional[DownloadManifest] = None) -> bool:
+    """
+    True if filename exists and matches the record's Checksum (or Salesforce sent none).
+    A manifest entry with unchanged size/mtime is trusted instead of rehashing the file.
+    """
+    if not os.path.exists(filename):
+        return False
+    sf_checksum = record.get("Checksum", "")
+    if not sf_checksum:
+        # No checksum from Salesforce, skip based on file existence
+        logging.debug(f"Skipped (file exists): {filename}")
+        return True
+    content_version_id = record.get("Id", "UNKNOWN")
+    if manifest and manifest.is_current(content_version_id, filename, sf_checksum):
+        logging.debug(f"Skipped (manifest match): {filename}")
+        return True
+    local_md5 = file_md5(filename)
+    if local_md5 == sf_checksum:
+        logging.debug(f"Skipped (checksum match): {filename}")
+        if manifest:
+            manifest.record(content_version_id, filename, local_md5)
+        return True
+    logging.info(f"Checksum mismatch for {filename}, re-downloading (local={local_md5}, sf={sf_checksum})")
+    return False
+
+
+def version_data_url(sf: Any, record: Dict[str, Any]) -> str:
+    # VersionData is a base64 field that Bulk API queries can't select, so the
+    # REST blob path is built from the ContentVersion Id when it is missing
+    path = record.get('VersionData') or (
+        f"/services/data/v{getattr(sf, 'sf_version', '59.0')}/sobjects/ContentVersion/{record.get('Id', '')}/VersionData"
+    )
+    return f"https://{getattr(sf, 'sf_instance', 'dummy.salesforce.com')}{path}"
+
+
+def mapping_rows(
+    record: Dict[str, Any],
+    filename: str,
+    link_rows: List[Tuple[str, str, str, str, str]]
+) -> List[List[str]]:
+    """
+    Returns the files.csv rows (one per link) for a downloaded (or skipped) file.
+    """
+    return [
+        [
+            record.get("Id", "UNKNOWN"), linked_entity_id, linked_entity_name,
+            record.get("ContentDocumentId", "UNKNOWN"), record.get("Title", "UNKNOWN"),
+            filename, filename,
+            linked_entity_type,      # Case or ""
+            case_record_type_name,   # If Case
+            case_contact_id,          # If Case
+            record.get("OwnerId", "")
+        ]
+        for (linked_entity_id, linked_entity_name, linked_entity_type,
+             case_record_type_name, case_contact_id) in link_rows
+    ]
+
+
+class MappingWriter:
+    """
+    Appends rows to files.csv from a single writer thread that keeps the file open.
+    write_rows only enqueues, so download workers never wait on file I/O; the handle
+    is flushed whenever the queue drains and on close().
+    """
+
+    def __init__(self, results_path: str, flush_interval: float = 1.0):
+        self.results_path = results_path
+        self.flush_interval = flush_interval
+        self.rows: queue.Queue = queue.Queue()
+        self.results_csv = open(results_path, 'a', encoding='UTF-8', newline='')
+        self.filewriter = csv.writer(self.results_csv, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write_rows(self, rows: List[List[str]]) -> None:
+        self.rows.put(rows)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                rows = self.rows.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.results_csv.flush()
+                continue
+            if rows is _END_OF_ROWS:
+                break
+            try:
+                self.filewriter.writerows(rows)
+            except Exception as ex:
+                logger.error(f"Error writing CSV rows to {self.results_path}: {ex}")
+            if self.rows.empty():
+                self.results_csv.flush()
+
+    def close(self) -> None:
+        """
+        Writes every queued row and closes the file. Safe to call more than once.
+        """
+        if self.results_csv.closed:
+            return
+        self.rows.put(_END_OF_ROWS)
+        self.thread.join()
+        self.results_csv.close()
+
+    def __enter__(self) -> 'MappingWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def get_version_data(http: Any, sf: Any, url: str) -> Any:
+    """
+    Starts a streamed VersionData download, logging in again and retrying once
+    if the session has expired.
+    """
+    session_id = sf.session_id
+    response = http.get(url, headers={"Authorization": "OAuth " + session_id,
+                                      "Content-Type": "application/octet-stream"}, stream=True)
+    if response.status_code == 401 and renew_session(sf, session_id):
+        response.close()
+        response = http.get(url, headers={"Authorization": "OAuth " + sf.session_id,
+                                          "Content-Type": "application/octet-stream"}, stream=True)
+    return response
+
+
+def download_file(args: Tuple) -> str:
+    (
+        record, folder_output_directory, sf, mapping_writer,
+        link_index, content_document_id_name, filename_pattern, http_session, case_fields, manifest
+    ) = args
+    http = http_session or requests
+    content_document_id = record.get("ContentDocumentId", "UNKNOWN")
+
+    try:
+        filename, link_rows = prepare_download(
+            record, folder_output_directory, link_index, case_fields, filename_pattern
         )
-        filename = reserve_unique_filename(filename)
 
         # Skip if file exists and checksum matches (no point re-downloading identical files)
-        skipped = False
-        if os.path.exists(filename):
-            sf_checksum = record.get("Checksum", "")
-            if sf_checksum:
-                with open(filename, "rb") as f:
-                    local_md5 = hashlib.md5(f.read()).hexdigest()
-                if local_md5 == sf_checksum:
-                    logging.debug(f"Skipped (checksum match): {filename}")
-                    skipped = True
-                else:
-                    logging.info(f"Checksum mismatch for {filename}, re-downloading (local={local_md5}, sf={sf_checksum})")
-            else:
-                # No checksum from Salesforce, skip based on file existence
-                logging.debug(f"Skipped (file exists): {filename}")
-                skipped = True
+        skipped = is_already_downloaded(filename, record, manifest)
 
         if not skipped:
-            url = f"https://{getattr(sf, 'sf_instance', 'dummy.salesforce.com')}{record.get('VersionData', '')}"
+            url = version_data_url(sf, record)
 
             logging.debug("Downloading from " + url)
-            response = requests.get(url, headers={"Authorization": "OAuth " + sf.session_id,
-                                                  "Content-Type": "application/octet-stream"})
-            if response.ok:
-                try:
-                    with open(filename, "wb") as output_file:
-                        output_file.write(response.content)
-                    logger.info(f"Saved file to {filename}")
-                except Exception as ex:
-                    logger.error(f"Error saving file {filename}: {ex}")
-                    return f"Error saving file {filename}: {ex}"
-            else:
-                msg = f"Couldn't download {url}. Status: {response.status_code}"
-                logger.error(msg)
-                return msg
+            with get_version_data(http, sf, url) as response:
+                if response.ok:
+                    try:
+                        local_md5 = stream_to_file(response, filename, record.get("Checksum", ""))
+                        if manifest:
+                            manifest.record(record.get("Id", "UNKNOWN"), filename, local_md5)
+                        logger.info(f"Saved file to {filename}")
+                    except Exception as ex:
+                        logger.error(f"Error saving file {filename}: {ex}")
+                        return f"Error saving file {filename}: {ex}"
+                else:
+                    msg = f"Couldn't download {url}. Status: {response.status_code}"
+                    logger.error(msg)
+                    return msg
 
         # Write file entry to csv (for both downloaded and skipped files)
-        with csv_writer_lock:
-            try:
-                with open(results_path, 'a', encoding='UTF-8', newline='') as results_csv:
-                    filewriter = csv.writer(results_csv, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-                    filewriter.writerow([
-                        content_version_old_id, linked_entity_id, linked_entity_name, content_document_id, title,
-                        filename, filename,
-                        linked_entity_type,      # Case or ""
-                        case_record_type_name,   # If Case
-                        case_contact_id,          # If Case
-                        owner_id
-                    ])
-            except Exception as ex:
-                logger.error(f"Error writing CSV for {filename}: {ex}")
-                return f"Error writing CSV for {filename}: {ex}"
+        mapping_writer.write_rows(mapping_rows(record, filename, link_rows))
         return "Skipped" if skipped else f"Saved file to {filename}"
     except Exception as ex:
         logger.error(f"Exception downloading file {content_document_id}: {ex}")
         return f"Exception: {ex}"
 
 
+def soql_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def read_watermark(folder_output_directory: str) -> Optional[str]:
+    """
+    Returns the SOQL datetime of the last successful run into folder_output_directory,
+    or None. The watermark lives next to the manifest, so clearing the output folder
+    also clears it; it is ignored without a manifest, as the files it vouches for
+    are then gone.
+    """
+    path = os.path.join(folder_output_directory, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    if not os.path.exists(os.path.join(folder_output_directory, MANIFEST_FILE)):
+        logger.warning(f"Ignoring watermark {path}: no {MANIFEST_FILE} next to it")
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('modified_since')
+    except Exception as ex:
+        logger.warning(f"Ignoring unreadable watermark {path}: {ex}")
+        return None
+
+
+def write_watermark(folder_output_directory: str, object_name: str, run_started: datetime) -> str:
+    """
+    Stores the high-water mark of object_name in its output folder after a successful
+    run, replaced atomically.
+    """
+    os.makedirs(folder_output_directory, exist_ok=True)
+    modified_since = soql_datetime(run_started - WATERMARK_OVERLAP)
+    path = os.path.join(folder_output_directory, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'object': object_name, 'modified_since': modified_since}, f, indent=2)
+    os.replace(path + '.tmp', path)
+    return modified_since
+
+
+def build_content_version_query(
+    document_ids: List[str],
+    file_extension_filter: Optional[str] = None,
+    modified_since: Optional[str] = None
+) -> str:
+    """
+    Returns the SOQL selecting the latest ContentVersion of each given ContentDocument Id,
+    optionally only those modified after the modified_since SOQL datetime.
+    """
+    if file_extension_filter:
+        query_string = (
+            "SELECT Id, ContentDocumentId, Title, FileExtension, OwnerId, VersionNumber, Checksum "
+            "FROM ContentVersion "
+            f"WHERE IsLatest = True AND FileType IN ({file_extension_filter})"
+        )
+    else:
+        query_string = (
+            "SELECT Id, ContentDocumentId, Title, FileExtension, OwnerId, VersionNumber, Checksum "
+            "FROM ContentVersion "
+            "WHERE IsLatest = True AND FileExtension != 'snote'"
+        )
+
+    if modified_since:
+        query_string += f" AND SystemModstamp > {modified_since}"
+
+    return (
+        query_string +
+        ' AND ContentDocumentId in (' +
+        ",".join("'" + document_id + "'" for document_id in document_ids) +
+        ') ORDER BY CreatedDate ASC'
+    )
+
+
+def classify_result(result: Optional[str]) -> str:
+    """
+    Maps a download_file result message to 'success', 'skipped' or 'failed'.
+    """
+    if result and result.startswith("Saved"):
+        return "success"
+    if result and result.startswith("Skipped"):
+        return "skipped"
+    return "failed"
+
+
+def create_progress() -> Progress:
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        "[progress.percentage]{task.percentage:>3.0f}%",
+        TextColumn("{task.completed}/{task.total}"),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+        console=Console(force_terminal=True),
+        # Under an orchestrator the bar would only be noise in a pipe; it reads
+        # emit_progress lines instead
+        disable=progress_enabled(),
+    )
+
+
+def query_batches(
+    sf: Any,
+    batches: List[List[str]],
+    link_index: Dict[str, List[Tuple[str, str]]],
+    case_fields: Dict[str, Tuple[str, str]],
+    batch_queue: queue.Queue,
+    stop_event: threading.Event,
+    file_extension_filter: Optional[str] = None,
+    modified_since: Optional[str] = None,
+    metadata_client: Any = None
+) -> None:
+    """
+    Producer for fetch_files: runs the ContentVersion query for each batch, resolves
+    the batch's Case fields into case_fields and puts the records on batch_queue.
+    Always finishes with _END_OF_BATCHES, or with the exception that stopped it.
+    metadata_client (default sf) only needs a query_all_iter method, e.g. Bulk2QueryClient.
+    """
+    metadata_client = metadata_client or sf
+    def put(item) -> bool:
+        # Blocks while the queue is full, but gives up once the consumer has stopped
+        while not stop_event.is_set():
+            try:
+                batch_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    queried_case_ids: set = set()
+    try:
+        for i, batch in enumerate(batches, 1):
+            logging.info("Processing batch {0}/{1}".format(i, len(batches)))
+
+            # query_all_iter follows nextRecordsUrl, so large batches are never truncated
+            records = list(metadata_client.query_all_iter(
+                build_content_version_query(batch, file_extension_filter, modified_since)))
+            logging.debug("Content Version Query found {0} results".format(len(records)))
+
+            if not records:
+                logging.info(f"No files found in batch {i}")
+                continue
+
+            # Resolve Case RecordType/ContactId for the whole batch in bulk
+            case_ids = {
+                linked_entity_id
+                for record in records
+                for linked_entity_id, _ in link_index.get(record.get("ContentDocumentId"), [])
+                if linked_entity_id.startswith('500')
+            } - queried_case_ids
+            if case_ids:
+                case_fields.update(fetch_case_fields(sf, sorted(case_ids)))
+                queried_case_ids.update(case_ids)
+
+            if not put(records):
+                return
+        put(_END_OF_BATCHES)
+    except Exception as ex:
+        logger.error(f"Exception querying ContentVersion batches: {ex}")
+        put(ex)
+
+
 def fetch_files(
     sf: Any,
-    content_document_links: Optional[List[Dict[str, Any]]] = None,
+    content_document_links: Optional[Iterable[Dict[str, Any]]] = None,
     folder_output_directory: Optional[str] = None,
     results_path: Optional[str] = None,
     filename_pattern: Optional[str] = None,
     content_document_id_name: str = 'ContentDocumentId',
     batch_size: int = 100,
-    file_extension_filter: Optional[str] = None
+    file_extension_filter: Optional[str] = None,
+    http_session: Optional[requests.Session] = None,
+    max_workers: Optional[int] = None,
+    manifest: Optional[DownloadManifest] = None,
+    modified_since: Optional[str] = None,
+    link_index: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+    metadata_client: Any = None,
+    http_limiter: Any = None
 ) -> None:
-    batches = list(split_into_batches(content_document_links or [], batch_size))
-    used_filenames.clear()
+    # http_limiter (a threading or multiprocessing semaphore) is the in-flight
+    # request budget download.py shares between the objects of a batch run.
+    # Index links once per run; batch over distinct documents so a document
+    # linked to several entities is only queried and downloaded once
+    if link_index is None:
+        link_index = build_link_index(content_document_links or [], content_document_id_name)
+    batches = list(split_into_batches(link_index.keys(), batch_size))
+    release_filenames(folder_output_directory)
+
+    case_fields: Dict[str, Tuple[str, str]] = {}
+    batch_queue: queue.Queue = queue.Queue(maxsize=METADATA_QUEUE_SIZE)
+    stop_event = threading.Event()
 
-    # Count total files across all batches for progress bar
+    start_time = time.time()
     total_files = 0
-    batch_records: List[List[Dict[str, Any]]] = []
-    for i, batch in enumerate(batches, 1):
-        logging.info("Processing batch {0}/{1}".format(i, len(batches)))
-
-        if file_extension_filter:
-            query_string = (
-                "SELECT Id, ContentDocumentId, Title, VersionData, FileExtension, OwnerId, VersionNumber, Checksum "
-                "FROM ContentVersion "
-                f"WHERE IsLatest = True AND FileType IN ({file_extension_filter})"
-            )
-        else:
-            query_string = (
-                "SELECT Id, ContentDocumentId, Title, VersionData, FileExtension, OwnerId, VersionNumber, Checksum "
-                "FROM ContentVersion "
-                "WHERE IsLatest = True AND FileExtension != 'snote'"
-            )
+    counts = {"success": 0, "failed": 0, "skipped": 0}
 
-        batch_query = (
-            query_string +
-            ' AND ContentDocumentId in (' +
-            ",".join("'" + item[content_document_id_name] + "'" for item in batch) +
-            ') ORDER BY CreatedDate ASC'
-        )
+    progress = create_progress()
+
+    def download_with_budget(download_args: Tuple) -> str:
+        with http_limiter:
+            return download_file(download_args)
+
+    def record_results(futures) -> None:
+        for future in futures:
+            result = future.result()
+            logging.debug(result)
+            counts[classify_result(result)] += 1
+            progress.advance(task_id)
+            emit_progress(sum(counts.values()), total_files)
+
+    # Batch queries run in a background producer while one long-lived pool
+    # downloads; the next batch is only taken once in-flight work drops below
+    # max_in_flight, so the bounded queue throttles the producer
+    producer = threading.Thread(
+        target=query_batches,
+        args=(sf, batches, link_index, case_fields, batch_queue, stop_event, file_extension_filter, modified_since,
+              metadata_client),
+        daemon=True
+    )
+    # Same default as ThreadPoolExecutor when max_workers is not configured
+    workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    max_in_flight = max(batch_size, workers * 2)
+    mapping_writer = MappingWriter(results_path)
+    producer.start()
+    try:
+        with progress, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            task_id = progress.add_task("[cyan]Downloading files...", total=0)
+            pending: set = set()
 
-        query_response = sf.query(batch_query)
-        records = query_response.get("records", [])
-        logging.debug("Content Version Query found {0} results".format(len(records)))
+            while True:
+                if len(pending) >= max_in_flight:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    record_results(done)
+                    continue
+                try:
+                    records = batch_queue.get(timeout=0.1)
+                except queue.Empty:
+                    done, pending = concurrent.futures.wait(pending, timeout=0)
+                    record_results(done)
+                    continue
+                if records is _END_OF_BATCHES:
+                    break
+                if isinstance(records, Exception):
+                    raise records
 
-        if not records:
-            logging.info(f"No files found in batch {i}")
-            batch_records.append([])
-            continue
+                total_files += len(records)
+                progress.update(task_id, total=total_files)
+                pending.update(
+                    executor.submit(download_with_budget if http_limiter else download_file, (
+                        record, folder_output_directory, sf, mapping_writer, link_index, content_document_id_name,
+                        filename_pattern, http_session, case_fields, manifest
+                    )) for record in records
+                )
 
-        batch_records.append(records)
-        total_files += len(records)
+            record_results(concurrent.futures.as_completed(pending))
+            emit_progress(sum(counts.values()), total_files, force=True)
+    finally:
+        # Also reached on Ctrl-C, so every row of a finished download is flushed
+        stop_event.set()
+        producer.join()
+        mapping_writer.close()
 
     if not total_files:
         logging.info("No files to download")
         return {"total": 0, "success": 0, "failed": 0, "skipped": 0, "duration": 0.0}
 
+    duration = time.time() - start_time
+    logging.info('All batches complete')
+    return {"total": total_files, "success": counts["success"], "failed": counts["failed"],
+            "skipped": counts["skipped"], "duration": duration}
+
+
+async def stream_to_file_async(response: Any, filename: str, expected_checksum: str = "",
+                              chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """
+    Async counterpart of stream_to_file for an aiohttp response, writing through aiofiles.
+    """
+    temp_filename = filename + ".part"
+    md5 = hashlib.md5()
+    try:
+        async with aiofiles.open(temp_filename, "wb") as output_file:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if chunk:
+                    md5.update(chunk)
+                    await output_file.write(chunk)
+        local_md5 = md5.hexdigest()
+        if expected_checksum and local_md5 != expected_checksum:
+            raise ValueError(f"Checksum mismatch (local={local_md5}, sf={expected_checksum})")
+        os.replace(temp_filename, filename)
+        return local_md5
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+async def download_file_async(
+    record: Dict[str, Any],
+    folder_output_directory: str,
+    sf: Any,
+    mapping_writer: MappingWriter,
+    link_index: Dict[str, List[Tuple[str, str]]],
+    filename_pattern: str,
+    http_session: Any,
+    case_fields: Dict[str, Tuple[str, str]],
+    manifest: Optional[DownloadManifest] = None,
+    max_retries: int = 3,
+    backoff_factor: float = 0.5
+) -> str:
+    """
+    Async counterpart of download_file using an aiohttp ClientSession. Returns the
+    same result messages, so classify_result applies unchanged.
+    """
+    content_document_id = record.get("ContentDocumentId", "UNKNOWN")
+
+    try:
+        filename, link_rows = prepare_download(
+            record, folder_output_directory, link_index, case_fields, filename_pattern
+        )
+
+        # Hashing an existing file is blocking disk I/O, keep it off the event loop
+        skipped = await asyncio.to_thread(is_already_downloaded, filename, record, manifest)
+
+        if not skipped:
+            url = version_data_url(sf, record)
+            session_id = sf.session_id
+            headers = {"Authorization": "OAuth " + session_id, "Content-Type": "application/octet-stream"}
+
+            logging.debug("Downloading from " + url)
+            attempt = 0
+            renewed = False
+            while True:
+                async with http_session.get(url, headers=headers) as response:
+                    if response.status == 401 and not renewed:
+                        # Session expired mid-run: log in again (once) and retry
+                        renewed = await asyncio.to_thread(renew_session, sf, session_id)
+                        if renewed:
+                            session_id = sf.session_id
+                            headers["Authorization"] = "OAuth " + session_id
+                            continue
+                    if response.status in RETRY_STATUS_CODES and attempt < max_retries:
+                        retry_after = response.headers.get("Retry-After", "")
+                        delay = float(retry_after) if retry_after.isdigit() else backoff_factor * (2 ** attempt)
+                        logging.info(f"Status {response.status} for {url}, retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                    if response.status != 200:
+                        msg = f"Couldn't download {url}. Status: {response.status}"
+                        logger.error(msg)
+                        return msg
+                    try:
+                        local_md5 = await stream_to_file_async(response, filename, record.get("Checksum", ""))
+                        if manifest:
+                            manifest.record(record.get("Id", "UNKNOWN"), filename, local_md5)
+                        logger.info(f"Saved file to {filename}")
+                    except Exception as ex:
+                        logger.error(f"Error saving file {filename}: {ex}")
+                        return f"Error saving file {filename}: {ex}"
+                    break
+
+        # Write file entry to csv (for both downloaded and skipped files)
+        mapping_writer.write_rows(mapping_rows(record, filename, link_rows))
+        return "Skipped" if skipped else f"Saved file to {filename}"
+    except Exception as ex:
+        logger.error(f"Exception downloading file {content_document_id}: {ex}")
+        return f"Exception: {ex}"
+
+
+async def acquire_shared(limiter: Any) -> None:
+    """
+    Acquires a threading/multiprocessing semaphore without blocking the event loop.
+    """
+    while not limiter.acquire(False):
+        await asyncio.sleep(0.01)
+
+
+async def fetch_files_async(
+    sf: Any,
+    content_document_links: Optional[Iterable[Dict[str, Any]]] = None,
+    folder_output_directory: Optional[str] = None,
+    results_path: Optional[str] = None,
+    filename_pattern: Optional[str] = None,
+    content_document_id_name: str = 'ContentDocumentId',
+    batch_size: int = 100,
+    file_extension_filter: Optional[str] = None,
+    concurrency: int = ASYNC_CONCURRENCY,
+    max_retries: int = 3,
+    http_session: Any = None,
+    manifest: Optional[DownloadManifest] = None,
+    modified_since: Optional[str] = None,
+    link_index: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+    metadata_client: Any = None,
+    http_limiter: Any = None
+) -> Dict[str, Any]:
+    """
+    Async engine for fetch_files: the same metadata producer feeds an aiohttp client
+    whose in-flight downloads are bounded by a semaphore of size concurrency, and
+    by http_limiter if given (see fetch_files).
+    """
+    if link_index is None:
+        link_index = build_link_index(content_document_links or [], content_document_id_name)
+    batches = list(split_into_batches(link_index.keys(), batch_size))
+    release_filenames(folder_output_directory)
+
+    case_fields: Dict[str, Tuple[str, str]] = {}
+    batch_queue: queue.Queue = queue.Queue(maxsize=METADATA_QUEUE_SIZE)
+    stop_event = threading.Event()
+
     start_time = time.time()
-    success_count = 0
-    failed_count = 0
-    skipped_count = 0
+    total_files = 0
+    counts = {"success": 0, "failed": 0, "skipped": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = create_progress()
 
-    progress = Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        "[progress.percentage]{task.percentage:>3.0f}%",
-        TextColumn("{task.completed}/{task.total}"),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
-        console=Console(force_terminal=True),
+    async def run_download(record: Dict[str, Any], session: Any) -> None:
+        # Taken inside the task: a task cancelled before it starts must not keep
+        # part of a budget other objects share
+        holds_budget = False
+        try:
+            if http_limiter:
+                await acquire_shared(http_limiter)
+                holds_budget = True
+            result = await download_file_async(
+                record, folder_output_directory, sf, mapping_writer, link_index,
+                filename_pattern, session, case_fields, manifest=manifest, max_retries=max_retries
+            )
+            logging.debug(result)
+            counts[classify_result(result)] += 1
+            progress.advance(task_id)
+            emit_progress(sum(counts.values()), total_files)
+        finally:
+            semaphore.release()
+            if holds_budget:
+                http_limiter.release()
+
+    producer = threading.Thread(
+        target=query_batches,
+        args=(sf, batches, link_index, case_fields, batch_queue, stop_event, file_extension_filter, modified_since,
+              metadata_client),
+        daemon=True
     )
+    mapping_writer = MappingWriter(results_path)
+    producer.start()
+    loop = asyncio.get_running_loop()
+    owns_session = http_session is None
+    if owns_session:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=300)
+        )
+    def next_batch() -> Any:
+        # Polls like fetch_files: if this coroutine is cancelled, stop_event is set and
+        # the producer may exit without putting anything, which a plain get() would wait on forever
+        while not stop_event.is_set():
+            try:
+                return batch_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END_OF_BATCHES
 
-    with progress:
-        task_id = progress.add_task("[cyan]Downloading files...", total=total_files)
+    try:
+        with progress:
+            task_id = progress.add_task("[cyan]Downloading files...", total=0)
+            tasks: set = set()
 
-        for i, (batch, records) in enumerate(zip(batches, batch_records), 1):
-            if not records:
-                continue
+            while True:
+                records = await loop.run_in_executor(None, next_batch)
+                if records is _END_OF_BATCHES:
+                    break
+                if isinstance(records, Exception):
+                    raise records
 
-            args_list = [
-                (
-                    record, folder_output_directory, sf, results_path, batch, content_document_id_name, filename_pattern
-                ) for record in records
-            ]
-
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                for result in executor.map(download_file, args_list):
-                    logging.debug(result)
-                    if result and result.startswith("Saved"):
-                        success_count += 1
-                    elif result and result.startswith("Skipped"):
-                        skipped_count += 1
-                    else:
-                        failed_count += 1
-                    progress.advance(task_id)
+                total_files += len(records)
+                progress.update(task_id, total=total_files)
+                for record in records:
+                    # Acquired here so the producer is throttled once concurrency is reached
+                    await semaphore.acquire()
+                    task = asyncio.create_task(run_download(record, http_session))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            emit_progress(sum(counts.values()), total_files, force=True)
+    finally:
+        stop_event.set()
+        if owns_session:
+            await http_session.close()
+        await loop.run_in_executor(None, producer.join)
+        mapping_writer.close()
+
+    if not total_files:
+        logging.info("No files to download")
+        return {"total": 0, "success": 0, "failed": 0, "skipped": 0, "duration": 0.0}
 
     duration = time.time() - start_time
     logging.info('All batches complete')
-    return {"total": total_files, "success": success_count, "failed": failed_count, "skipped": skipped_count, "duration": duration}
+    return {"total": total_files, "success": counts["success"], "failed": counts["failed"],
+            "skipped": counts["skipped"], "duration": duration}
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Export ContentVersion (Files) from Salesforce')
     parser.add_argument('-q', '--query', metavar='query', required=True,
                         help='SOQL to limit the valid ContentDocumentIds. Must return the Ids of parent objects.')
@@ -311,11 +934,32 @@ def main():
                         help='Source object for downloaded object')
     parser.add_argument('-fe', '--filter_file_extension', metavar='filter_file_extension', required=False, default=None,
                         help="Filter by file type, e.g. \"'EXCEL_M', 'EXCEL'\" (Salesforce FileType values)")
-    args, extra = parser.parse_known_args()
+    parser.add_argument('-e', '--engine', choices=['thread', 'async'], required=False, default='thread',
+                        help="Download engine: 'thread' (default, thread pool) or 'async' (aiohttp, for many small files)")
+    parser.add_argument('--verify', action='store_true',
+                        help='Rehash every existing file instead of trusting the download manifest')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the incremental watermark and process every file')
+    parser.add_argument('-w', '--workers', metavar='workers', type=int, required=False, default=None,
+                        help='Cap on concurrent downloads (thread workers or async transfers) and pooled '
+                             'connections; overrides max_workers/async_concurrency from config.ini')
+    return parser
 
+
+def load_config(config_path: str = 'config.ini') -> configparser.ConfigParser:
     config = configparser.ConfigParser(allow_no_value=True)
-    config.read('config.ini')
+    config.read(config_path)
+    return config
+
 
+def open_connection(
+    config: configparser.ConfigParser,
+    pool_size: Optional[int] = None
+) -> Tuple[Salesforce, requests.Session]:
+    """
+    Logs in to the source org. Returns the Salesforce client and the pooled
+    keep-alive session it uses for both SOQL queries and file downloads.
+    """
     username = config['salesforce']['source_username']
     password = config['salesforce']['source_password']
     token = config['salesforce']['source_security_token']
@@ -329,20 +973,45 @@ def main():
     if domain_config:
         domain = domain_config + '.my'
 
-    batch_size = int(config['salesforce']['batch_size'])
-    loglevel = logging.getLevelName(config['salesforce']['loglevel'])
-    output_directory = config['salesforce']['output_dir']
-    folder_output_directory = os.path.join(output_directory, args.sourceobject) + "/"
+    max_workers = int(config['salesforce'].get('max_workers', '16'))
+    http_pool_size = pool_size or int(config['salesforce'].get('http_pool_size', str(max_workers)))
+    http_max_retries = int(config['salesforce'].get('http_max_retries', '3'))
 
-    logging.getLogger().setLevel(loglevel)
-    logger.info('Export ContentVersion (Files) from Salesforce')
     logger.info('Username: ' + username)
     logger.info('Signing in at: https://' + domain + '.salesforce.com')
+    session_cache_file = config['salesforce'].get('session_cache_file', SESSION_CACHE_FILE)
+    http_session = create_http_session(pool_size=http_pool_size, max_retries=http_max_retries)
+    sf = CachedSalesforce(username=username, password=password, security_token=token, domain=domain,
+                          session=http_session, cache_path=session_cache_file)
+    logging.debug("Connected successfully to {0}".format(sf.sf_instance))
+    return sf, http_session
 
-    preflight_checks(config, folder_output_directory)
 
-    sf = Salesforce(username=username, password=password, security_token=token, domain=domain)
-    logging.debug("Connected successfully to {0}".format(sf.sf_instance))
+def run_download(
+    sf: Salesforce,
+    http_session: requests.Session,
+    config: configparser.ConfigParser,
+    args: argparse.Namespace,
+    http_limiter: Any = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Downloads the files of one object (args as parsed by build_parser) over an
+    already authenticated connection, within http_limiter's request budget if
+    given. Returns the download stats, or None if there was nothing to download.
+    """
+    batch_size = int(config['salesforce']['batch_size'])
+    max_workers = int(config['salesforce'].get('max_workers', '16'))
+    http_max_retries = int(config['salesforce'].get('http_max_retries', '3'))
+    async_concurrency = int(config['salesforce'].get('async_concurrency', str(ASYNC_CONCURRENCY)))
+    if args.workers:
+        # Batch mode passes each object its share of the global HTTP request budget
+        max_workers = async_concurrency = args.workers
+    query_backend = config['salesforce'].get('query_backend', 'rest') or 'rest'
+    incremental_enabled = config['salesforce'].get('incremental', 'False') == 'True'
+    output_directory = config['salesforce']['output_dir']
+    folder_output_directory = os.path.join(output_directory, args.sourceobject) + "/"
+
+    preflight_checks(config, folder_output_directory)
 
     logger.info('Output directory: ' + folder_output_directory)
     results_path = os.path.join(folder_output_directory, 'files.csv')
@@ -358,37 +1027,89 @@ def main():
         filewriter = csv.writer(results_csv, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
         filewriter.writerow(csv_header)
 
+    run_started = datetime.now(timezone.utc)
+    # --full still records a new watermark, it just doesn't use the previous one
+    modified_since = None
+    if incremental_enabled and not args.full:
+        modified_since = read_watermark(folder_output_directory)
+    if modified_since:
+        logger.info(f"Incremental run: only files changed since {modified_since}")
+        print(f"Incremental run: only files changed since {modified_since}")
+
     # Use generic SOQL for all objects, so no SOQL errors for non-Case objects
+    version_modified_since = None
     if args.object == 'ContentDocumentLink':
         content_document_query = (
             'SELECT ContentDocumentId, LinkedEntityId, LinkedEntity.Name, ContentDocument.Title, ContentDocument.FileExtension '
             'FROM ContentDocumentLink '
             f'WHERE LinkedEntityId in ({args.query}) AND ContentDocument.IsDeleted = false'
         )
+        if modified_since:
+            # New/changed links, or documents with a newer version
+            content_document_query += (
+                f' AND (SystemModstamp > {modified_since}'
+                f' OR ContentDocument.LatestPublishedVersion.SystemModstamp > {modified_since})'
+            )
         content_document_id_name = 'ContentDocumentId'
     elif args.object == 'ContentDocument':
         content_document_query = f'SELECT Id, Title, FileExtension FROM ContentDocument {args.query}'.strip()
         content_document_id_name = 'Id'
+        # The document query is free-form, so filter the ContentVersion batches instead
+        version_modified_since = modified_since
     else:
         raise ValueError(f'Invalid QueryType {args.object}')
 
-    content_document_links = sf.query_all(content_document_query)["records"]
-    logger.info("Found %s total files", len(content_document_links))
-    print(f"Found {len(content_document_links)} total files")
+    # Bulk API 2.0 extracts link/version metadata as CSV in far fewer API calls;
+    # each ContentVersion batch is one query job, so batches are made larger
+    metadata_client = sf
+    if query_backend == 'bulk':
+        metadata_client = Bulk2QueryClient.from_salesforce(sf)
+        batch_size = int(config['salesforce'].get('bulk_batch_size', '2000'))
+        logger.info(f"Using Bulk API 2.0 for metadata queries (batch size {batch_size})")
+    elif query_backend != 'rest':
+        raise ValueError(f'Invalid query_backend {query_backend}')
+
+    # Stream the links page by page straight into the compact index
+    link_index = build_link_index(metadata_client.query_all_iter(content_document_query), content_document_id_name)
+    logger.info("Found %s total files", len(link_index))
+    print(f"Found {len(link_index)} total files")
 
     # Get file extension filter from args or config
     file_extension_filter = args.filter_file_extension or config['salesforce'].get('default_file_extension_filter', '')
 
-    stats = fetch_files(
+    manifest = DownloadManifest(os.path.join(folder_output_directory, MANIFEST_FILE), verify=args.verify)
+
+    fetch_kwargs = dict(
         sf=sf,
-        content_document_links=content_document_links,
+        link_index=link_index,
         folder_output_directory=folder_output_directory,
         results_path=results_path,
         batch_size=batch_size,
         content_document_id_name=content_document_id_name,
         filename_pattern=args.filenamepattern,
-        file_extension_filter=file_extension_filter if file_extension_filter else None
+        file_extension_filter=file_extension_filter if file_extension_filter else None,
+        manifest=manifest,
+        modified_since=version_modified_since,
+        metadata_client=metadata_client,
+        http_limiter=http_limiter
     )
+    try:
+        if args.engine == 'async':
+            logger.info(f"Using async download engine (concurrency {async_concurrency})")
+            stats = asyncio.run(fetch_files_async(
+                concurrency=async_concurrency, max_retries=http_max_retries, **fetch_kwargs
+            ))
+        else:
+            stats = fetch_files(http_session=http_session, max_workers=max_workers, **fetch_kwargs)
+    finally:
+        manifest.close()
+
+    if incremental_enabled:
+        if stats and stats["failed"]:
+            logger.warning(f"{stats['failed']} files failed, keeping the previous watermark for {args.sourceobject}")
+        else:
+            watermark = write_watermark(folder_output_directory, args.sourceobject, run_started)
+            logger.info(f"Saved watermark {watermark} for {args.sourceobject}")
 
     if stats and stats["total"] > 0:
         duration = stats["duration"]
@@ -401,6 +1122,54 @@ def main():
     else:
         print("No files to download")
     print(f"Object Completed")
+    return stats
+
+
+# Connection and shared request budget of a ProcessPoolExecutor worker, set once by init_worker
+_worker_connection: Optional[Tuple[Salesforce, requests.Session]] = None
+_worker_limiter: Any = None
+
+
+def init_worker(pool_size: Optional[int] = None, http_limiter: Any = None) -> None:
+    """
+    ProcessPoolExecutor initializer: logs in once per worker process, so every
+    object the worker downloads reuses the same session. http_limiter is a
+    multiprocessing semaphore shared by all workers (see fetch_files).
+    """
+    global _worker_connection, _worker_limiter
+    _worker_connection = open_connection(load_config(), pool_size)
+    _worker_limiter = http_limiter
+
+
+def download_object(
+    argv: List[str],
+    connection: Optional[Tuple[Salesforce, requests.Session]] = None,
+    http_limiter: Any = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Runs one object download from download_functions.py command-line arguments,
+    on connection or this worker process's own (see init_worker). Lets download.py
+    run objects in-process without an interpreter start and login per object.
+    """
+    args, _ = build_parser().parse_known_args(argv)
+    sf, http_session = connection or _worker_connection
+    return run_download(sf, http_session, load_config(), args, http_limiter or _worker_limiter)
+
+
+def main():
+    args, extra = build_parser().parse_known_args()
+    config = load_config()
+
+    max_workers = int(config['salesforce'].get('max_workers', '16'))
+    http_pool_size = int(config['salesforce'].get('http_pool_size', str(max_workers)))
+    if args.workers:
+        http_pool_size = args.workers
+    loglevel = logging.getLevelName(config['salesforce']['loglevel'])
+    logging.getLogger().setLevel(loglevel)
+    logger.info('Export ContentVersion (Files) from Salesforce')
+
+    sf, http_session = open_connection(config, http_pool_size)
+    run_download(sf, http_session, config, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""
+Persistent record of downloaded files, so reruns can skip them without rehashing.
+"""
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+MANIFEST_FILE = 'download_manifest.sqlite'
+
+
+class DownloadManifest:
+    """
+    SQLite-backed index of ContentVersion Id -> (path, size, mtime, checksum).
+
+    An entry is trusted as long as the file on disk still has the recorded size
+    and mtime; anything else (or verify=True) falls back to a full rehash.
+    """
+
+    def __init__(self, db_path=MANIFEST_FILE, verify=False, commit_every=100):
+        self.db_path = db_path
+        self.verify = verify
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'content_version_id TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, checksum TEXT NOT NULL)'
+        )
+        self.conn.commit()
+
+    def lookup(self, content_version_id) -> Optional[Tuple[str, int, int, str]]:
+        with self.lock:
+            return self.conn.execute(
+                'SELECT path, size, mtime_ns, checksum FROM files WHERE content_version_id = ?',
+                (content_version_id,)
+            ).fetchone()
+
+    def is_current(self, content_version_id, path, checksum) -> bool:
+        """
+        True if the manifest says path already holds checksum and the file is unchanged since.
+        """
+        if self.verify:
+            return False
+        entry = self.lookup(content_version_id)
+        if not entry:
+            return False
+        recorded_path, size, mtime_ns, recorded_checksum = entry
+        if recorded_path != path or recorded_checksum != checksum:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+    def record(self, content_version_id, path, checksum):
+        stat = os.stat(path)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO files (content_version_id, path, size, mtime_ns, checksum) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (content_version_id, path, stat.st_size, stat.st_mtime_ns, checksum)
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.conn.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,99 @@
+"""
+Streams ContentVersion uploads as multipart/form-data, so large files are sent
+from disk in chunks instead of being base64-encoded into a JSON body.
+"""
+import io
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict
+
+from session_cache import renew_session
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartUploadError(Exception):
+    pass
+
+
+class MultipartBody:
+    """
+    File-like multipart/form-data body: a JSON part with the record fields, then
+    the file itself, read from disk only as the HTTP client asks for it. __len__
+    lets requests send a Content-Length header instead of chunked encoding.
+    """
+
+    def __init__(self, entity: Dict[str, Any], file_path: str, file_field='VersionData',
+                 entity_field='entity_content', boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', '%22')
+        head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{entity_field}"\r\n'
+            'Content-Type: application/json\r\n\r\n'
+            f'{json.dumps(entity)}\r\n'
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.length = len(head) + os.path.getsize(file_path) + len(tail)
+        self._parts = [io.BytesIO(head), open(file_path, 'rb'), io.BytesIO(tail)]
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size=-1) -> bytes:
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(UPLOAD_CHUNK_SIZE), b''))
+        chunks = []
+        while size > 0 and self._parts:
+            data = self._parts[0].read(size)
+            if not data:
+                self._parts.pop(0).close()
+                continue
+            chunks.append(data)
+            size -= len(data)
+        return b''.join(chunks)
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def upload_content_version(sf, entity: Dict[str, Any], file_path: str) -> Dict[str, Any]:
+    """
+    Creates a ContentVersion from entity (every field except VersionData) and the
+    file at file_path, streamed through sf's HTTP session. Returns the create
+    result, like sf.ContentVersion.create.
+    """
+    url = f"{sf.base_url}sobjects/ContentVersion/"
+    for attempt in range(2):
+        session_id = sf.session_id
+        with MultipartBody(entity, file_path) as body:
+            logger.info(f"Streaming {file_path} ({len(body)} bytes) as multipart/form-data")
+            response = sf.session.post(url, data=body, headers={
+                'Authorization': 'Bearer ' + session_id,
+                'Content-Type': body.content_type,
+            })
+        # An expired session is replaced once and the file streamed again
+        if response.status_code != 401 or attempt or not renew_session(sf, session_id):
+            break
+    if response.status_code >= 300:
+        raise MultipartUploadError(f"Multipart upload of {file_path} failed ({response.status_code}): {response.text}")
+    return response.json()
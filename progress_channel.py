@@ -0,0 +1,212 @@
+"""
+Line-based channel between the batch orchestrators (download.py, deploy.py) and
+their subprocesses: children print JSON progress lines on stdout, and parents
+stream child output line by line instead of buffering it until exit. Objects
+run in-process report through a per-thread callback instead, and objects run
+in a WorkerPool through a queue back to the orchestrator.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROGRESS_ENV = 'SF_FILES_PROGRESS'
+PROGRESS_PREFIX = '@@progress '
+PROGRESS_INTERVAL = 0.5
+TAIL_LINES = 50
+LINE_LIMIT = 1024 * 1024
+
+_emit_lock = threading.Lock()
+_last_emit = 0.0
+# In-process runs report through a callback set per thread instead of stdout
+_local = threading.local()
+
+
+def set_progress_handler(handler: Optional[Callable[[int, int], None]]) -> None:
+    """
+    Sends this thread's emit_progress calls to handler(done, total) (None to stop),
+    for orchestrators that run objects in their own process.
+    """
+    _local.handler = handler
+    _local.last_emit = 0.0
+
+
+def progress_enabled() -> bool:
+    """
+    True when running under an orchestrator that reads the progress channel.
+    """
+    return bool(os.environ.get(PROGRESS_ENV)) or getattr(_local, 'handler', None) is not None
+
+
+def emit_progress(done: int, total: int, force: bool = False) -> None:
+    """
+    Reports done/total to the orchestrator, at most once every PROGRESS_INTERVAL
+    seconds unless force. A no-op outside an orchestrator.
+    """
+    global _last_emit
+    handler = getattr(_local, 'handler', None)
+    if handler is not None:
+        now = time.monotonic()
+        if force or now - _local.last_emit >= PROGRESS_INTERVAL:
+            _local.last_emit = now
+            handler(done, total)
+        return
+    if not os.environ.get(PROGRESS_ENV):
+        return
+    with _emit_lock:
+        now = time.monotonic()
+        if not force and now - _last_emit < PROGRESS_INTERVAL:
+            return
+        _last_emit = now
+        sys.__stdout__.write(PROGRESS_PREFIX + json.dumps({'done': done, 'total': total}) + '\n')
+        sys.__stdout__.flush()
+
+
+def parse_progress(line: str) -> Optional[Dict[str, Any]]:
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+
+
+async def _read_lines(stream: asyncio.StreamReader, handle: Callable[[str], None]) -> None:
+    while True:
+        try:
+            raw = await stream.readline()
+        except ValueError:
+            # Longer than LINE_LIMIT: asyncio has dropped what it buffered of it
+            handle(f"[output line longer than {LINE_LIMIT} bytes truncated]")
+            continue
+        if not raw:
+            return
+        handle(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+
+async def stream_process(
+    cmd: List[str],
+    on_stdout: Optional[Callable[[str], None]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    tail_lines: int = TAIL_LINES
+) -> Tuple[int, List[str], List[str]]:
+    """
+    Runs cmd with the progress channel enabled, handing every stdout/stderr line to
+    on_stdout/on_stderr as it arrives and every progress update to on_progress.
+    Only the last tail_lines lines of each stream are kept in memory.
+    Returns (returncode, stdout_tail, stderr_tail).
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=dict(os.environ, **{PROGRESS_ENV: '1'}),
+        limit=LINE_LIMIT
+    )
+    stdout_tail: deque = deque(maxlen=tail_lines)
+    stderr_tail: deque = deque(maxlen=tail_lines)
+
+    def handle_stdout(line: str) -> None:
+        update = parse_progress(line)
+        if update is not None:
+            if on_progress:
+                on_progress(update)
+            return
+        stdout_tail.append(line)
+        if on_stdout:
+            on_stdout(line)
+
+    def handle_stderr(line: str) -> None:
+        stderr_tail.append(line)
+        if on_stderr:
+            on_stderr(line)
+
+    await asyncio.gather(_read_lines(process.stdout, handle_stdout), _read_lines(process.stderr, handle_stderr))
+    returncode = await process.wait()
+    return returncode, list(stdout_tail), list(stderr_tail)
+
+
+# Progress queue of a WorkerPool worker process, set by _init_pool_worker
+_worker_queue: Any = None
+
+
+def _init_pool_worker(progress_queue: Any, initializer: Optional[Callable[..., None]], initargs: Tuple) -> None:
+    global _worker_queue
+    _worker_queue = progress_queue
+    # The worker shares the orchestrator's terminal: its prints would land on the
+    # orchestrator's live display, so they are dropped (errors still go to stderr)
+    sys.stdout = open(os.devnull, 'w')
+    if initializer:
+        initializer(*initargs)
+
+
+def _run_in_pool_worker(key: int, func: Callable[..., Any], args: Tuple) -> Any:
+    set_progress_handler(lambda done, total: _worker_queue.put((key, done, total)))
+    try:
+        return func(*args)
+    finally:
+        set_progress_handler(None)
+
+
+class WorkerPool:
+    """
+    ProcessPoolExecutor for the orchestrators' process runner. Functions run with a
+    progress handler set, so instead of drawing their own progress bars and printing
+    onto the orchestrator's display, workers send their emit_progress calls back
+    through a queue to the on_progress callback given to run.
+    """
+
+    def __init__(self, max_workers: int, initializer: Optional[Callable[..., None]] = None,
+                 initargs: Tuple = (), mp_context: Any = None):
+        mp_context = mp_context or multiprocessing.get_context()
+        self._queue = mp_context.Queue()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context, initializer=_init_pool_worker,
+            initargs=(self._queue, initializer, initargs))
+        self._keys = itertools.count()
+        self._handlers: Dict[int, Callable[[int, int], None]] = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_progress, daemon=True)
+        self._reader.start()
+
+    def _read_progress(self) -> None:
+        while True:
+            update = self._queue.get()
+            if update is None:
+                return
+            key, done, total = update
+            with self._lock:
+                handler = self._handlers.get(key)
+                if handler is not None:
+                    handler(done, total)
+
+    async def run(self, on_progress: Optional[Callable[[int, int], None]], func: Callable[..., Any],
+                  *args: Any) -> Any:
+        """
+        Runs func(*args) in a worker process, calling on_progress(done, total) (from
+        another thread) until it returns.
+        """
+        key = next(self._keys)
+        if on_progress is not None:
+            with self._lock:
+                self._handlers[key] = on_progress
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, _run_in_pool_worker, key, func, args)
+        finally:
+            # Updates still in the queue must not reach a caller that has moved on
+            with self._lock:
+                self._handlers.pop(key, None)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+        self._queue.put(None)
+        self._reader.join()
@@ -1,20 +1,65 @@
+import atexit
 import threading
 import json
 import os
+import time
+
+def load_summary(json_path):
+    # Existing counts are kept (append mode); a missing or unreadable file starts empty
+    if not os.path.exists(json_path):
+        return {}
+    with open(json_path, 'r') as f:
+        try:
+            return json.load(f)
+        except Exception:
+            return {}
+
+
+def write_atomic(json_path, text):
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, json_path)
+
+
+def merge_summaries(paths, json_path):
+    """
+    Adds up the per-object summaries at paths (one per deploy subprocess) into
+    json_path and returns the merged summary.
+    """
+    merged = {}
+    for path in paths:
+        for object_name, counts in load_summary(path).items():
+            totals = merged.setdefault(object_name, {})
+            for category, count in counts.items():
+                totals[category] = totals.get(category, 0) + count
+    write_atomic(json_path, json.dumps(merged, indent=2))
+    return merged
+
 
 class DeployReporter:
-    def __init__(self, json_path='deploy_summary.json'):
+    """
+    Counts deploy outcomes per object and category, persisted to json_path.
+
+    By default every log() rewrites the file. With flush_every > 1 or a
+    flush_interval the counts are buffered and written once that many calls are
+    pending or that many seconds have passed, on flush(), and at exit. Each write
+    replaces the file atomically, so a crash loses at most the unflushed counts.
+    """
+
+    def __init__(self, json_path='deploy_summary.json', flush_every=1, flush_interval=None):
         self.json_path = json_path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
         self.lock = threading.Lock()
-        # Try to load existing data for append mode
-        if os.path.exists(self.json_path):
-            with open(self.json_path, 'r') as f:
-                try:
-                    self.data = json.load(f)
-                except Exception:
-                    self.data = {}
-        else:
-            self.data = {}
+        self.write_lock = threading.Lock()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._generation = 0
+        self._written = 0
+        self.data = load_summary(self.json_path)
+        if flush_every > 1 or flush_interval is not None:
+            atexit.register(self.flush)
 
     def log(self, object_name, category):
         with self.lock:
@@ -23,19 +68,53 @@ class DeployReporter:
             if category not in self.data[object_name]:
                 self.data[object_name][category] = 0
             self.data[object_name][category] += 1
-            self._save()
+            self._pending += 1
+            due = self._pending >= self.flush_every or (
+                self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes any buffered counts to json_path.
+        """
+        with self.lock:
+            if not self._pending:
+                return
+            snapshot = json.dumps(self.data, indent=2)
+            self._pending = 0
+            self._last_flush = time.monotonic()
+            self._generation += 1
+            generation = self._generation
+        # Serialized outside self.lock so log() never waits on disk; a snapshot
+        # older than one already written is dropped
+        with self.write_lock:
+            if generation < self._written:
+                return
+            self._written = generation
+            self._save(snapshot)
 
-    def _save(self):
-        with open(self.json_path, 'w') as f:
-            json.dump(self.data, f, indent=2)
+    def _save(self, snapshot):
+        write_atomic(self.json_path, snapshot)
+
+    def set_path(self, json_path):
+        """
+        Flushes pending counts, then continues with the counts stored at json_path.
+        """
+        self.flush()
+        with self.lock:
+            self.json_path = json_path
+            self.data = load_summary(json_path)
 
     def get_summary(self):
         # Returns dict: {object: {type: count, ...}, ...}
         return self.data
 
     def clear(self):
-        self.data = {}
+        with self.lock:
+            self.data = {}
+            self._pending = 0
         if os.path.exists(self.json_path):
             os.remove(self.json_path)
 
-reporter = DeployReporter()
+reporter = DeployReporter(flush_every=500, flush_interval=2.0)
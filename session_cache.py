@@ -0,0 +1,133 @@
+"""
+On-disk cache of Salesforce session ids, keyed by username and login domain, so
+the processes of one batch run reuse a session instead of each logging in, and
+a session that expires mid-run is replaced by logging in again.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import partial
+from typing import Any, Dict, Optional
+
+from simple_salesforce import Salesforce, SalesforceLogin
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_FILE = '.sf_session_cache.json'
+
+_cache_lock = threading.Lock()
+
+
+def cache_key(username: str, domain: str) -> str:
+    return f"{username}@{domain}"
+
+
+def load_sessions(cache_path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except Exception as ex:
+        logger.warning(f"Ignoring unreadable session cache {cache_path}: {ex}")
+        return {}
+
+
+def read_session(cache_path: str, username: str, domain: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached {'session_id', 'instance'} for username at domain, if any.
+    """
+    session = load_sessions(cache_path).get(cache_key(username, domain))
+    if session and session.get('session_id') and session.get('instance'):
+        return session
+    return None
+
+
+def write_session(cache_path: str, username: str, domain: str, session_id: str, instance: str) -> None:
+    """
+    Stores a session in the cache, keeping the entries of other users and orgs.
+    The file holds live credentials, so it is only readable by its owner.
+    """
+    with _cache_lock:
+        sessions = load_sessions(cache_path)
+        sessions[cache_key(username, domain)] = {
+            'session_id': session_id, 'instance': instance, 'stored_at': time.time()
+        }
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sessions, f, indent=2)
+        os.replace(tmp_path, cache_path)
+        os.chmod(cache_path, 0o600)
+
+
+class CachedSalesforce(Salesforce):
+    """
+    Salesforce client that starts from a cached session when there is one and
+    logs in with username/password/token otherwise, or once the session expires.
+    Every new session is written back to the cache for the next process.
+
+    Queries and record calls are retried by simple_salesforce itself after
+    INVALID_SESSION_ID; code that calls the API with session_id directly uses
+    renew_session.
+    """
+
+    def __init__(self, username: str, password: str, security_token: str, domain: str = 'login',
+                 cache_path: str = SESSION_CACHE_FILE, **kwargs: Any):
+        self._cache_path = cache_path
+        self._username = username
+        self._refresh_lock = threading.Lock()
+        cached = read_session(cache_path, username, domain) if cache_path else None
+        if cached:
+            logger.info(f"Reusing cached session for {username} at {cached['instance']}")
+            super().__init__(session_id=cached['session_id'], instance=cached['instance'], domain=domain, **kwargs)
+            # A client built from a session id can't log in again by itself
+            self._salesforce_login_partial = partial(
+                SalesforceLogin, session=self.session, username=username, password=password,
+                security_token=security_token, sf_version=self.sf_version, proxies=self.proxies, domain=self.domain)
+        else:
+            super().__init__(username=username, password=password, security_token=security_token, domain=domain,
+                             **kwargs)
+
+    def _refresh_session(self) -> None:
+        # Read from __dict__: Salesforce.__getattr__ turns unknown names into SObject types
+        stale_session_id = self.__dict__.get('session_id')
+        with self._refresh_lock:
+            if self.__dict__.get('session_id') != stale_session_id:
+                # Another thread logged in again while this one waited
+                return
+            cached = read_session(self._cache_path, self._username, self.domain) if self._cache_path else None
+            if stale_session_id and cached and cached['session_id'] != stale_session_id:
+                # Another process already replaced the expired session
+                logger.info("Session expired, switching to the session cached by another process")
+                self.session_id, self.sf_instance = cached['session_id'], cached['instance']
+                self._generate_headers()
+                return
+            if stale_session_id:
+                logger.info(f"Session expired, logging in again as {self._username}")
+            super()._refresh_session()
+            if self._cache_path:
+                write_session(self._cache_path, self._username, self.domain, self.session_id, self.sf_instance)
+
+    def renew_session(self, stale_session_id: str) -> str:
+        """
+        Replaces stale_session_id, unless another thread already has, and returns
+        the current session id.
+        """
+        if self.session_id == stale_session_id:
+            self._refresh_session()
+        return self.session_id
+
+
+def renew_session(sf: Any, stale_session_id: str) -> bool:
+    """
+    Asks sf for a new session after a request with stale_session_id got a 401.
+    Returns False if sf can't log in again (e.g. a plain Salesforce client).
+    """
+    renew = getattr(type(sf), 'renew_session', None)
+    if renew is None:
+        return False
+    renew(sf, stale_session_id)
+    return True
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from batch_schedule import load_history, object_share, run_scheduled, save_history, schedule_objects
+
+
+class TestHistory:
+    def test_missing_history_is_empty(self, tmp_path):
+        assert load_history(str(tmp_path / "history.json")) == {}
+
+    def test_save_merges_with_earlier_runs(self, tmp_path):
+        path = str(tmp_path / "history.json")
+        save_history({"Account": 10.0, "Case": 5.0}, path)
+        save_history({"Case": 7.5}, path)
+
+        assert load_history(path) == {"Account": 10.0, "Case": 7.5}
+        assert not (tmp_path / "history.json.tmp").exists()
+
+    def test_unreadable_history_is_ignored(self, tmp_path):
+        path = tmp_path / "history.json"
+        path.write_text("{not json")
+
+        assert load_history(str(path)) == {}
+        save_history({"Case": 1.0}, str(path))
+        assert json.loads(path.read_text()) == {"Case": 1.0}
+
+
+class TestScheduleObjects:
+    def test_longest_first(self):
+        history = {"Account": 5.0, "Case": 60.0, "Contact": 1.0}
+
+        assert schedule_objects(["Account", "Case", "Contact"], history) == ["Case", "Account", "Contact"]
+
+    def test_objects_without_history_go_first_in_csv_order(self):
+        history = {"Account": 5.0}
+
+        assert schedule_objects(["Account", "Case", "Lead"], history) == ["Case", "Lead", "Account"]
+
+
+class TestObjectShare:
+    def test_budget_split_between_objects(self):
+        assert object_share(64, 4) == 16
+        assert object_share(64, 1) == 64
+
+    def test_at_least_one_request(self):
+        assert object_share(2, 4) == 1
+        assert object_share(8, 0) == 8
+
+    def test_shares_stay_within_budget(self):
+        assert object_share(10, 3) * 3 <= 10
+
+
+class TestRunScheduled:
+    def test_results_in_given_order(self):
+        async def run(name):
+            # Finish in reverse order
+            await asyncio.sleep(0.01 * (3 - int(name)))
+            return name
+
+        assert asyncio.run(run_scheduled(["0", "1", "2"], 3, run)) == ["0", "1", "2"]
+
+    def test_at_most_parallelism_objects_run_and_start_in_order(self):
+        running = []
+        started = []
+        peak = 0
+
+        async def run(name):
+            nonlocal peak
+            started.append(name)
+            running.append(name)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(name)
+
+        asyncio.run(run_scheduled([f"obj{n}" for n in range(6)], 2, run))
+
+        assert peak == 2
+        assert started == [f"obj{n}" for n in range(6)]
@@ -0,0 +1,163 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from bulk_query import Bulk2QueryClient, BulkQueryError, nest_fields
+
+JOBS_PATH = "/services/data/v59.0/jobs/query"
+
+
+class FakeBulkApi:
+    """
+    Local stand-in for the Bulk API 2.0 query endpoints: create job, poll job
+    state and page through CSV results with Sforce-Locator.
+    """
+
+    def __init__(self, pages, polls_before_complete=1, fail_with=None):
+        self.pages = pages
+        self.polls_before_complete = polls_before_complete
+        self.fail_with = fail_with
+        self.created_queries = []
+        self.result_requests = []
+        self.polls = 0
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if self.headers.get("Authorization") != "Bearer SESSION":
+                    return self._send(401, json.dumps([{"errorCode": "INVALID_SESSION_ID"}]))
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                api.created_queries.append(body)
+                self._send(200, json.dumps({"id": "750JOB", "state": "UploadComplete"}))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == f"{JOBS_PATH}/750JOB":
+                    api.polls += 1
+                    if api.fail_with:
+                        state = {"state": "Failed", "errorMessage": api.fail_with}
+                    elif api.polls <= api.polls_before_complete:
+                        state = {"state": "InProgress"}
+                    else:
+                        state = {"state": "JobComplete", "numberRecordsProcessed": 3}
+                    return self._send(200, json.dumps(state))
+                if url.path == f"{JOBS_PATH}/750JOB/results":
+                    query = parse_qs(url.query)
+                    api.result_requests.append(query)
+                    page = int(query.get("locator", ["0"])[0])
+                    next_locator = str(page + 1) if page + 1 < len(api.pages) else "null"
+                    return self._send(200, api.pages[page], "text/csv", {"Sforce-Locator": next_locator})
+                self._send(404, "[]")
+
+        return Handler
+
+
+@pytest.fixture
+def bulk_server():
+    servers = []
+
+    def start(api):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), api.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class TestNestFields:
+    def test_flat_fields_unchanged(self):
+        assert nest_fields({"Id": "069A", "Title": "Doc"}) == {"Id": "069A", "Title": "Doc"}
+
+    def test_relationship_fields_are_nested(self):
+        row = {"ContentDocumentId": "069A", "LinkedEntity.Name": "Acme", "ContentDocument.Title": "Doc"}
+        assert nest_fields(row) == {
+            "ContentDocumentId": "069A",
+            "LinkedEntity": {"Name": "Acme"},
+            "ContentDocument": {"Title": "Doc"},
+        }
+
+
+class TestBulk2QueryClient:
+    def test_streams_all_pages(self, bulk_server):
+        api = FakeBulkApi([
+            'ContentDocumentId,LinkedEntityId,LinkedEntity.Name\n069A,001X,"Acme, Inc."\n069B,001Y,Globex\n',
+            'ContentDocumentId,LinkedEntityId,LinkedEntity.Name\n069C,500Z,"Multi\nline"\n',
+        ])
+        client = Bulk2QueryClient(bulk_server(api), "SESSION", poll_interval=0, max_records=2)
+
+        records = list(client.query_all_iter("SELECT ContentDocumentId FROM ContentDocumentLink"))
+
+        assert api.created_queries == [
+            {"operation": "query", "query": "SELECT ContentDocumentId FROM ContentDocumentLink"}]
+        assert [r["ContentDocumentId"] for r in records] == ["069A", "069B", "069C"]
+        assert records[0]["LinkedEntity"]["Name"] == "Acme, Inc."
+        assert records[2]["LinkedEntity"]["Name"] == "Multi\nline"
+        assert api.polls == 2
+        assert api.result_requests[0]["maxRecords"] == ["2"]
+        assert "locator" not in api.result_requests[0]
+        assert api.result_requests[1]["locator"] == ["1"]
+
+    def test_results_are_lazy(self, bulk_server):
+        api = FakeBulkApi(["Id\n069A\n", "Id\n069B\n"])
+        client = Bulk2QueryClient(bulk_server(api), "SESSION", poll_interval=0)
+
+        records = client.query_all_iter("SELECT Id FROM ContentDocument")
+        assert next(records) == {"Id": "069A"}
+        assert len(api.result_requests) == 1
+
+    def test_failed_job_raises(self, bulk_server):
+        api = FakeBulkApi([], fail_with="INVALID_FIELD: No such column")
+        client = Bulk2QueryClient(bulk_server(api), "SESSION", poll_interval=0)
+
+        with pytest.raises(BulkQueryError, match="INVALID_FIELD"):
+            list(client.query_all_iter("SELECT Nope FROM ContentVersion"))
+
+    def test_rejected_job_creation_raises(self, bulk_server):
+        api = FakeBulkApi([])
+        client = Bulk2QueryClient(bulk_server(api), "EXPIRED", poll_interval=0)
+
+        with pytest.raises(BulkQueryError, match="401"):
+            list(client.query_all_iter("SELECT Id FROM ContentVersion"))
+
+    def test_expired_session_is_renewed(self, bulk_server):
+        api = FakeBulkApi(["Id\n069A\n"])
+        renewed = []
+
+        def renew(stale_session_id):
+            renewed.append(stale_session_id)
+            return "SESSION"
+
+        client = Bulk2QueryClient(bulk_server(api), "EXPIRED", poll_interval=0, renew_session=renew)
+
+        assert list(client.query_all_iter("SELECT Id FROM ContentVersion")) == [{"Id": "069A"}]
+        assert renewed == ["EXPIRED"]
+        assert client.session_id == "SESSION"
+
+    def test_timeout_while_in_progress(self, bulk_server):
+        api = FakeBulkApi([], polls_before_complete=1000)
+        client = Bulk2QueryClient(bulk_server(api), "SESSION", poll_interval=0, timeout=0)
+
+        with pytest.raises(BulkQueryError, match="InProgress"):
+            list(client.query_all_iter("SELECT Id FROM ContentVersion"))
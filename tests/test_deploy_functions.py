@@ -0,0 +1,699 @@
+import argparse
+import configparser
+import csv
+import json
+import re
+import threading
+from email import message_from_bytes
+from email.policy import HTTP
+
+import pytest
+
+import deploy_functions
+from deploy_functions import (RESULT_FIELDS, fetch_content_document_ids, fetch_existing_old_ids, load_owner_map,
+                              resolve_link_targets, upload_files_from_csv)
+from download_functions import MappingWriter, mapping_rows
+from reporting import DeployReporter
+from session_cache import cache_key
+
+CSV_HEADER = [
+    'ContentVersionOldId', 'FirstPublicationId', 'FirstPublicationName', 'ContentDocumentId', 'Title',
+    'VersionData', 'PathOnClient', 'LinkedEntityType', 'CaseRecordTypeName', 'CaseContactId', 'OwnerId'
+]
+
+
+class FakeSObject:
+    def __init__(self, org, name):
+        self.org = org
+        self.name = name
+
+    def create(self, payload):
+        return self.org.create(self.name, payload)
+
+
+class FakeUploadResponse:
+    status_code = 201
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeUploadSession:
+    """
+    Accepts multipart ContentVersion uploads the way the REST sObject endpoint does.
+    """
+
+    def __init__(self, org):
+        self.org = org
+        self.uploads = []
+
+    def post(self, url, data=None, headers=None):
+        message = message_from_bytes(
+            f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + data.read(), policy=HTTP)
+        entity, version_data = message.iter_parts()
+        payload = dict(json.loads(entity.get_content()), VersionData=version_data.get_content())
+        self.uploads.append(payload)
+        return FakeUploadResponse(self.org.create('ContentVersion', payload))
+
+
+class FakeTargetOrg:
+    """
+    In-memory stand-in for the target org: answers the SOQL shapes the deploy
+    code issues and records every created ContentVersion/ContentDocumentLink.
+    """
+
+    def __init__(self, existing_old_ids=(), users=None, records=None, link_errors=None, failing_queries=()):
+        self.lock = threading.Lock()
+        self.failing_queries = failing_queries
+        self.versions = {}
+        self.queries = []
+        self.links = []
+        self.link_calls = []
+        self.link_errors = link_errors or {}
+        # Versions deployed by an earlier run: SI_Old_Id__c -> ContentVersion Id
+        self.existing_versions = {old_id: f"068E{n:011d}" for n, old_id in enumerate(sorted(existing_old_ids))}
+        for old_id, version_id in self.existing_versions.items():
+            self.versions[version_id] = {'SI_Old_Id__c': old_id, 'ContentDocumentId': '069E' + version_id[4:]}
+        self.users = users or {}
+        self.records = records or {}
+        self.ContentVersion = FakeSObject(self, 'ContentVersion')
+        self.ContentDocumentLink = FakeSObject(self, 'ContentDocumentLink')
+        self.base_url = 'https://example.my.salesforce.com/services/data/v59.0/'
+        self.session_id = 'SESSION'
+        self.session = FakeUploadSession(self)
+
+    def create(self, name, payload):
+        with self.lock:
+            if name == 'ContentVersion':
+                n = len(self.versions)
+                version_id = f"068T{n:011d}"
+                self.versions[version_id] = dict(payload, ContentDocumentId=f"069T{n:011d}")
+                return {'id': version_id, 'success': True, 'errors': []}
+            self.links.append(payload)
+            return {'id': f"06AT{len(self.links):011d}", 'success': True, 'errors': []}
+
+    def _result(self, records):
+        return {'totalSize': len(records), 'done': True, 'records': records}
+
+    def query(self, soql):
+        with self.lock:
+            self.queries.append(soql)
+        if any(fragment in soql for fragment in self.failing_queries):
+            raise RuntimeError(f"Query failed: {soql}")
+        ids = re.findall(r"'([^']*)'", soql)
+        if soql.startswith('SELECT Id, SI_Old_Id__c FROM ContentVersion WHERE SI_Old_Id__c IN'):
+            return self._result([{'Id': self.existing_versions[i], 'SI_Old_Id__c': i}
+                                 for i in ids if i in self.existing_versions])
+        if soql.startswith('SELECT Id, Name, AboutMe FROM User WHERE AboutMe IN'):
+            return self._result([{'Id': self.users[i], 'Name': 'User', 'AboutMe': i} for i in ids if i in self.users])
+        if soql.startswith('SELECT ContentDocumentId, LinkedEntityId FROM ContentDocumentLink WHERE ContentDocumentId IN'):
+            return self._result([{'ContentDocumentId': link['ContentDocumentId'], 'LinkedEntityId': link['LinkedEntityId']}
+                                 for link in self.links if link['ContentDocumentId'] in ids])
+        if soql.startswith('SELECT Id, ContentDocumentId FROM ContentVersion WHERE Id IN'):
+            return self._result([{'Id': i, 'ContentDocumentId': self.versions[i]['ContentDocumentId']}
+                                 for i in ids if i in self.versions])
+        match = re.match(r"SELECT Id, SI_Old_Id__c FROM (\w+) WHERE SI_Old_Id__c IN", soql)
+        if match:
+            table = self.records.get(match.group(1), {})
+            return self._result([{'Id': table[i], 'SI_Old_Id__c': i} for i in ids if i in table])
+        raise AssertionError(f"Unexpected query: {soql}")
+
+    def query_all(self, soql):
+        return self.query(soql)
+
+    def restful(self, path, method='GET', json=None):
+        assert (path, method) == ('composite/sobjects', 'POST')
+        assert json['allOrNone'] is False and len(json['records']) <= 200
+        with self.lock:
+            self.link_calls.append(json['records'])
+        responses = []
+        for record in json['records']:
+            assert record.pop('attributes') == {'type': 'ContentDocumentLink'}
+            code = self.link_errors.get(record['LinkedEntityId'])
+            if code:
+                responses.append({'success': False, 'errors': [{'statusCode': code, 'message': code}]})
+            else:
+                responses.append(self.create('ContentDocumentLink', record))
+        return responses
+
+
+@pytest.fixture(autouse=True)
+def isolated_reporter(tmp_path, monkeypatch):
+    rep = DeployReporter(json_path=str(tmp_path / "deploy_summary.json"))
+    monkeypatch.setattr(deploy_functions, "reporter", rep)
+    return rep
+
+
+def write_files_csv(folder, rows):
+    with open(folder / 'files.csv', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for row in rows:
+            writer.writerow([row.get(column, '') for column in CSV_HEADER])
+
+
+def make_rows(folder, count, parent='a00S1'):
+    rows = []
+    for n in range(count):
+        path = folder / f"file{n}.txt"
+        path.write_bytes(f"content {n}".encode())
+        rows.append({
+            'ContentVersionOldId': f"068S{n}", 'FirstPublicationId': parent, 'Title': f"File {n}",
+            'PathOnClient': str(path), 'OwnerId': '005S1',
+        })
+    return rows
+
+
+def deploy_args(source='Case', target='Case'):
+    return argparse.Namespace(sourceobject=source, targetobject=target)
+
+
+class TestFetchExistingOldIds:
+    def test_returns_only_deployed_ids(self):
+        org = FakeTargetOrg(existing_old_ids={'068S1', '068S3'})
+        assert fetch_existing_old_ids(org, ['068S1', '068S2', '068S3']) == {'068S1', '068S3'}
+
+    def test_queries_in_chunks(self):
+        org = FakeTargetOrg(existing_old_ids={'068S4'})
+        old_ids = [f"068S{n}" for n in range(5)]
+
+        assert fetch_existing_old_ids(org, old_ids, chunk_size=2) == {'068S4'}
+        assert len(org.queries) == 3
+        assert all(' IN (' in q for q in org.queries)
+
+    def test_no_ids_no_queries(self):
+        org = FakeTargetOrg()
+        assert fetch_existing_old_ids(org, []) == set()
+        assert org.queries == []
+
+
+PROD = cache_key('deploy@example.com', 'login')
+SANDBOX = cache_key('deploy@example.com.uat', 'test')
+
+
+class TestLoadOwnerMap:
+    def test_resolves_distinct_owners_in_chunks(self):
+        org = FakeTargetOrg(users={'005S1': '005T1', '005S2': '005T2'})
+
+        owner_map = load_owner_map(org, ['005S1', '005S2', '005S1', '005S3'], chunk_size=2)
+
+        assert owner_map == {'005S1': {'Id': '005T1', 'Name': 'User'}, '005S2': {'Id': '005T2', 'Name': 'User'}}
+        assert len(org.queries) == 2
+
+    def test_cache_is_persisted_and_reused(self, tmp_path):
+        cache = str(tmp_path / 'owner_map.json')
+        load_owner_map(FakeTargetOrg(users={'005S1': '005T1'}), ['005S1'], cache, PROD)
+
+        org = FakeTargetOrg()
+        owner_map = load_owner_map(org, ['005S1'], cache, PROD)
+
+        assert owner_map['005S1']['Id'] == '005T1'
+        assert org.queries == []
+
+    def test_other_target_org_misses_cache(self, tmp_path):
+        cache = tmp_path / 'owner_map.json'
+        load_owner_map(FakeTargetOrg(users={'005S1': '005T1'}), ['005S1'], str(cache), SANDBOX)
+
+        org = FakeTargetOrg(users={'005S1': '005P1'})
+        owner_map = load_owner_map(org, ['005S1'], str(cache), PROD)
+
+        assert owner_map['005S1']['Id'] == '005P1'
+        assert len(org.queries) == 1
+        cached = json.loads(cache.read_text())
+        assert cached[SANDBOX]['005S1']['Id'] == '005T1'
+        assert cached[PROD]['005S1']['Id'] == '005P1'
+
+    def test_cache_merges_with_entries_from_other_runs(self, tmp_path):
+        cache = tmp_path / 'owner_map.json'
+        cache.write_text(json.dumps({PROD: {'005S9': {'Id': '005T9', 'Name': 'Other'}}}))
+
+        load_owner_map(FakeTargetOrg(users={'005S1': '005T1'}), ['005S1'], str(cache), PROD)
+
+        assert set(json.loads(cache.read_text())[PROD]) == {'005S1', '005S9'}
+
+    def test_unkeyed_cache_entries_are_not_reused(self, tmp_path):
+        cache = tmp_path / 'owner_map.json'
+        # Written before the cache was keyed by target org: which org it maps to is unknown
+        cache.write_text(json.dumps({'005S1': {'Id': '005X1', 'Name': 'Old'}}))
+
+        owner_map = load_owner_map(FakeTargetOrg(users={'005S1': '005T1'}), ['005S1'], str(cache), PROD)
+
+        assert owner_map['005S1']['Id'] == '005T1'
+        assert json.loads(cache.read_text()) == {PROD: {'005S1': {'Id': '005T1', 'Name': 'User'}}}
+
+    def test_unreadable_cache_is_ignored(self, tmp_path):
+        cache = tmp_path / 'owner_map.json'
+        cache.write_text('{not json')
+
+        owner_map = load_owner_map(FakeTargetOrg(users={'005S1': '005T1'}), ['005S1'], str(cache), PROD)
+
+        assert owner_map['005S1']['Id'] == '005T1'
+
+
+class TestResolveLinkTargets:
+    def test_distinct_targets_resolved_per_object(self):
+        rows = [
+            {'FirstPublicationId': 'a00S1'},
+            {'FirstPublicationId': 'a00S1'},
+            {'FirstPublicationId': 'a00S2'},
+            {'FirstPublicationId': '500S1', 'LinkedEntityType': 'Case',
+             'CaseRecordTypeName': 'Student Record', 'CaseContactId': '003S1'},
+            {'FirstPublicationId': ''},
+        ]
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}, 'Account': {'003S1': '001T1'}})
+
+        parent_ids = resolve_link_targets(org, deploy_args(), rows)
+
+        assert parent_ids == {'Case': {'a00S1': '500T1'}, 'Account': {'003S1': '001T1'}}
+        assert len(org.queries) == 2
+
+
+class TestUploadFilesFromCsv:
+    def test_uploads_and_links_every_row(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 3))
+        org = FakeTargetOrg(users={'005S1': '005T1'}, records={'Case': {'a00S1': '500T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Status'] for r in results] == ['Uploaded'] * 3
+        assert sorted(v['SI_Old_Id__c'] for v in org.versions.values()) == ['068S0', '068S1', '068S2']
+        assert all(v['OwnerId'] == '005T1' for v in org.versions.values())
+        assert [link['LinkedEntityId'] for link in org.links] == ['500T1'] * 3
+
+    def test_existing_versions_are_skipped(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg(existing_old_ids={'068S0'}, records={'Case': {'a00S1': '500T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Status'] for r in results] == ['Skipped', 'Uploaded']
+        assert isolated_reporter.get_summary()['Case']['File already exists'] == 1
+
+    def test_existence_checked_once_up_front(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 5))
+        org = FakeTargetOrg(existing_old_ids={'068S2'}, records={'Case': {'a00S1': '500T1'}})
+
+        upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        existence_queries = [q for q in org.queries if 'FROM ContentVersion WHERE SI_Old_Id__c' in q]
+        assert len(existence_queries) == 1
+        assert len(org.session.uploads) + len([v for v in org.versions if v.startswith('068T')]) == 4
+
+    def test_rows_sharing_a_version_upload_once(self, tmp_path):
+        rows = make_rows(tmp_path, 1)
+        rows.append(dict(rows[0], FirstPublicationId='a00S2'))
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1', 'a00S2': '500T2'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Status'] for r in results] == ['Uploaded', 'Uploaded']
+        assert len(org.versions) == 1
+        assert results[0]['ContentVersionId'] == results[1]['ContentVersionId']
+        assert [link['LinkedEntityId'] for link in org.links] == ['500T1', '500T2']
+
+    def test_existing_version_without_link_is_linked(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg(existing_old_ids={'068S0'}, records={'Case': {'a00S1': '500T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [(r['Status'], r['Message']) for r in results] == [
+            ('Skipped', 'Linked existing file to record'), ('Uploaded', '')]
+        assert results[0]['ContentVersionId'] == org.existing_versions['068S0']
+        assert sorted(link['ContentDocumentId'] for link in org.links) == sorted(
+            v['ContentDocumentId'] for v in org.versions.values())
+
+    def test_existing_files_without_parent_are_reported_once(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2, parent='a00MISSING'))
+        org = FakeTargetOrg(existing_old_ids={'068S0', '068S1'}, records={'Case': {}})
+
+        for _ in range(2):
+            isolated_reporter.clear()
+            results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+            assert [(r['Status'], r['Message']) for r in results] == [('Skipped', 'File already exists')] * 2
+            assert isolated_reporter.get_summary()['Case'] == {'File already exists': 2}
+        assert org.links == []
+
+    def test_failed_relink_has_own_category(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 1))
+        org = FakeTargetOrg(existing_old_ids={'068S0'}, records={'Case': {'a00S1': '500T1'}},
+                            link_errors={'500T1': 'INVALID_CROSS_REFERENCE_KEY'})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert results[0]['Message'] == 'Failed to link existing file to record'
+        assert isolated_reporter.get_summary()['Case'] == {
+            'File already exists': 1, 'Failed to link existing file to record': 1}
+
+    def test_existing_links_are_not_recreated(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+        upload_files_from_csv(org, deploy_args(), str(tmp_path))
+        org.existing_versions = {v['SI_Old_Id__c']: version_id for version_id, v in org.versions.items()}
+        org.link_calls.clear()
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [(r['Status'], r['Message']) for r in results] == [('Skipped', 'File already exists')] * 2
+        assert org.link_calls == []
+        assert len(org.links) == 2
+
+    def test_interrupted_run_is_completed_by_rerun(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 250))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+        create = org.create
+
+        def interrupt_at_row_230(name, payload):
+            if payload.get('SI_Old_Id__c') == '068S230':
+                raise KeyboardInterrupt
+            return create(name, payload)
+
+        org.create = interrupt_at_row_230
+        with pytest.raises(KeyboardInterrupt):
+            upload_files_from_csv(org, deploy_args(), str(tmp_path))
+        # Every completed batch of uploads was linked before the interruption
+        assert len(org.links) == 200
+
+        org.create = create
+        org.existing_versions = {v['SI_Old_Id__c']: version_id for version_id, v in org.versions.items()}
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert len(org.versions) == 250
+        assert sorted(link['ContentDocumentId'] for link in org.links) == sorted(
+            v['ContentDocumentId'] for v in org.versions.values())
+        assert 'Linked existing file to record' in [r['Message'] for r in results]
+
+    def test_owner_looked_up_once_per_run(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 5))
+        org = FakeTargetOrg(users={'005S1': '005T1'}, records={'Case': {'a00S1': '500T1'}})
+
+        upload_files_from_csv(org, deploy_args(), str(tmp_path), owner_map_path=str(tmp_path / 'owners.json'))
+
+        assert len([q for q in org.queries if 'FROM User' in q]) == 1
+        assert all(v['OwnerId'] == '005T1' for v in org.versions.values())
+
+    def test_shared_parent_resolved_once(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 5))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+
+        upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert len([q for q in org.queries if 'FROM Case' in q]) == 1
+        assert [link['LinkedEntityId'] for link in org.links] == ['500T1'] * 5
+
+    def test_student_record_case_links_person_account(self, tmp_path, isolated_reporter):
+        rows = make_rows(tmp_path, 2)
+        rows[0].update(LinkedEntityType='Case', CaseRecordTypeName='Student Record', CaseContactId='003S1')
+        rows[1].update(LinkedEntityType='Case', CaseRecordTypeName='Student Record', CaseContactId='003S2')
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Account': {'003S1': '001T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Message'] for r in results] == [
+            'Linked to Person Account', 'Could not find Person Account for CaseContactId']
+        assert [link['LinkedEntityId'] for link in org.links] == ['001T1']
+
+    def test_links_created_in_batches_of_200(self, tmp_path):
+        rows = make_rows(tmp_path, 1)
+        rows += [dict(rows[0], FirstPublicationId=f"a00S{n}") for n in range(2, 451)]
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Case': {f"a00S{n}": f"500T{n}" for n in range(1, 451)}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path), workers=4)
+
+        assert [len(call) for call in org.link_calls] == [200, 200, 50]
+        assert len(org.links) == 450
+        assert all(r['Status'] == 'Uploaded' and r['Message'] == '' for r in results)
+
+    def test_link_errors_mapped_per_record(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, [dict(row, FirstPublicationId=f"a00S{n}")
+                                   for n, row in enumerate(make_rows(tmp_path, 3))])
+        org = FakeTargetOrg(records={'Case': {'a00S0': '500T0', 'a00S1': '500T1', 'a00S2': '500T2'}},
+                            link_errors={'500T1': 'DUPLICATE_VALUE', '500T2': 'UNKNOWN_EXCEPTION'})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Message'] for r in results] == [
+            '', 'File already linked to record', 'Unknown exception linking record']
+        assert isolated_reporter.get_summary()['Case'] == {
+            'File already linked to record': 1, 'Unknown exception linking record': 1}
+
+    def test_content_document_ids_resolved_in_bulk(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 20))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+
+        upload_files_from_csv(org, deploy_args(), str(tmp_path), workers=4)
+
+        assert len([q for q in org.queries if 'ContentDocumentId FROM ContentVersion' in q]) == 1
+        assert sorted(link['ContentDocumentId'] for link in org.links) == sorted(
+            v['ContentDocumentId'] for v in org.versions.values())
+
+    def test_large_files_uploaded_as_multipart(self, tmp_path):
+        rows = make_rows(tmp_path, 2)
+        (tmp_path / 'file1.txt').write_bytes(b'x' * 5000)
+        snote = tmp_path / 'note.snote'
+        snote.write_text('<p>caf\u00e9</p>' * 500, encoding='utf-8')
+        rows.append(dict(rows[0], ContentVersionOldId='068S9', PathOnClient=str(snote)))
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path), multipart_threshold=1000)
+
+        assert [r['Status'] for r in results] == ['Uploaded'] * 3
+        assert sorted(u['SI_Old_Id__c'] for u in org.session.uploads) == ['068S1', '068S9']
+        assert org.session.uploads[0]['VersionData'] in (b'x' * 5000, snote.read_bytes())
+        small = [v for v in org.versions.values() if v['SI_Old_Id__c'] == '068S0'][0]
+        assert isinstance(small['VersionData'], str)
+        assert len(org.links) == 3
+
+    def test_large_snote_must_be_utf8(self, tmp_path, isolated_reporter):
+        rows = make_rows(tmp_path, 1)
+        snote = tmp_path / 'note.snote'
+        snote.write_bytes(b'\xff' * 2000)
+        rows[0]['PathOnClient'] = str(snote)
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg()
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path), multipart_threshold=1000)
+
+        assert results[0]['Message'] == 'Unable to decode snote file'
+        assert org.session.uploads == []
+
+    def test_missing_file_fails_row(self, tmp_path, isolated_reporter):
+        rows = make_rows(tmp_path, 1)
+        rows[0]['PathOnClient'] = str(tmp_path / 'missing.txt')
+        write_files_csv(tmp_path, rows)
+
+        results = upload_files_from_csv(FakeTargetOrg(), deploy_args(), str(tmp_path))
+
+        assert results[0]['Status'] == 'Failed'
+        assert isolated_reporter.get_summary()['Case'] == {'File not found for upload and linking': 1}
+
+    def test_parallel_workers_give_same_results(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 20))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path), workers=8)
+
+        assert [r['Row'] for r in results] == list(range(1, 21))
+        assert all(r['Status'] == 'Uploaded' for r in results)
+        assert len(org.versions) == 20
+        assert len(org.links) == 20
+
+    def test_results_written_to_csv(self, tmp_path):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+
+        upload_files_from_csv(FakeTargetOrg(records={'Case': {'a00S1': '500T1'}}), deploy_args(), str(tmp_path))
+
+        with open(tmp_path / deploy_functions.DEPLOY_RESULTS_FILE, newline='') as f:
+            reader = csv.DictReader(f)
+            assert reader.fieldnames == RESULT_FIELDS
+            assert [row['ContentVersionOldId'] for row in reader] == ['068S0', '068S1']
+
+    def test_missing_csv_returns_no_results(self, tmp_path, isolated_reporter):
+        assert upload_files_from_csv(FakeTargetOrg(), deploy_args(), str(tmp_path)) == []
+        assert isolated_reporter.get_summary()['Case'] == {'File not found for upload and linking': 1}
+
+
+class TestDownloadedMultiLinkFiles:
+    """
+    files.csv as download_functions writes it for a document linked to several
+    records: one row per link, all sharing the ContentVersion's old Id.
+    """
+
+    def write_downloaded_csv(self, folder, parents):
+        path = folder / 'doc.txt'
+        path.write_bytes(b'shared content')
+        record = {'Id': '068S1', 'ContentDocumentId': '069S1', 'Title': 'Shared', 'OwnerId': ''}
+        with open(folder / 'files.csv', 'w', encoding='UTF-8', newline='') as f:
+            csv.writer(f, delimiter=',', quotechar='|').writerow(CSV_HEADER)
+        writer = MappingWriter(str(folder / 'files.csv'))
+        writer.write_rows(mapping_rows(record, str(path), [(parent, '', '', '', '') for parent in parents]))
+        writer.close()
+
+    def test_uploaded_once_and_linked_to_every_record(self, tmp_path, isolated_reporter):
+        self.write_downloaded_csv(tmp_path, ['a00S1', 'a00S2', 'a00S3'])
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1', 'a00S2': '500T2', 'a00S3': '500T3'}})
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert len(org.versions) == 1
+        assert [r['Status'] for r in results] == ['Uploaded'] * 3
+        assert len({r['ContentVersionId'] for r in results}) == 1
+        assert sorted(link['LinkedEntityId'] for link in org.links) == ['500T1', '500T2', '500T3']
+
+    def test_rerun_adds_only_missing_links(self, tmp_path, isolated_reporter):
+        self.write_downloaded_csv(tmp_path, ['a00S1', 'a00S2'])
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1', 'a00S2': '500T2'}})
+        upload_files_from_csv(org, deploy_args(), str(tmp_path))
+        org.existing_versions = {v['SI_Old_Id__c']: version_id for version_id, v in org.versions.items()}
+        self.write_downloaded_csv(tmp_path, ['a00S1', 'a00S2', 'a00S3'])
+        org.records['Case']['a00S3'] = '500T3'
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert len(org.versions) == 1
+        assert [r['Message'] for r in results] == [
+            'File already exists', 'File already exists', 'Linked existing file to record']
+        assert sorted(link['LinkedEntityId'] for link in org.links) == ['500T1', '500T2', '500T3']
+
+
+class TestPrePassFailures:
+    def test_failed_existence_check_fails_object_cleanly(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}}, failing_queries=['FROM ContentVersion WHERE SI_Old_Id__c'])
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [(r['Status'], r['Message']) for r in results] == [('Failed', 'Unable to check for existing files')] * 2
+        assert org.versions == {}
+        assert isolated_reporter.get_summary()['Case'] == {'Unable to check for existing files': 2}
+        assert (tmp_path / deploy_functions.DEPLOY_RESULTS_FILE).exists()
+
+    def test_failed_parent_lookup_fails_only_links(self, tmp_path, isolated_reporter):
+        rows = make_rows(tmp_path, 2)
+        rows[1].update(LinkedEntityType='Case', CaseRecordTypeName='Student Record', CaseContactId='003S1')
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Account': {'003S1': '001T1'}}, failing_queries=['FROM Case WHERE'])
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [r['Status'] for r in results] == ['Uploaded', 'Uploaded']
+        assert [r['Message'] for r in results] == ['Unknown exception linking record', 'Linked to Person Account']
+        assert [link['LinkedEntityId'] for link in org.links] == ['001T1']
+
+    def test_missing_target_object_reports_unmatched_rows(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg()
+
+        results = upload_files_from_csv(org, deploy_args(target=''), str(tmp_path))
+
+        assert [r['Message'] for r in results] == ['No matching record for source object'] * 2
+        assert not any('FROM  WHERE' in q for q in org.queries)
+
+    def test_failed_owner_lookup_fails_owned_files(self, tmp_path, isolated_reporter):
+        rows = make_rows(tmp_path, 2)
+        rows[1]['OwnerId'] = ''
+        write_files_csv(tmp_path, rows)
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}}, failing_queries=['FROM User'])
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [(r['Status'], r['Message']) for r in results] == [
+            ('Failed', 'Unknown exception uploading file'), ('Uploaded', '')]
+
+
+class TestContentDocumentIdFailures:
+    def test_failed_chunk_is_left_out(self):
+        org = FakeTargetOrg()
+        versions = [org.create('ContentVersion', {'SI_Old_Id__c': f"068S{n}"})['id'] for n in range(3)]
+        org.failing_queries = [versions[1]]
+
+        cd_ids = fetch_content_document_ids(org, versions, chunk_size=1)
+
+        assert sorted(cd_ids) == [versions[0], versions[2]]
+
+    def test_failed_lookup_fails_links_and_keeps_results(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 2))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}},
+                            failing_queries=['SELECT Id, ContentDocumentId FROM ContentVersion'])
+
+        results = upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        assert [(r['Status'], r['Message']) for r in results] == [
+            ('Uploaded', 'Unknown exception linking record')] * 2
+        assert org.links == []
+        with open(tmp_path / deploy_functions.DEPLOY_RESULTS_FILE, newline='') as f:
+            assert len(list(csv.DictReader(f))) == 2
+
+    def test_results_written_when_run_stops(self, tmp_path, isolated_reporter):
+        write_files_csv(tmp_path, make_rows(tmp_path, 3))
+        org = FakeTargetOrg(records={'Case': {'a00S1': '500T1'}})
+        create = org.create
+
+        def interrupt_at_third_file(name, payload):
+            if payload.get('SI_Old_Id__c') == '068S2':
+                raise KeyboardInterrupt
+            return create(name, payload)
+
+        org.create = interrupt_at_third_file
+        with pytest.raises(KeyboardInterrupt):
+            upload_files_from_csv(org, deploy_args(), str(tmp_path))
+
+        with open(tmp_path / deploy_functions.DEPLOY_RESULTS_FILE, newline='') as f:
+            assert [row['Status'] for row in csv.DictReader(f)] == ['Uploaded', 'Uploaded']
+
+
+class TestDeployObject:
+    def test_runs_object_on_given_connection(self, tmp_path, monkeypatch, isolated_reporter):
+        folder = tmp_path / 'files' / 'Case'
+        folder.mkdir(parents=True)
+        rows = make_rows(folder, 2)
+        rows[1]['PathOnClient'] = str(folder / 'missing.txt')
+        write_files_csv(folder, rows)
+        (tmp_path / 'config.ini').write_text(
+            f"[salesforce]\noutput_dir = {tmp_path / 'files'}\ntarget_username = deploy@example.com\n"
+            "target_connect_to_sandbox = False\ntarget_domain =\n")
+        monkeypatch.chdir(tmp_path)
+        org = FakeTargetOrg(users={'005S1': '005T1'}, records={'Case': {'a00S1': '500T1'}})
+        summary_path = tmp_path / 'case_summary.json'
+
+        results = deploy_functions.deploy_object(['-so', 'Case', '-to', 'Case', '--summary', str(summary_path)], org)
+
+        assert [r['Status'] for r in results] == ['Uploaded', 'Failed']
+        assert json.loads(summary_path.read_text()) == {'Case': {'File not found for upload and linking': 1}}
+        assert list(json.loads((tmp_path / 'owner_map.json').read_text())) == [PROD]
+
+
+class TestConnectionPoolSize:
+    @pytest.fixture
+    def connections(self, monkeypatch):
+        config = configparser.ConfigParser()
+        config.read_string("[salesforce]\ndeploy_workers = 24\n")
+        pool_sizes = []
+        monkeypatch.setattr(deploy_functions, 'load_config', lambda: config)
+        monkeypatch.setattr(deploy_functions, 'setup_logging', lambda to_stdout=True: None)
+        monkeypatch.setattr(deploy_functions, 'open_connection',
+                            lambda config, pool_size=None: pool_sizes.append(pool_size))
+        monkeypatch.setattr(deploy_functions, 'run_deploy', lambda sf, config, args: [])
+        return pool_sizes
+
+    def test_worker_pool_sized_to_deploy_workers(self, connections):
+        deploy_functions.init_worker()
+        assert connections == [24]
+
+    def test_main_pool_sized_to_workers_option(self, connections, monkeypatch):
+        monkeypatch.setattr('sys.argv', ['deploy_functions.py', '-so', 'Case', '-to', 'Case', '-w', '32'])
+        deploy_functions.main()
+        assert connections == [32]
+
+    def test_main_pool_defaults_to_config(self, connections, monkeypatch):
+        monkeypatch.setattr('sys.argv', ['deploy_functions.py', '-so', 'Case', '-to', 'Case'])
+        deploy_functions.main()
+        assert connections == [24]
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from deploy_schedule import check_dependencies, prune_unknown_dependencies, run_mapping
+
+
+class FakeDeploy:
+    """
+    Stands in for deploy.run_query: records the order objects start and finish
+    in, and how many deploy at once.
+    """
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, source_object, target_object, summary_path, progress=None):
+        self.started.append(source_object)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delays.get(source_object, 0.01))
+        self.running -= 1
+        self.finished.append(source_object)
+        return True
+
+
+def deploy_mapping(mapping, parallel, deploy, tmp_path):
+    return asyncio.run(run_mapping(mapping, parallel, deploy, str(tmp_path / "summaries")))
+
+
+class TestCheckDependencies:
+    def test_acyclic_mapping_passes(self):
+        check_dependencies([("Account", "Account", []), ("Case", "Case", ["Account"]),
+                            ("Task", "Task", ["Case", "Account"])])
+
+    def test_cycle_is_rejected(self):
+        mapping = [("Account", "Account", ["Case"]), ("Case", "Case", ["Account"]), ("Lead", "Lead", [])]
+
+        with pytest.raises(ValueError, match="Account, Case"):
+            check_dependencies(mapping)
+
+    def test_self_dependency_is_a_cycle(self):
+        with pytest.raises(ValueError):
+            check_dependencies([("Account", "Account", ["Account"])])
+
+
+class TestPruneUnknownDependencies:
+    def test_unknown_dependencies_are_dropped(self):
+        mapping = [("Account", "Account", []), ("Case", "Case", ["Account", "Opportunity"])]
+
+        prune_unknown_dependencies(mapping)
+
+        assert mapping[1][2] == ["Account"]
+
+    def test_pruned_mapping_deploys(self, tmp_path):
+        mapping = [("Case", "Case", ["Missing"])]
+        deploy = FakeDeploy()
+
+        prune_unknown_dependencies(mapping)
+        deploy_mapping(mapping, 1, deploy, tmp_path)
+
+        assert deploy.finished == ["Case"]
+
+
+class TestRunMapping:
+    def test_dependency_finishes_first(self, tmp_path):
+        # Account is slow, but Case and Task may only start after it
+        mapping = [("Case", "Case", ["Account"]), ("Account", "Account", []), ("Task", "Task", ["Case"])]
+        deploy = FakeDeploy(delays={"Account": 0.05})
+
+        deploy_mapping(mapping, 3, deploy, tmp_path)
+
+        assert deploy.started == ["Account", "Case", "Task"]
+
+    def test_independent_objects_run_in_parallel_up_to_limit(self, tmp_path):
+        mapping = [(f"Object{n}", f"Object{n}", []) for n in range(5)]
+        deploy = FakeDeploy()
+
+        deploy_mapping(mapping, 2, deploy, tmp_path)
+
+        assert deploy.peak == 2
+        assert sorted(deploy.finished) == sorted(source for source, _, _ in mapping)
+
+    def test_parallel_one_keeps_csv_order(self, tmp_path):
+        mapping = [("Lead", "Lead", []), ("Account", "Account", []), ("Case", "Case", [])]
+        deploy = FakeDeploy()
+
+        deploy_mapping(mapping, 1, deploy, tmp_path)
+
+        assert deploy.started == ["Lead", "Account", "Case"]
+        assert deploy.peak == 1
+
+    def test_failed_dependency_still_releases_dependents(self, tmp_path):
+        deployed = []
+
+        async def deploy(source_object, target_object, summary_path, progress=None):
+            # Like run_query, a failed deploy returns False instead of raising
+            deployed.append(source_object)
+            return source_object != "Account"
+
+        mapping = [("Account", "Account", []), ("Case", "Case", ["Account"])]
+
+        deploy_mapping(mapping, 2, deploy, tmp_path)
+
+        assert deployed == ["Account", "Case"]
+
+    def test_cycle_deploys_nothing(self, tmp_path):
+        mapping = [("Account", "Account", ["Case"]), ("Case", "Case", ["Account"])]
+        deploy = FakeDeploy()
+
+        with pytest.raises(ValueError):
+            deploy_mapping(mapping, 2, deploy, tmp_path)
+        assert deploy.started == []
+
+    def test_one_summary_file_per_row(self, tmp_path):
+        mapping = [("Account", "Account", []), ("Account", "PersonAccount", [])]
+        paths = []
+
+        async def deploy(source_object, target_object, summary_path, progress=None):
+            paths.append(summary_path)
+            return True
+
+        summary_paths = deploy_mapping(mapping, 2, deploy, tmp_path)
+
+        assert len(set(summary_paths)) == 2
+        assert sorted(paths) == sorted(summary_paths)
+        assert all(path.startswith(str(tmp_path / "summaries")) for path in summary_paths)
@@ -1,12 +1,36 @@
+import asyncio
 import concurrent.futures
+import csv
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
 
 import pytest
 
+import download_functions
 from download_functions import (
+    build_content_version_query,
+    build_link_index,
+    classify_result,
+    create_http_session,
+    download_file,
+    fetch_case_fields,
+    fetch_files,
+    fetch_files_async,
+    is_already_downloaded,
+    MappingWriter,
+    read_watermark,
+    file_md5,
     reserve_unique_filename,
     split_into_batches,
+    stream_to_file,
     used_filenames,
+    version_data_url,
+    write_watermark,
+    WATERMARK_FILE,
 )
+from manifest import DownloadManifest, MANIFEST_FILE
 
 
 @pytest.fixture(autouse=True)
@@ -87,3 +111,645 @@ class TestSplitIntoBatches:
         data = [{"Id": "a"}, {"Id": "b"}, {"Id": "c"}]
         batches = list(split_into_batches(data, 2))
         assert batches == [[{"Id": "a"}, {"Id": "b"}], [{"Id": "c"}]]
+
+
+class FakeStreamResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.requested_chunk_size = None
+
+    def iter_content(self, chunk_size=None):
+        self.requested_chunk_size = chunk_size
+        yield from self.chunks
+
+
+class TestStreamToFile:
+    def test_writes_chunks_and_returns_md5(self, tmp_path):
+        target = tmp_path / "file.bin"
+        chunks = [b"hello ", b"", b"world"]
+        expected = hashlib.md5(b"hello world").hexdigest()
+
+        assert stream_to_file(FakeStreamResponse(chunks), str(target), expected) == expected
+        assert target.read_bytes() == b"hello world"
+        assert not (tmp_path / "file.bin.part").exists()
+
+    def test_passes_chunk_size_to_iter_content(self, tmp_path):
+        response = FakeStreamResponse([b"x"])
+        stream_to_file(response, str(tmp_path / "f"), chunk_size=4096)
+        assert response.requested_chunk_size == 4096
+
+    def test_no_checksum_always_renames(self, tmp_path):
+        target = tmp_path / "file.bin"
+        stream_to_file(FakeStreamResponse([b"abc"]), str(target))
+        assert target.read_bytes() == b"abc"
+
+    def test_checksum_mismatch_raises_and_leaves_no_files(self, tmp_path):
+        target = tmp_path / "file.bin"
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            stream_to_file(FakeStreamResponse([b"abc"]), str(target), "0" * 32)
+        assert not target.exists()
+        assert not (tmp_path / "file.bin.part").exists()
+
+    def test_mismatch_keeps_existing_file_intact(self, tmp_path):
+        target = tmp_path / "file.bin"
+        target.write_bytes(b"old")
+        with pytest.raises(ValueError):
+            stream_to_file(FakeStreamResponse([b"new"]), str(target), "0" * 32)
+        assert target.read_bytes() == b"old"
+
+
+class TestFileMd5:
+    def test_matches_hashlib_across_chunks(self, tmp_path):
+        target = tmp_path / "file.bin"
+        data = b"0123456789" * 1000
+        target.write_bytes(data)
+        assert file_md5(str(target), chunk_size=7) == hashlib.md5(data).hexdigest()
+
+
+class TestCreateHttpSession:
+    def test_adapter_pool_sized_to_workers(self):
+        session = create_http_session(pool_size=32)
+        adapter = session.get_adapter("https://example.my.salesforce.com")
+        assert adapter._pool_maxsize == 32
+        assert adapter._pool_connections == 32
+
+    def test_retries_on_throttling_and_server_errors(self):
+        session = create_http_session(max_retries=5, backoff_factor=1.0)
+        retry = session.get_adapter("https://example.my.salesforce.com").max_retries
+        assert retry.total == 5
+        assert retry.backoff_factor == 1.0
+        assert 429 in retry.status_forcelist
+        assert 503 in retry.status_forcelist
+        assert retry.respect_retry_after_header
+
+
+class TestBuildLinkIndex:
+    def test_groups_multiple_links_per_document(self):
+        links = [
+            {"ContentDocumentId": "069A", "LinkedEntityId": "001X"},
+            {"ContentDocumentId": "069B", "LinkedEntityId": "001Y"},
+            {"ContentDocumentId": "069A", "LinkedEntityId": "500Z"},
+        ]
+        index = build_link_index(links)
+        assert index["069A"] == [("001X", ""), ("500Z", "")]
+        assert index["069B"] == [("001Y", "")]
+
+    def test_keeps_linked_entity_name(self):
+        links = [{"ContentDocumentId": "069A", "LinkedEntityId": "001X", "LinkedEntity": {"Name": "Acme"}}]
+        assert build_link_index(links) == {"069A": [("001X", "Acme")]}
+
+    def test_custom_id_field(self):
+        docs = [{"Id": "069A", "Title": "Doc"}]
+        assert build_link_index(docs, "Id") == {"069A": [("069A", "Doc")]}
+
+    def test_accepts_streamed_records(self):
+        def records():
+            yield {"ContentDocumentId": "069A", "LinkedEntityId": "001X"}
+            yield {"ContentDocumentId": "069A", "LinkedEntityId": "001Y"}
+
+        assert build_link_index(records()) == {"069A": [("001X", ""), ("001Y", "")]}
+
+    def test_empty_input(self):
+        assert build_link_index([]) == {}
+
+
+class FakeSalesforce:
+    sf_instance = "example.my.salesforce.com"
+    session_id = "SESSION"
+
+
+class TestDownloadFile:
+    def test_writes_one_csv_row_per_link(self, tmp_path):
+        data = b"contents"
+        existing = tmp_path / "069A-Doc.pdf"
+        existing.write_bytes(data)
+        results_path = tmp_path / "files.csv"
+        record = {
+            "Id": "068A", "ContentDocumentId": "069A", "Title": "Doc", "FileExtension": "pdf",
+            "OwnerId": "005A", "Checksum": hashlib.md5(data).hexdigest(),
+        }
+        link_index = build_link_index([
+            {"ContentDocumentId": "069A", "LinkedEntityId": "001X", "LinkedEntity": {"Name": "Acme"}},
+            {"ContentDocumentId": "069A", "LinkedEntityId": "001Y", "LinkedEntity": {"Name": "Globex"}},
+        ])
+
+        with MappingWriter(str(results_path)) as writer:
+            result = download_file((
+                record, str(tmp_path), FakeSalesforce(), writer, link_index,
+                "ContentDocumentId", "{0}{1}-{2}.{3}", None, {}, None
+            ))
+
+        assert result == "Skipped"
+        with open(results_path, newline="") as f:
+            rows = list(csv.reader(f, delimiter=",", quotechar="|"))
+        assert [(row[0], row[1], row[2]) for row in rows] == [
+            ("068A", "001X", "Acme"),
+            ("068A", "001Y", "Globex"),
+        ]
+        assert rows[0][5] == rows[1][5] == str(existing)
+
+    def test_case_fields_served_from_prefetched_map(self, tmp_path):
+        data = b"contents"
+        (tmp_path / "069A-Doc.pdf").write_bytes(data)
+        results_path = tmp_path / "files.csv"
+        record = {
+            "Id": "068A", "ContentDocumentId": "069A", "Title": "Doc", "FileExtension": "pdf",
+            "Checksum": hashlib.md5(data).hexdigest(),
+        }
+        link_index = build_link_index([{"ContentDocumentId": "069A", "LinkedEntityId": "500C"}])
+
+        with MappingWriter(str(results_path)) as writer:
+            download_file((
+                record, str(tmp_path), FakeSalesforce(), writer, link_index,
+                "ContentDocumentId", "{0}{1}-{2}.{3}", None, {"500C": ("Student Record", "003K")}, None
+            ))
+
+        with open(results_path, newline="") as f:
+            row = next(csv.reader(f, delimiter=",", quotechar="|"))
+        assert row[7:10] == ["Case", "Student Record", "003K"]
+
+
+class QueryRecordingSalesforce:
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def query_all(self, soql):
+        self.queries.append(soql)
+        return {"records": [r for r in self.records if "'" + r["Id"] + "'" in soql]}
+
+
+class TestFetchCaseFields:
+    def test_resolves_all_ids_in_chunked_queries(self):
+        sf = QueryRecordingSalesforce([
+            {"Id": "500A", "RecordType": {"Name": "Student Record"}, "ContactId": "003A"},
+            {"Id": "500B", "RecordType": None, "ContactId": None},
+            {"Id": "500C", "RecordType": {"Name": "Support"}, "ContactId": "003C"},
+        ])
+
+        result = fetch_case_fields(sf, ["500A", "500B", "500C"], chunk_size=2)
+
+        assert len(sf.queries) == 2
+        assert all(" IN (" in q for q in sf.queries)
+        assert result == {
+            "500A": ("Student Record", "003A"),
+            "500B": ("", ""),
+            "500C": ("Support", "003C"),
+        }
+
+    def test_failed_query_is_skipped(self):
+        class FailingSalesforce:
+            def query_all(self, soql):
+                raise RuntimeError("boom")
+
+        assert fetch_case_fields(FailingSalesforce(), ["500A"]) == {}
+
+
+class FakeDownloadResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.ok = status_code == 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield self.data
+
+
+class FakeHttpSession:
+    def __init__(self, files):
+        self.files = files
+        self.urls = []
+
+    def get(self, url, headers=None, stream=False):
+        self.urls.append(url)
+        if headers["Authorization"] != "OAuth SESSION":
+            return FakeDownloadResponse(b"", status_code=401)
+        path = url.split("salesforce.com", 1)[1]
+        if path not in self.files:
+            return FakeDownloadResponse(b"", status_code=404)
+        return FakeDownloadResponse(self.files[path])
+
+
+class FakeContentVersionSalesforce(FakeSalesforce):
+    def __init__(self, versions):
+        self.versions = versions
+        self.queries = []
+
+    def query_all_iter(self, soql):
+        self.queries.append(soql)
+        # Yield one record per "page" to mimic nextRecordsUrl pagination
+        for v in self.versions:
+            if "'" + v["ContentDocumentId"] + "'" in soql:
+                yield v
+
+    def query_all(self, soql):
+        return {"records": []}
+
+
+class ExpiringSalesforce(FakeContentVersionSalesforce):
+    """
+    Starts with an expired session; renew_session mimics session_cache.CachedSalesforce.
+    """
+    session_id = "EXPIRED"
+
+    def __init__(self, versions):
+        super().__init__(versions)
+        self.renewals = []
+
+    def renew_session(self, stale_session_id):
+        self.renewals.append(stale_session_id)
+        self.session_id = "SESSION"
+        return self.session_id
+
+
+def make_version(n, data):
+    return {
+        "Id": f"068{n}", "ContentDocumentId": f"069{n}", "Title": f"Doc{n}", "FileExtension": "txt",
+        "VersionData": f"/data/{n}", "Checksum": hashlib.md5(data).hexdigest(),
+    }
+
+
+class RecordingLimiter:
+    """
+    Shared request budget (as download.py passes in batch mode) recording how many
+    requests were in flight at once.
+    """
+
+    def __init__(self, budget):
+        self.semaphore = threading.BoundedSemaphore(budget)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.acquired = 0
+
+    def acquire(self, blocking=True):
+        if not self.semaphore.acquire(blocking):
+            return False
+        with self.lock:
+            self.in_flight += 1
+            self.acquired += 1
+            self.peak = max(self.peak, self.in_flight)
+        # Hold the slot a little, so concurrent downloads overlap
+        time.sleep(0.005)
+        return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class TestFetchFiles:
+    def test_downloads_all_batches_and_counts_results(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(5)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(5)]
+        versions.append({"Id": "068X", "ContentDocumentId": "069X", "Title": "Missing",
+                         "FileExtension": "txt", "VersionData": "/data/missing"})
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        # Pre-existing identical file is skipped
+        (tmp_path / "0690-Doc0.txt").write_bytes(files["/data/0"])
+        sf = FakeContentVersionSalesforce(versions)
+
+        stats = fetch_files(
+            sf=sf, content_document_links=links, folder_output_directory=str(tmp_path),
+            results_path=str(tmp_path / "files.csv"), filename_pattern="{0}{1}-{2}.{3}",
+            batch_size=2, http_session=FakeHttpSession(files), max_workers=4,
+        )
+
+        assert len(sf.queries) == 3
+        assert stats["total"] == 6
+        assert (stats["success"], stats["skipped"], stats["failed"]) == (4, 1, 1)
+        for n in range(1, 5):
+            assert (tmp_path / f"069{n}-Doc{n}.txt").read_bytes() == files[f"/data/{n}"]
+
+    def test_expired_session_is_renewed_and_retried(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(3)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(3)]
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        sf = ExpiringSalesforce(versions)
+
+        stats = fetch_files(
+            sf=sf, content_document_links=links, folder_output_directory=str(tmp_path),
+            results_path=str(tmp_path / "files.csv"), filename_pattern="{0}{1}-{2}.{3}",
+            http_session=FakeHttpSession(files), max_workers=1,
+        )
+
+        assert stats["success"] == 3
+        assert sf.renewals == ["EXPIRED"]
+
+    def test_downloads_stay_within_shared_limiter(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(6)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(6)]
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        limiter = RecordingLimiter(2)
+
+        stats = fetch_files(
+            sf=FakeContentVersionSalesforce(versions), content_document_links=links,
+            folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"),
+            filename_pattern="{0}{1}-{2}.{3}", http_session=FakeHttpSession(files), max_workers=6,
+            http_limiter=limiter,
+        )
+
+        assert stats["success"] == 6
+        assert limiter.acquired == 6
+        assert limiter.peak <= 2
+        assert limiter.in_flight == 0
+
+    def test_metadata_query_failure_is_raised(self, tmp_path):
+        class FailingSalesforce(FakeContentVersionSalesforce):
+            def query_all_iter(self, soql):
+                raise RuntimeError("INVALID_QUERY")
+
+        links = [{"ContentDocumentId": "069A", "LinkedEntityId": "001A"}]
+        with pytest.raises(RuntimeError, match="INVALID_QUERY"):
+            fetch_files(sf=FailingSalesforce([]), content_document_links=links,
+                        folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"))
+
+    def test_no_links_returns_empty_stats(self, tmp_path):
+        stats = fetch_files(sf=FakeContentVersionSalesforce([]), content_document_links=[],
+                            folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"))
+        assert stats["total"] == 0
+
+
+class TestBuildContentVersionQuery:
+    def test_default_excludes_snotes(self):
+        soql = build_content_version_query(["069A", "069B"])
+        assert "FileExtension != 'snote'" in soql
+        assert "ContentDocumentId in ('069A','069B')" in soql
+
+    def test_file_type_filter(self):
+        soql = build_content_version_query(["069A"], "'PDF'")
+        assert "FileType IN ('PDF')" in soql
+
+    def test_modified_since_filter(self):
+        soql = build_content_version_query(["069A"], modified_since="2024-01-01T00:00:00Z")
+        assert "SystemModstamp > 2024-01-01T00:00:00Z" in soql
+        assert "modstamp" not in build_content_version_query(["069A"]).lower()
+
+
+class TestClassifyResult:
+    @pytest.mark.parametrize("result,expected", [
+        ("Saved file to x", "success"),
+        ("Skipped", "skipped"),
+        ("Couldn't download x. Status: 404", "failed"),
+        (None, "failed"),
+    ])
+    def test_classification(self, result, expected):
+        assert classify_result(result) == expected
+
+
+class FakeAsyncContent:
+    def __init__(self, data):
+        self.data = data
+
+    async def iter_chunked(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+
+class FakeAsyncResponse:
+    def __init__(self, data, status=200, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.content = FakeAsyncContent(data)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeAsyncHttpSession:
+    def __init__(self, files, throttle_once=()):
+        self.files = files
+        self.throttle_once = set(throttle_once)
+        self.urls = []
+
+    def get(self, url, headers=None):
+        self.urls.append(url)
+        if headers["Authorization"] != "OAuth SESSION":
+            return FakeAsyncResponse(b"", status=401)
+        path = url.split("salesforce.com", 1)[1]
+        if path in self.throttle_once:
+            self.throttle_once.discard(path)
+            return FakeAsyncResponse(b"", status=429, headers={"Retry-After": "0"})
+        if path not in self.files:
+            return FakeAsyncResponse(b"", status=404)
+        return FakeAsyncResponse(self.files[path])
+
+
+class TestFetchFilesAsync:
+    def test_downloads_and_counts_like_thread_engine(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(5)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(5)]
+        versions.append({"Id": "068X", "ContentDocumentId": "069X", "Title": "Missing",
+                         "FileExtension": "txt", "VersionData": "/data/missing"})
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        (tmp_path / "0690-Doc0.txt").write_bytes(files["/data/0"])
+        http = FakeAsyncHttpSession(files, throttle_once=["/data/3"])
+
+        stats = asyncio.run(fetch_files_async(
+            sf=FakeContentVersionSalesforce(versions), content_document_links=links,
+            folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"),
+            filename_pattern="{0}{1}-{2}.{3}", batch_size=2, concurrency=2, http_session=http,
+        ))
+
+        assert stats["total"] == 6
+        assert (stats["success"], stats["skipped"], stats["failed"]) == (4, 1, 1)
+        for n in range(1, 5):
+            assert (tmp_path / f"069{n}-Doc{n}.txt").read_bytes() == files[f"/data/{n}"]
+        # The throttled download was retried
+        assert sum(url.endswith("/data/3") for url in http.urls) == 2
+        with open(tmp_path / "files.csv", newline="") as f:
+            assert len(list(csv.reader(f, delimiter=",", quotechar="|"))) == 5
+
+    def test_expired_session_is_renewed_and_retried(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(3)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(3)]
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        sf = ExpiringSalesforce(versions)
+
+        stats = asyncio.run(fetch_files_async(
+            sf=sf, content_document_links=links, folder_output_directory=str(tmp_path),
+            results_path=str(tmp_path / "files.csv"), filename_pattern="{0}{1}-{2}.{3}",
+            concurrency=1, http_session=FakeAsyncHttpSession(files),
+        ))
+
+        assert stats["success"] == 3
+        assert sf.renewals == ["EXPIRED"]
+
+    def test_downloads_stay_within_shared_limiter(self, tmp_path):
+        files = {f"/data/{n}": f"file {n}".encode() for n in range(6)}
+        versions = [make_version(n, files[f"/data/{n}"]) for n in range(6)]
+        links = [{"ContentDocumentId": v["ContentDocumentId"], "LinkedEntityId": "001A"} for v in versions]
+        limiter = RecordingLimiter(2)
+
+        stats = asyncio.run(fetch_files_async(
+            sf=FakeContentVersionSalesforce(versions), content_document_links=links,
+            folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"),
+            filename_pattern="{0}{1}-{2}.{3}", concurrency=6, http_session=FakeAsyncHttpSession(files),
+            http_limiter=limiter,
+        ))
+
+        assert stats["success"] == 6
+        assert limiter.acquired == 6
+        assert limiter.peak <= 2
+        assert limiter.in_flight == 0
+
+    def test_unrenewable_session_fails_download(self, tmp_path):
+        versions = [make_version(0, b"file 0")]
+        sf = FakeContentVersionSalesforce(versions)
+        sf.session_id = "EXPIRED"
+
+        stats = asyncio.run(fetch_files_async(
+            sf=sf, content_document_links=[{"ContentDocumentId": "0690", "LinkedEntityId": "001A"}],
+            folder_output_directory=str(tmp_path), results_path=str(tmp_path / "files.csv"),
+            filename_pattern="{0}{1}-{2}.{3}", http_session=FakeAsyncHttpSession({"/data/0": b"file 0"}),
+        ))
+
+        assert stats["failed"] == 1
+
+
+    def test_cancellation_while_waiting_for_metadata_returns(self, tmp_path):
+        class SlowSalesforce(FakeContentVersionSalesforce):
+            def query_all_iter(self, soql):
+                time.sleep(0.5)
+                return iter([])
+
+        links = [{"ContentDocumentId": "069A", "LinkedEntityId": "001A"}]
+
+        async def cancelled_run():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(fetch_files_async(
+                    sf=SlowSalesforce([]), content_document_links=links, folder_output_directory=str(tmp_path),
+                    results_path=str(tmp_path / "files.csv"), http_session=FakeAsyncHttpSession({}),
+                ), 0.1)
+
+        # In a thread, so a hanging run fails the test instead of the whole suite
+        runner = threading.Thread(target=asyncio.run, args=(cancelled_run(),), daemon=True)
+        runner.start()
+        runner.join(timeout=5)
+        assert not runner.is_alive()
+
+
+class TestIsAlreadyDownloaded:
+    def test_missing_file_is_not_downloaded(self, tmp_path):
+        assert not is_already_downloaded(str(tmp_path / "nope"), {"Checksum": "x"})
+
+    def test_manifest_hit_skips_rehash(self, tmp_path, monkeypatch):
+        target = tmp_path / "file.bin"
+        target.write_bytes(b"data")
+        checksum = hashlib.md5(b"data").hexdigest()
+        record = {"Id": "068A", "Checksum": checksum}
+        manifest = DownloadManifest(str(tmp_path / "manifest.sqlite"))
+        manifest.record("068A", str(target), checksum)
+
+        def fail(*a, **kw):
+            raise AssertionError("file should not be rehashed")
+
+        monkeypatch.setattr(download_functions, "file_md5", fail)
+        assert is_already_downloaded(str(target), record, manifest)
+        manifest.close()
+
+    def test_checksum_match_is_recorded_in_manifest(self, tmp_path):
+        target = tmp_path / "file.bin"
+        target.write_bytes(b"data")
+        checksum = hashlib.md5(b"data").hexdigest()
+        manifest = DownloadManifest(str(tmp_path / "manifest.sqlite"))
+
+        assert is_already_downloaded(str(target), {"Id": "068A", "Checksum": checksum}, manifest)
+        assert manifest.lookup("068A")[3] == checksum
+        manifest.close()
+
+
+class TestWatermarks:
+    @pytest.fixture
+    def folder(self, tmp_path):
+        # A folder a previous run downloaded into
+        (tmp_path / MANIFEST_FILE).write_bytes(b"")
+        return tmp_path
+
+    def test_missing_watermark_is_none(self, folder):
+        assert read_watermark(str(folder)) is None
+
+    def test_round_trip_with_overlap(self, folder):
+        run_started = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+        written = write_watermark(str(folder), "Case", run_started)
+        assert written == "2024-05-01T11:50:00Z"
+        assert read_watermark(str(folder)) == written
+
+    def test_watermarks_are_per_object_folder(self, folder):
+        write_watermark(str(folder / "Case"), "Case", datetime(2024, 5, 1, tzinfo=timezone.utc))
+        (folder / "Account").mkdir()
+        assert read_watermark(str(folder / "Account")) is None
+
+    def test_corrupt_watermark_is_ignored(self, folder):
+        (folder / WATERMARK_FILE).write_text("{{{")
+        assert read_watermark(str(folder)) is None
+
+    def test_watermark_without_manifest_is_ignored(self, folder):
+        write_watermark(str(folder), "Case", datetime(2024, 5, 1, tzinfo=timezone.utc))
+        (folder / MANIFEST_FILE).unlink()
+
+        # The files it vouches for are gone: the next run must download everything
+        assert read_watermark(str(folder)) is None
+
+
+class TestMappingWriter:
+    def test_rows_written_in_order_and_flushed_on_close(self, tmp_path):
+        results_path = tmp_path / "files.csv"
+        results_path.write_text("header\n")
+        writer = MappingWriter(str(results_path))
+        for n in range(50):
+            writer.write_rows([[f"068{n}", "a|b"], [f"068{n}", "second"]])
+        writer.close()
+
+        with open(results_path, newline="") as f:
+            rows = list(csv.reader(f, delimiter=",", quotechar="|"))
+        assert rows[0] == ["header"]
+        assert len(rows) == 101
+        assert rows[1] == ["0680", "a|b"]
+        assert rows[-1] == ["06849", "second"]
+
+    def test_concurrent_writers(self, tmp_path):
+        results_path = tmp_path / "files.csv"
+        with MappingWriter(str(results_path)) as writer:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as ex:
+                list(ex.map(lambda n: writer.write_rows([[str(n)]]), range(200)))
+
+        with open(results_path, newline="") as f:
+            assert sorted(int(row[0]) for row in csv.reader(f)) == list(range(200))
+
+    def test_close_is_idempotent(self, tmp_path):
+        writer = MappingWriter(str(tmp_path / "files.csv"))
+        writer.close()
+        writer.close()
+
+
+class TestVersionDataUrl:
+    def test_uses_queried_version_data_path(self):
+        assert version_data_url(FakeSalesforce(), {"VersionData": "/data/1"}) == \
+            "https://example.my.salesforce.com/data/1"
+
+    def test_builds_rest_blob_path_from_id(self):
+        sf = FakeSalesforce()
+        sf.sf_version = "60.0"
+        assert version_data_url(sf, {"Id": "068A"}) == (
+            "https://example.my.salesforce.com/services/data/v60.0/sobjects/ContentVersion/068A/VersionData"
+        )
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from manifest import DownloadManifest
+
+
+@pytest.fixture
+def target(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"data")
+    return str(path)
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    m = DownloadManifest(db_path=str(tmp_path / "manifest.sqlite"))
+    yield m
+    m.close()
+
+
+class TestDownloadManifest:
+    def test_unknown_id_is_not_current(self, manifest, target):
+        assert not manifest.is_current("068A", target, "abc")
+
+    def test_recorded_unchanged_file_is_current(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        assert manifest.is_current("068A", target, "abc")
+
+    def test_lookup_returns_recorded_stat(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        path, size, mtime_ns, checksum = manifest.lookup("068A")
+        assert (path, size, checksum) == (target, 4, "abc")
+        assert mtime_ns == os.stat(target).st_mtime_ns
+
+    def test_changed_checksum_is_not_current(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        assert not manifest.is_current("068A", target, "def")
+
+    def test_different_path_is_not_current(self, manifest, target, tmp_path):
+        manifest.record("068A", target, "abc")
+        assert not manifest.is_current("068A", str(tmp_path / "other.bin"), "abc")
+
+    def test_modified_file_is_not_current(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        with open(target, "ab") as f:
+            f.write(b"more")
+        assert not manifest.is_current("068A", target, "abc")
+
+    def test_touched_file_is_not_current(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        stat = os.stat(target)
+        os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert not manifest.is_current("068A", target, "abc")
+
+    def test_deleted_file_is_not_current(self, manifest, target):
+        manifest.record("068A", target, "abc")
+        os.remove(target)
+        assert not manifest.is_current("068A", target, "abc")
+
+    def test_verify_mode_never_trusts_entries(self, tmp_path, target):
+        m = DownloadManifest(db_path=str(tmp_path / "manifest.sqlite"), verify=True)
+        m.record("068A", target, "abc")
+        assert not m.is_current("068A", target, "abc")
+        m.close()
+
+    def test_entries_persist_across_instances(self, tmp_path, target):
+        db_path = str(tmp_path / "manifest.sqlite")
+        first = DownloadManifest(db_path=db_path)
+        first.record("068A", target, "abc")
+        first.close()
+
+        second = DownloadManifest(db_path=db_path)
+        assert second.is_current("068A", target, "abc")
+        second.close()
@@ -0,0 +1,127 @@
+import json
+from email import message_from_bytes
+from email.policy import HTTP
+
+import pytest
+
+from multipart_upload import MultipartBody, MultipartUploadError, upload_content_version
+
+
+def parse_multipart(content_type, body):
+    message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=HTTP)
+    return list(message.iter_parts())
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, status_code=201):
+        self.status_code = status_code
+        self.posts = []
+
+    def post(self, url, data=None, headers=None):
+        body = b''
+        while True:
+            chunk = data.read(8192)
+            if not chunk:
+                break
+            body += chunk
+        self.posts.append({'url': url, 'headers': headers, 'length': len(data), 'body': body})
+        if self.status_code >= 300:
+            return FakeResponse(self.status_code, [{'errorCode': 'STORAGE_LIMIT_EXCEEDED'}])
+        return FakeResponse(self.status_code, {'id': '068T1', 'success': True, 'errors': []})
+
+
+class FakeSalesforce:
+    base_url = 'https://example.my.salesforce.com/services/data/v59.0/'
+    session_id = 'SESSION'
+
+    def __init__(self, session):
+        self.session = session
+
+
+class TestMultipartBody:
+    def test_parts_round_trip(self, tmp_path):
+        path = tmp_path / 'report.pdf'
+        content = bytes(range(256)) * 100
+        path.write_bytes(content)
+
+        with MultipartBody({'Title': 'Report', 'SI_Old_Id__c': '068S1'}, str(path)) as body:
+            data = body.read()
+            assert len(data) == len(body)
+            entity, version_data = parse_multipart(body.content_type, data)
+
+        assert entity.get_param('name', header='content-disposition') == 'entity_content'
+        assert json.loads(entity.get_content()) == {'Title': 'Report', 'SI_Old_Id__c': '068S1'}
+        assert version_data.get_param('name', header='content-disposition') == 'VersionData'
+        assert version_data.get_filename() == 'report.pdf'
+        assert version_data.get_content() == content
+
+    def test_small_reads_span_parts(self, tmp_path):
+        path = tmp_path / 'a.txt'
+        path.write_bytes(b'x' * 1000)
+
+        with MultipartBody({}, str(path), boundary='B') as body:
+            whole = MultipartBody({}, str(path), boundary='B').read()
+            chunks = list(iter(lambda: body.read(7), b''))
+
+        assert all(len(chunk) == 7 for chunk in chunks[:-1])
+        assert b''.join(chunks) == whole
+
+
+class TestUploadContentVersion:
+    def test_posts_streamed_body(self, tmp_path):
+        path = tmp_path / 'big.bin'
+        path.write_bytes(b'\0' * 50000)
+        session = FakeSession()
+
+        result = upload_content_version(FakeSalesforce(session), {'Title': 'Big'}, str(path))
+
+        assert result['id'] == '068T1'
+        post = session.posts[0]
+        assert post['url'] == FakeSalesforce.base_url + 'sobjects/ContentVersion/'
+        assert post['headers']['Authorization'] == 'Bearer SESSION'
+        assert post['headers']['Content-Type'].startswith('multipart/form-data; boundary=')
+        assert post['length'] == len(post['body'])
+        assert parse_multipart(post['headers']['Content-Type'], post['body'])[1].get_content() == b'\0' * 50000
+
+    def test_expired_session_is_renewed_and_file_resent(self, tmp_path):
+        class ExpiringSession(FakeSession):
+            def post(self, url, data=None, headers=None):
+                if headers['Authorization'] == 'Bearer EXPIRED':
+                    self.posts.append({'headers': headers})
+                    return FakeResponse(401, [{'errorCode': 'INVALID_SESSION_ID'}])
+                return super().post(url, data=data, headers=headers)
+
+        class RenewingSalesforce(FakeSalesforce):
+            session_id = 'EXPIRED'
+
+            def renew_session(self, stale_session_id):
+                self.session_id = 'SESSION'
+                return self.session_id
+
+        path = tmp_path / 'big.bin'
+        path.write_bytes(b'\1' * 5000)
+        session = ExpiringSession()
+
+        result = upload_content_version(RenewingSalesforce(session), {'Title': 'Big'}, str(path))
+
+        assert result['id'] == '068T1'
+        assert [post['headers']['Authorization'] for post in session.posts] == ['Bearer EXPIRED', 'Bearer SESSION']
+        assert parse_multipart(session.posts[1]['headers']['Content-Type'], session.posts[1]['body'])[1].get_content() \
+            == b'\1' * 5000
+
+    def test_error_response_raises(self, tmp_path):
+        path = tmp_path / 'big.bin'
+        path.write_bytes(b'data')
+
+        with pytest.raises(MultipartUploadError, match='STORAGE_LIMIT_EXCEEDED'):
+            upload_content_version(FakeSalesforce(FakeSession(status_code=400)), {'Title': 'Big'}, str(path))
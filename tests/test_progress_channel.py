@@ -0,0 +1,141 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+
+import pytest
+
+import progress_channel
+from progress_channel import (PROGRESS_ENV, PROGRESS_PREFIX, WorkerPool, emit_progress, parse_progress,
+                              progress_enabled, set_progress_handler, stream_process)
+
+
+def run_child(code, **kwargs):
+    return asyncio.run(stream_process([sys.executable, "-c", code], **kwargs))
+
+
+@pytest.fixture
+def captured_stdout(monkeypatch):
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "__stdout__", out)
+    monkeypatch.setattr(progress_channel, "_last_emit", 0.0)
+    return out
+
+
+class TestEmitProgress:
+    def test_noop_without_orchestrator(self, monkeypatch, captured_stdout):
+        monkeypatch.delenv(PROGRESS_ENV, raising=False)
+        emit_progress(1, 2, force=True)
+        assert captured_stdout.getvalue() == ""
+
+    def test_throttled_unless_forced(self, monkeypatch, captured_stdout):
+        monkeypatch.setenv(PROGRESS_ENV, "1")
+
+        emit_progress(1, 10)
+        emit_progress(2, 10)
+        emit_progress(10, 10, force=True)
+
+        lines = captured_stdout.getvalue().splitlines()
+        assert [parse_progress(line) for line in lines] == [{"done": 1, "total": 10}, {"done": 10, "total": 10}]
+
+
+class TestParseProgress:
+    def test_other_lines_are_not_progress(self):
+        assert parse_progress("2024-01-01 INFO Uploaded file") is None
+        assert parse_progress(PROGRESS_PREFIX + "{broken") is None
+
+
+class TestStreamProcess:
+    def test_lines_and_progress_are_dispatched(self):
+        code = (
+            "import sys\n"
+            "from progress_channel import emit_progress\n"
+            "print('first', flush=True)\n"
+            "emit_progress(1, 2, force=True)\n"
+            "print('oops', file=sys.stderr)\n"
+            "emit_progress(2, 2, force=True)\n"
+            "sys.exit(3)\n"
+        )
+        stdout, stderr, updates = [], [], []
+
+        returncode, stdout_tail, stderr_tail = run_child(
+            code, on_stdout=stdout.append, on_stderr=stderr.append, on_progress=updates.append)
+
+        assert returncode == 3
+        assert stdout == stdout_tail == ["first"]
+        assert stderr == stderr_tail == ["oops"]
+        assert updates == [{"done": 1, "total": 2}, {"done": 2, "total": 2}]
+
+    def test_only_tail_is_kept(self):
+        returncode, stdout_tail, _ = run_child("for i in range(1000): print(i)", tail_lines=3)
+        assert returncode == 0
+        assert stdout_tail == ["997", "998", "999"]
+
+    def test_overlong_line_does_not_stop_streaming(self, monkeypatch):
+        monkeypatch.setattr(progress_channel, "LINE_LIMIT", 1024)
+        lines = []
+
+        returncode, _, _ = run_child("print('x' * 5000); print('after')", on_stdout=lines.append)
+
+        assert returncode == 0
+        assert lines[-1] == "after"
+        assert any("truncated" in line for line in lines)
+
+
+class TestProgressHandler:
+    def test_handler_replaces_stdout_for_its_thread(self, monkeypatch, captured_stdout):
+        monkeypatch.setenv(PROGRESS_ENV, "1")
+        updates = []
+        set_progress_handler(lambda done, total: updates.append((done, total)))
+        try:
+            emit_progress(1, 4)
+            emit_progress(2, 4)
+            emit_progress(4, 4, force=True)
+        finally:
+            set_progress_handler(None)
+
+        assert updates == [(1, 4), (4, 4)]
+        assert captured_stdout.getvalue() == ""
+
+    def test_handler_is_per_thread(self, monkeypatch):
+        monkeypatch.delenv(PROGRESS_ENV, raising=False)
+        set_progress_handler(lambda done, total: None)
+        try:
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(progress_enabled()))
+            thread.start()
+            thread.join()
+            assert progress_enabled() is True
+            assert seen == [False]
+        finally:
+            set_progress_handler(None)
+
+
+def noisy_worker_task(total):
+    print("Found files")
+    emit_progress(1, total, force=True)
+    # Queue puts are flushed by a background thread; let this one reach the parent
+    time.sleep(0.2)
+    return progress_enabled()
+
+
+class TestWorkerPool:
+    def test_progress_comes_back_and_prints_are_dropped(self, capfd):
+        updates = []
+        pool = WorkerPool(max_workers=1)
+        try:
+            # Progress is enabled in the worker, so it doesn't draw its own bar
+            assert asyncio.run(pool.run(lambda done, total: updates.append((done, total)), noisy_worker_task, 2))
+        finally:
+            pool.shutdown()
+
+        assert updates == [(1, 2)]
+        assert "Found files" not in capfd.readouterr().out
+
+    def test_runs_initializer_and_without_callback(self):
+        pool = WorkerPool(max_workers=1, initializer=time.sleep, initargs=(0,))
+        try:
+            assert asyncio.run(pool.run(None, noisy_worker_task, 2))
+        finally:
+            pool.shutdown()
@@ -1,10 +1,12 @@
 import json
 import os
+import subprocess
+import sys
 import threading
 
 import pytest
 
-from reporting import DeployReporter
+from reporting import DeployReporter, merge_summaries
 
 
 @pytest.fixture
@@ -104,3 +106,103 @@ class TestDeployReporter:
             t.join()
 
         assert rep.get_summary()["Account"]["Success"] == n_threads * per_thread
+
+    def test_buffered_log_waits_for_threshold(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        rep = DeployReporter(json_path=str(json_path), flush_every=3)
+
+        rep.log("Account", "Success")
+        rep.log("Account", "Success")
+        assert not json_path.exists()
+
+        rep.log("Account", "Failed")
+        assert json.loads(json_path.read_text()) == {"Account": {"Success": 2, "Failed": 1}}
+
+    def test_buffered_log_flushes_after_interval(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        rep = DeployReporter(json_path=str(json_path), flush_every=1000, flush_interval=0)
+
+        rep.log("Account", "Success")
+
+        assert json.loads(json_path.read_text()) == {"Account": {"Success": 1}}
+
+    def test_flush_writes_pending_counts(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        rep = DeployReporter(json_path=str(json_path), flush_every=1000, flush_interval=60)
+        rep.log("Case", "Skipped")
+
+        rep.flush()
+
+        assert json.loads(json_path.read_text()) == {"Case": {"Skipped": 1}}
+        assert list(tmp_path.iterdir()) == [json_path]
+
+    def test_flush_without_pending_counts_does_not_write(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        rep = DeployReporter(json_path=str(json_path), flush_every=1000)
+        rep.flush()
+        assert not json_path.exists()
+
+    def test_buffered_reporter_flushes_at_exit(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        script = (
+            "import sys; sys.path.insert(0, %r)\n"
+            "from reporting import DeployReporter, merge_summaries\n"
+            "rep = DeployReporter(json_path=%r, flush_every=1000, flush_interval=60)\n"
+            "rep.log('Account', 'Success')\n"
+        ) % (os.path.dirname(os.path.dirname(os.path.abspath(__file__))), str(json_path))
+
+        subprocess.run([sys.executable, "-c", script], check=True)
+
+        assert json.loads(json_path.read_text()) == {"Account": {"Success": 1}}
+
+    def test_concurrent_buffered_log_calls_lose_nothing(self, tmp_path):
+        json_path = tmp_path / "deploy_summary.json"
+        rep = DeployReporter(json_path=str(json_path), flush_every=7)
+
+        def worker():
+            for _ in range(50):
+                rep.log("Account", "Success")
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        rep.flush()
+
+        assert json.loads(json_path.read_text()) == {"Account": {"Success": 1000}}
+
+    def test_set_path_flushes_then_switches_file(self, tmp_path):
+        first = tmp_path / "deploy_summary.json"
+        second = tmp_path / "Case.json"
+        rep = DeployReporter(json_path=str(first), flush_every=1000)
+        rep.log("Account", "Success")
+
+        rep.set_path(str(second))
+        rep.log("Case", "Failed")
+        rep.flush()
+
+        assert json.loads(first.read_text()) == {"Account": {"Success": 1}}
+        assert json.loads(second.read_text()) == {"Case": {"Failed": 1}}
+
+
+class TestMergeSummaries:
+    def test_counts_are_added_up(self, tmp_path):
+        (tmp_path / "a.json").write_text(json.dumps({"Account": {"Success": 2, "Failed": 1}}))
+        (tmp_path / "b.json").write_text(json.dumps({"Account": {"Success": 3}, "Case": {"Skipped": 4}}))
+        out = tmp_path / "deploy_summary.json"
+
+        merged = merge_summaries([str(tmp_path / "a.json"), str(tmp_path / "b.json")], str(out))
+
+        assert merged == {"Account": {"Success": 5, "Failed": 1}, "Case": {"Skipped": 4}}
+        assert json.loads(out.read_text()) == merged
+
+    def test_missing_or_corrupt_parts_are_skipped(self, tmp_path):
+        (tmp_path / "bad.json").write_text("{{{")
+        (tmp_path / "good.json").write_text(json.dumps({"Case": {"Success": 1}}))
+
+        merged = merge_summaries(
+            [str(tmp_path / "bad.json"), str(tmp_path / "missing.json"), str(tmp_path / "good.json")],
+            str(tmp_path / "deploy_summary.json"))
+
+        assert merged == {"Case": {"Success": 1}}
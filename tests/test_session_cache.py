@@ -0,0 +1,139 @@
+import os
+import stat
+
+import pytest
+import simple_salesforce.api
+
+import session_cache
+from session_cache import CachedSalesforce, read_session, renew_session, write_session
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    """
+    Replaces the Salesforce login with a fake handing out SESSION1, SESSION2, ...
+    """
+    calls = []
+
+    def fake_login(**kwargs):
+        calls.append(kwargs)
+        return f"SESSION{len(calls)}", "example.my.salesforce.com"
+
+    monkeypatch.setattr(simple_salesforce.api, "SalesforceLogin", fake_login)
+    monkeypatch.setattr(session_cache, "SalesforceLogin", fake_login)
+    return calls
+
+
+def connect(cache_path):
+    return CachedSalesforce(username="user@example.com", password="pw", security_token="tok",
+                            domain="login", cache_path=str(cache_path))
+
+
+class TestSessionFile:
+    def test_round_trip_keeps_other_entries(self, tmp_path):
+        path = str(tmp_path / "sessions.json")
+        write_session(path, "a@example.com", "login", "SA", "a.my.salesforce.com")
+        write_session(path, "b@example.com", "test", "SB", "b.my.salesforce.com")
+
+        assert read_session(path, "a@example.com", "login")["session_id"] == "SA"
+        assert read_session(path, "b@example.com", "test")["instance"] == "b.my.salesforce.com"
+        assert read_session(path, "a@example.com", "test") is None
+
+    def test_only_owner_can_read(self, tmp_path):
+        path = str(tmp_path / "sessions.json")
+        write_session(path, "a@example.com", "login", "SA", "a.my.salesforce.com")
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    def test_unreadable_cache_is_ignored(self, tmp_path):
+        path = tmp_path / "sessions.json"
+        path.write_text("{not json")
+
+        assert read_session(str(path), "a@example.com", "login") is None
+
+
+class TestCachedSalesforce:
+    def test_logs_in_and_caches_session(self, tmp_path, logins):
+        sf = connect(tmp_path / "sessions.json")
+
+        assert sf.session_id == "SESSION1"
+        assert len(logins) == 1
+        assert read_session(str(tmp_path / "sessions.json"), "user@example.com", "login")["session_id"] == "SESSION1"
+
+    def test_cached_session_skips_login(self, tmp_path, logins):
+        connect(tmp_path / "sessions.json")
+        sf = connect(tmp_path / "sessions.json")
+
+        assert sf.session_id == "SESSION1"
+        assert sf.base_url.startswith("https://example.my.salesforce.com/")
+        assert len(logins) == 1
+
+    def test_renew_logs_in_once_per_stale_session(self, tmp_path, logins):
+        connect(tmp_path / "sessions.json")
+        sf = connect(tmp_path / "sessions.json")
+
+        assert sf.renew_session("SESSION1") == "SESSION2"
+        assert sf.renew_session("SESSION1") == "SESSION2"
+        assert sf.headers["Authorization"] == "Bearer SESSION2"
+        assert len(logins) == 2
+        assert logins[1]["username"] == "user@example.com"
+        assert read_session(str(tmp_path / "sessions.json"), "user@example.com", "login")["session_id"] == "SESSION2"
+
+    def test_renew_uses_session_cached_by_another_process(self, tmp_path, logins):
+        first = connect(tmp_path / "sessions.json")
+        second = connect(tmp_path / "sessions.json")
+        first.renew_session("SESSION1")
+
+        assert second.renew_session("SESSION1") == "SESSION2"
+        assert len(logins) == 2
+
+    def test_query_with_expired_cached_session_logs_in_again(self, tmp_path, logins):
+        class FakeResponse:
+            def __init__(self, status_code, payload):
+                self.status_code = status_code
+                self.payload = payload
+                self.headers = {}
+
+            def json(self, **kwargs):
+                return self.payload
+
+        class ExpiringSession:
+            def __init__(self):
+                self.proxies = {}
+                self.auth_headers = []
+
+            def request(self, method, url, headers=None, **kwargs):
+                self.auth_headers.append(headers["Authorization"])
+                if headers["Authorization"] == "Bearer EXPIRED":
+                    return FakeResponse(401, [{"errorCode": "INVALID_SESSION_ID", "message": "expired"}])
+                return FakeResponse(200, {"totalSize": 0, "done": True, "records": []})
+
+        write_session(str(tmp_path / "sessions.json"), "user@example.com", "login", "EXPIRED",
+                      "example.my.salesforce.com")
+        http = ExpiringSession()
+        sf = CachedSalesforce(username="user@example.com", password="pw", security_token="tok",
+                              cache_path=str(tmp_path / "sessions.json"), session=http)
+
+        assert sf.query("SELECT Id FROM User")["records"] == []
+        assert http.auth_headers == ["Bearer EXPIRED", "Bearer SESSION1"]
+        assert len(logins) == 1
+
+    def test_empty_cache_path_disables_cache(self, tmp_path, logins):
+        CachedSalesforce(username="user@example.com", password="pw", security_token="tok", cache_path="")
+        CachedSalesforce(username="user@example.com", password="pw", security_token="tok", cache_path="")
+
+        assert len(logins) == 2
+
+
+class TestRenewSession:
+    def test_client_without_renew_is_not_renewed(self):
+        class PlainClient:
+            session_id = "S"
+
+        assert not renew_session(PlainClient(), "S")
+
+    def test_renewing_client(self, tmp_path, logins):
+        sf = connect(tmp_path / "sessions.json")
+
+        assert renew_session(sf, "SESSION1")
+        assert sf.session_id == "SESSION2"